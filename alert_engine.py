@@ -0,0 +1,178 @@
+# alert_engine.py
+# Keeps the dashboard's alert set up to date from events instead of rescanning.
+#
+#   active_alerts    the current alerts, one row per (tool, kind)
+#   alert_deadlines  future moments an alert becomes due: the day after calibration_due
+#                    ('overdue') and checkout + 8h ('long_checkout')
+#   alert_history    every raise/clear transition with its timestamp, for reporting
+#
+# Triggers on tools and transactions keep deadlines and active alerts consistent with
+# every write (routes, bot, seed scripts). tick() promotes deadlines that have passed;
+# it is an index range scan on fire_at, so calling it on every poll is cheap, and it is
+# also what rolls calibrations over to 'overdue' at midnight.
+# Times are SQLite UTC ('now'), like the transaction timestamps.
+import sqlite3
+
+LONG_CHECKOUT_HOURS = 8
+
+# Overdue rules for one tool row (NEW): same predicate the old rescan used
+_OVERDUE_NOW = "NEW.status != 'Under Maintenance' AND date(NEW.calibration_due) < date('now')"
+_OVERDUE_LATER = "NEW.status != 'Under Maintenance' AND date(NEW.calibration_due) >= date('now')"
+
+_TOOL_ALERT_BODY = f'''
+        DELETE FROM alert_deadlines WHERE tool_id = NEW.id AND kind = 'overdue';
+        DELETE FROM active_alerts WHERE tool_id = NEW.id AND kind = 'overdue' AND NOT ({_OVERDUE_NOW});
+        INSERT OR IGNORE INTO active_alerts (tool_id, kind, detail)
+            SELECT NEW.id, 'overdue', NEW.calibration_due WHERE {_OVERDUE_NOW};
+        INSERT OR REPLACE INTO alert_deadlines (tool_id, kind, fire_at, detail)
+            SELECT NEW.id, 'overdue', date(NEW.calibration_due, '+1 day'), NEW.calibration_due
+            WHERE {_OVERDUE_LATER};
+        DELETE FROM active_alerts WHERE tool_id = NEW.id AND kind = 'long_checkout' AND NEW.status != 'In Use';
+        DELETE FROM alert_deadlines WHERE tool_id = NEW.id AND kind = 'long_checkout' AND NEW.status != 'In Use';
+'''
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS active_alerts (
+        tool_id TEXT NOT NULL,
+        kind TEXT NOT NULL,              -- 'overdue' | 'long_checkout'
+        raised_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        detail TEXT,                     -- due date / checkout timestamp
+        PRIMARY KEY (tool_id, kind)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS alert_deadlines (
+        tool_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        fire_at TEXT NOT NULL,
+        detail TEXT,
+        PRIMARY KEY (tool_id, kind)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_alert_deadlines_fire_at ON alert_deadlines (fire_at);
+
+    CREATE TABLE IF NOT EXISTS alert_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tool_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        event TEXT NOT NULL,             -- 'raised' | 'cleared'
+        at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        detail TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_alert_history_at ON alert_history (at);
+
+    -- Transitions are recorded by the alert table itself, whoever changes it
+    CREATE TRIGGER IF NOT EXISTS alert_raised AFTER INSERT ON active_alerts
+    BEGIN
+        INSERT INTO alert_history (tool_id, kind, event, detail) VALUES (NEW.tool_id, NEW.kind, 'raised', NEW.detail);
+    END;
+    CREATE TRIGGER IF NOT EXISTS alert_cleared AFTER DELETE ON active_alerts
+    BEGIN
+        INSERT INTO alert_history (tool_id, kind, event, detail) VALUES (OLD.tool_id, OLD.kind, 'cleared', OLD.detail);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alerts_tools_insert AFTER INSERT ON tools
+    BEGIN {_TOOL_ALERT_BODY} END;
+    CREATE TRIGGER IF NOT EXISTS alerts_tools_update AFTER UPDATE OF calibration_due, status ON tools
+    BEGIN {_TOOL_ALERT_BODY} END;
+    CREATE TRIGGER IF NOT EXISTS alerts_tools_delete AFTER DELETE ON tools
+    BEGIN
+        DELETE FROM active_alerts WHERE tool_id = OLD.id;
+        DELETE FROM alert_deadlines WHERE tool_id = OLD.id;
+    END;
+
+    -- A checkout (re)starts the long-hold clock; a checkin stops it
+    CREATE TRIGGER IF NOT EXISTS alerts_checkout AFTER INSERT ON transactions
+    WHEN NEW.type = 'checkout'
+    BEGIN
+        DELETE FROM active_alerts WHERE tool_id = NEW.tool_id AND kind = 'long_checkout';
+        INSERT OR REPLACE INTO alert_deadlines (tool_id, kind, fire_at, detail)
+        VALUES (NEW.tool_id, 'long_checkout', datetime(NEW.timestamp, '+{LONG_CHECKOUT_HOURS} hours'), NEW.timestamp);
+    END;
+    CREATE TRIGGER IF NOT EXISTS alerts_checkin AFTER INSERT ON transactions
+    WHEN NEW.type = 'checkin'
+    BEGIN
+        DELETE FROM active_alerts WHERE tool_id = NEW.tool_id AND kind = 'long_checkout';
+        DELETE FROM alert_deadlines WHERE tool_id = NEW.tool_id AND kind = 'long_checkout';
+    END;
+'''
+
+def get_db_connection():
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+def tick(conn):
+    """Raises every alert whose deadline has passed. Returns how many were raised; caller commits."""
+    due = conn.execute("SELECT COUNT(*) FROM alert_deadlines WHERE fire_at <= datetime('now')").fetchone()[0]
+    if due:
+        conn.execute('''
+            INSERT OR IGNORE INTO active_alerts (tool_id, kind, detail)
+            SELECT tool_id, kind, detail FROM alert_deadlines WHERE fire_at <= datetime('now')
+        ''')
+        conn.execute("DELETE FROM alert_deadlines WHERE fire_at <= datetime('now')")
+    return due
+
+def rebuild(conn):
+    """Recomputes deadlines and the alert set from scratch (startup, or data loaded without triggers).
+
+    Only differences touch active_alerts, so history shows real transitions, not a reload.
+    """
+    conn.executescript(f'''
+        DELETE FROM alert_deadlines;
+        INSERT INTO alert_deadlines (tool_id, kind, fire_at, detail)
+            SELECT id, 'overdue', date(calibration_due, '+1 day'), calibration_due FROM tools
+            WHERE status != 'Under Maintenance' AND calibration_due IS NOT NULL;
+        INSERT INTO alert_deadlines (tool_id, kind, fire_at, detail)
+            SELECT t.id, 'long_checkout', datetime(tr.timestamp, '+{LONG_CHECKOUT_HOURS} hours'), tr.timestamp
+            FROM tools t JOIN transactions tr ON tr.tool_id = t.id
+            WHERE t.status = 'In Use'
+              AND tr.id = (SELECT MAX(id) FROM transactions WHERE tool_id = t.id AND type = 'checkout');
+
+        DELETE FROM active_alerts WHERE (tool_id, kind) NOT IN (
+            SELECT tool_id, kind FROM alert_deadlines WHERE fire_at <= datetime('now'));
+    ''')
+    tick(conn)
+
+def init_alert_engine(db_path='database.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+        rebuild(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+# ==========================================
+#               READS
+# ==========================================
+
+def current_alerts(conn):
+    """Same shape as the old /api/alerts rescan; cost is proportional to the number of alerts."""
+    tick(conn)
+    overdue = conn.execute('''
+        SELECT t.* FROM active_alerts a JOIN tools t ON t.id = a.tool_id
+        WHERE a.kind = 'overdue'
+    ''').fetchall()
+    long_checkout = conn.execute('''
+        SELECT t.*, a.detail AS timestamp FROM active_alerts a JOIN tools t ON t.id = a.tool_id
+        WHERE a.kind = 'long_checkout'
+    ''').fetchall()
+    return {
+        'overdue': [dict(row) for row in overdue],
+        'long_checkout': [dict(row) for row in long_checkout],
+    }
+
+def alert_history(conn, since=None, tool_id=None, limit=200):
+    query = 'SELECT tool_id, kind, event, at, detail FROM alert_history WHERE 1=1'
+    params = []
+    if since:
+        query += ' AND at >= ?'
+        params.append(since)
+    if tool_id:
+        query += ' AND tool_id = ?'
+        params.append(tool_id)
+    query += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    return [dict(row) for row in conn.execute(query, params).fetchall()]
@@ -1,21 +1,47 @@
 # app.py
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response
 import sqlite3
 import json
+import os
+import hmac
 import uuid
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import requests
+import feature_store
+import forecast_jobs
+import calibration_scheduler
+import calibration_calendar
+import alert_engine
+import deadline_scheduler
+import cabinet_registry
+import cabinet_allowlist
 
 # --- TELEGRAM INTEGRATION ---
 try:
     import telegram_manager
+    import bot_listener
 except ImportError:
     telegram_manager = None
+    bot_listener = None
     print("⚠️ Warning: telegram_manager.py not found. Telegram alerts will be disabled.")
 
+# Webhook mode for the bot (see bot_listener.py); the route is off unless this is set
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET')
+
+# Signs the badge allowlist cabinets cache (cabinet_auth.py); the route is off unless set
+CABINET_ALLOWLIST_SECRET = os.environ.get('CABINET_ALLOWLIST_SECRET')
+
 app = Flask(__name__)
 
+# --- MODEL FEATURE STORE & FORECAST VERSIONING (created/backfilled once at startup) ---
+feature_store.init_feature_store()
+forecast_jobs.init_forecast_jobs()
+calibration_calendar.init_calendar()
+alert_engine.init_alert_engine()
+cabinet_registry.init_cabinet_registry()
+cabinet_allowlist.init_allowlist()
+
 # --- GLOBAL STATE (NFC BRIDGE) ---
 latest_nfc_scan = {}
 
@@ -218,6 +244,7 @@ def create_tool():
             INSERT INTO tools (id, model, name, status, calibration_due) 
             VALUES (?, ?, ?, ?, ?)
         ''', (data['id'], model_value, data['name'], data.get('status', 'Available'), data['calibration_due']))
+        feature_store.register_tool(conn, data['id'], model_value)
         
         # 4. AUDIT LOG
         log_audit_event('USR-001', 'TOOL_CREATED', json.dumps({'tool_id': data['id']}), conn=conn)
@@ -268,6 +295,7 @@ def batch_create_tools():
                 INSERT INTO tools (id, model, name, status, calibration_due, nfc_id) 
                 VALUES (?, ?, ?, 'Available', ?, ?)
             ''', (tool_id, model, base_name, cal_due, nfc_id))
+            feature_store.register_tool(conn, tool_id, model)
             created_count += 1
 
         log_audit_event('USR-001', 'BATCH_TOOL_CREATE', json.dumps({'count': created_count, 'model': model}), conn=conn)
@@ -284,8 +312,12 @@ def batch_create_tools():
 def update_tool(tool_id):
     data = request.get_json()
     conn = get_db_connection()
+    old = conn.execute('SELECT calibration_due FROM tools WHERE id = ?', (tool_id,)).fetchone()
     conn.execute('UPDATE tools SET name = ?, calibration_due = ? WHERE id = ?',
                  (data['name'], data['calibration_due'], tool_id))
+    # Pushing the due date out means the tool was just calibrated ("Mark Calibrated")
+    if old and old['calibration_due'] and data['calibration_due'] > old['calibration_due']:
+        feature_store.record_calibration(conn, tool_id)
     log_audit_event('USR-001', 'TOOL_UPDATED', json.dumps({'tool_id': tool_id}), conn=conn)
     conn.commit()
     conn.close()
@@ -311,6 +343,7 @@ def update_tool_status(tool_id):
 def delete_tool(tool_id):
     conn = get_db_connection()
     conn.execute('DELETE FROM tools WHERE id = ?', (tool_id,))
+    feature_store.remove_tool(conn, tool_id)
     log_audit_event('USR-001', 'TOOL_DELETED', json.dumps({'tool_id': tool_id}), conn=conn)
     conn.commit()
     conn.close()
@@ -430,7 +463,52 @@ def get_transactions():
     finally:
         conn.close()
 
+def resolve_user_id(conn, raw_user_id):
+    """Badge UID -> user ID (e.g. "USR-001"); anything else is assumed to be a user ID already."""
+    user_check = conn.execute('SELECT id FROM users WHERE nfc_id = ?', (raw_user_id,)).fetchone()
+    return user_check['id'] if user_check else raw_user_id
+
 # --- FIXED CHECKOUT LOGIC ---
+def perform_checkout(conn, raw_user_id, raw_tool_id, at=None, tool=None, user_id=None):
+    """Checks a tool out to a user (IDs or NFC UIDs). Caller commits.
+
+    at: UTC 'YYYY-MM-DD HH:MM:SS' when it happened (replayed cabinet events); default now.
+    tool / user_id: already-resolved tools row / user ID, to skip the lookups (reconcile).
+    Returns (response dict, HTTP status, tx_id or None).
+    """
+    # --- 1. TRANSLATE USER NFC -> REAL USER ID ---
+    # We check if the incoming ID is a Card ID. If so, swap it for the User ID.
+    if user_id is None:
+        user_id = resolve_user_id(conn, raw_user_id)
+    final_user_id = user_id
+
+    # --- 2. TRANSLATE TOOL NFC -> REAL TOOL ID (You already have this) ---
+    if tool is None:
+        tool = conn.execute('SELECT * FROM tools WHERE id = ? OR nfc_id = ?', (raw_tool_id, raw_tool_id)).fetchone()
+
+    if not tool:
+        return {'message': 'Tool not found'}, 404, None
+
+    real_tool_id = tool['id']
+
+    # --- 3. PERFORM CHECKOUT WITH TRANSLATED IDs ---
+    conn.execute('''
+        UPDATE tools 
+        SET status = "In Use", 
+            current_holder = ?,  -- Now using the correct "USR-001"
+            total_checkouts = total_checkouts + 1 
+        WHERE id = ?
+    ''', (final_user_id, real_tool_id))
+
+    # Log Transaction
+    tx_id = conn.execute('INSERT INTO transactions (user_id, tool_id, type, timestamp) VALUES (?, ?, "checkout", COALESCE(?, CURRENT_TIMESTAMP))',
+                         (final_user_id, real_tool_id, at)).lastrowid
+    feature_store.record_checkout(conn, real_tool_id, final_user_id)
+
+    # Log Audit
+    log_audit_event(final_user_id, 'TOOL_CHECKOUT', json.dumps({'tool': tool['name']}), conn=conn)
+    return {'message': 'Checkout successful', 'tool_id': real_tool_id, 'user_id': final_user_id}, 200, tx_id
+
 @app.route('/api/checkout', methods=['POST'])
 def checkout_tool():
     data = request.get_json()
@@ -439,40 +517,12 @@ def checkout_tool():
     
     conn = get_db_connection()
     try:
-        # --- 1. TRANSLATE USER NFC -> REAL USER ID ---
-        # We check if the incoming ID is a Card ID. If so, swap it for the User ID.
-        user_check = conn.execute('SELECT id FROM users WHERE nfc_id = ?', (raw_user_id,)).fetchone()
-        
-        # If we found a match, use the Real ID (e.g., "USR-001"). 
-        # If not, assume it's already a Real ID (fallback).
-        final_user_id = user_check['id'] if user_check else raw_user_id
-
-        # --- 2. TRANSLATE TOOL NFC -> REAL TOOL ID (You already have this) ---
-        tool = conn.execute('SELECT * FROM tools WHERE id = ? OR nfc_id = ?', (raw_tool_id, raw_tool_id)).fetchone()
-        
-        if not tool:
-            return jsonify({'message': 'Tool not found'}), 404
-            
-        real_tool_id = tool['id']
-
-        # --- 3. PERFORM CHECKOUT WITH TRANSLATED IDs ---
-        conn.execute('''
-            UPDATE tools 
-            SET status = "In Use", 
-                current_holder = ?,  -- Now using the correct "USR-001"
-                total_checkouts = total_checkouts + 1 
-            WHERE id = ?
-        ''', (final_user_id, real_tool_id))
-        
-        # Log Transaction
-        conn.execute('INSERT INTO transactions (user_id, tool_id, type) VALUES (?, ?, "checkout")',
-                     (final_user_id, real_tool_id))
-        
-        # Log Audit
-        log_audit_event(final_user_id, 'TOOL_CHECKOUT', json.dumps({'tool': tool['name']}), conn=conn)
-        
+        result, status, tx_id = perform_checkout(conn, raw_user_id, raw_tool_id)
+        if status != 200:
+            return jsonify(result), status
         conn.commit()
-        return jsonify({'message': 'Checkout successful'})
+        deadline_scheduler.register_checkout(result['tool_id'], result['user_id'], tx_id)
+        return jsonify({'message': result['message']})
 
     except Exception as e:
         print(f"Checkout Error: {e}")
@@ -490,6 +540,7 @@ def checkout_project_batch(project_id):
     conn = get_db_connection()
     try:
         results = {'checked_out': [], 'unavailable': []}
+        new_checkouts = []
         for tool_id in tool_ids:
             tool = conn.execute('SELECT * FROM tools WHERE id = ?', (tool_id,)).fetchone()
             
@@ -503,19 +554,101 @@ def checkout_project_batch(project_id):
                     WHERE id = ?
                 ''', (user_id, tool_id))
                 
-                conn.execute('INSERT INTO transactions (user_id, tool_id, type) VALUES (?, ?, "checkout")',
-                             (user_id, tool_id))
+                tx_id = conn.execute('INSERT INTO transactions (user_id, tool_id, type) VALUES (?, ?, "checkout")',
+                                     (user_id, tool_id)).lastrowid
+                feature_store.record_checkout(conn, tool_id, user_id)
                 results['checked_out'].append(tool_id)
+                new_checkouts.append((tool_id, tx_id))
             else:
                 results['unavailable'].append(tool_id)
 
         log_audit_event(user_id, 'BATCH_CHECKOUT', json.dumps({'project': project_id, 'count': len(results['checked_out'])}), conn=conn)
         conn.commit()
+        for tool_id, tx_id in new_checkouts:
+            deadline_scheduler.register_checkout(tool_id, user_id, tx_id)
         return jsonify(results)
     finally:
         conn.close()
 
 # --- FIXED CHECKIN LOGIC (USAGE HOURS) ---
+def perform_checkin(conn, raw_id, report_issue=False, at=None, tool=None):
+    """Returns a tool (ID or NFC UID). Caller commits.
+
+    at: UTC 'YYYY-MM-DD HH:MM:SS' when it happened (replayed cabinet events); default now.
+    tool: already-resolved tools row, to skip the lookup (reconcile).
+    Returns (response dict, HTTP status).
+    """
+    # 1. TRANSLATION LAYER: Lookup by ID or NFC
+    if tool is None:
+        tool = conn.execute('''
+            SELECT * FROM tools 
+            WHERE id = ? OR nfc_id = ?
+        ''', (raw_id, raw_id)).fetchone()
+
+    if not tool:
+        print(f"❌ Check-in Failed: Tool '{raw_id}' not found.")
+        return {'message': 'Tool not found'}, 404
+
+    real_tool_id = tool['id']
+    current_holder = tool['current_holder'] or 'UNKNOWN'
+    
+    # 2. SMART STATUS LOGIC (The Critical Fix)
+    # Priority 1: If user checks 'Report Issue' -> Under Maintenance
+    # Priority 2: If tool was ALREADY broken (via Telegram) -> Keep Under Maintenance
+    # Priority 3: Otherwise -> Available
+    current_status = tool['status']
+    
+    if report_issue:
+        new_status = 'Under Maintenance'
+    elif current_status == 'Under Maintenance':
+        new_status = 'Under Maintenance' # Protect the broken status
+        print(f"⚠️ Note: {real_tool_id} returned but remains Under Maintenance.")
+    else:
+        new_status = 'Available'
+
+    # 3. CALCULATE DURATION
+    # Find the most recent checkout for this tool to calculate usage time
+    last_tx = conn.execute('''
+        SELECT timestamp FROM transactions 
+        WHERE tool_id = ? AND type = 'checkout' 
+        ORDER BY timestamp DESC LIMIT 1
+    ''', (real_tool_id,)).fetchone()
+
+    duration_hours = 0.0
+    if last_tx:
+        try:
+            start_time = datetime.strptime(last_tx['timestamp'], '%Y-%m-%d %H:%M:%S')
+            end_time = datetime.strptime(at, '%Y-%m-%d %H:%M:%S') if at else datetime.now()
+            # Calculate difference in hours
+            duration_hours = max((end_time - start_time).total_seconds() / 3600.0, 0.0)
+        except Exception as e:
+            print(f"Time calc error: {e}")
+
+    # 4. UPDATE DB
+    # Update tool status, clear the holder, and add to the running total of usage hours
+    conn.execute('''
+        UPDATE tools 
+        SET status = ?, 
+            current_holder = NULL, 
+            total_usage_hours = total_usage_hours + ? 
+        WHERE id = ?
+    ''', (new_status, duration_hours, real_tool_id))
+
+    # 5. LOG TRANSACTION
+    # We record the user who HELD it as the one checking it in
+    conn.execute('INSERT INTO transactions (user_id, tool_id, type, timestamp) VALUES (?, ?, "checkin", COALESCE(?, CURRENT_TIMESTAMP))',
+                 (current_holder, real_tool_id, at))
+    feature_store.record_checkin(conn, real_tool_id, duration_hours)
+    
+    # 6. AUDIT LOG
+    log_audit_event(current_holder, 'TOOL_CHECKIN', json.dumps({
+        'tool_id': real_tool_id, 
+        'hours_used': f"{duration_hours:.2f}",
+        'final_status': new_status
+    }), conn=conn)
+    print(f"✅ SUCCESS: Returned {tool['name']} (Status: {new_status})")
+    return {'message': 'Check-in successful', 'status': new_status, 'tool_id': real_tool_id}, 200
+
 @app.route('/api/checkin', methods=['POST'])
 def checkin_tool():
     data = request.get_json()
@@ -524,75 +657,12 @@ def checkin_tool():
     
     conn = get_db_connection()
     try:
-        # 1. TRANSLATION LAYER: Lookup by ID or NFC
-        tool = conn.execute('''
-            SELECT * FROM tools 
-            WHERE id = ? OR nfc_id = ?
-        ''', (raw_id, raw_id)).fetchone()
-
-        if not tool:
-            print(f"❌ Check-in Failed: Tool '{raw_id}' not found.")
-            return jsonify({'message': 'Tool not found'}), 404
-
-        real_tool_id = tool['id']
-        current_holder = tool['current_holder'] or 'UNKNOWN'
-        
-        # 2. SMART STATUS LOGIC (The Critical Fix)
-        # Priority 1: If user checks 'Report Issue' -> Under Maintenance
-        # Priority 2: If tool was ALREADY broken (via Telegram) -> Keep Under Maintenance
-        # Priority 3: Otherwise -> Available
-        current_status = tool['status']
-        
-        if report_issue:
-            new_status = 'Under Maintenance'
-        elif current_status == 'Under Maintenance':
-            new_status = 'Under Maintenance' # Protect the broken status
-            print(f"⚠️ Note: {real_tool_id} returned but remains Under Maintenance.")
-        else:
-            new_status = 'Available'
-
-        # 3. CALCULATE DURATION
-        # Find the most recent checkout for this tool to calculate usage time
-        last_tx = conn.execute('''
-            SELECT timestamp FROM transactions 
-            WHERE tool_id = ? AND type = 'checkout' 
-            ORDER BY timestamp DESC LIMIT 1
-        ''', (real_tool_id,)).fetchone()
-
-        duration_hours = 0.0
-        if last_tx:
-            try:
-                start_time = datetime.strptime(last_tx['timestamp'], '%Y-%m-%d %H:%M:%S')
-                # Calculate difference in hours
-                duration_hours = (datetime.now() - start_time).total_seconds() / 3600.0
-            except Exception as e:
-                print(f"Time calc error: {e}")
-
-        # 4. UPDATE DB
-        # Update tool status, clear the holder, and add to the running total of usage hours
-        conn.execute('''
-            UPDATE tools 
-            SET status = ?, 
-                current_holder = NULL, 
-                total_usage_hours = total_usage_hours + ? 
-            WHERE id = ?
-        ''', (new_status, duration_hours, real_tool_id))
-
-        # 5. LOG TRANSACTION
-        # We record the user who HELD it as the one checking it in
-        conn.execute('INSERT INTO transactions (user_id, tool_id, type) VALUES (?, ?, "checkin")',
-                     (current_holder, real_tool_id))
-        
-        # 6. AUDIT LOG
-        log_audit_event(current_holder, 'TOOL_CHECKIN', json.dumps({
-            'tool_id': real_tool_id, 
-            'hours_used': f"{duration_hours:.2f}",
-            'final_status': new_status
-        }), conn=conn)
-        
+        result, status = perform_checkin(conn, raw_id, report_issue)
+        if status != 200:
+            return jsonify(result), status
         conn.commit()
-        print(f"✅ SUCCESS: Returned {tool['name']} (Status: {new_status})")
-        return jsonify({'message': 'Check-in successful', 'status': new_status})
+        deadline_scheduler.cancel_checkout(result['tool_id'])
+        return jsonify({'message': result['message'], 'status': result['status']})
         
     except Exception as e:
         print(f"❌ CHECKIN ERROR: {e}")
@@ -641,6 +711,7 @@ def report_issue():
             INSERT INTO issue_reports (id, tool_id, reporter_id, defect_type, description, status)
             VALUES (?, ?, ?, ?, ?, 'New')
         ''', (report_id, data['tool_id'], data['reporter_id'], data['defect_type'], data['description']))
+        feature_store.record_failure(conn, data['tool_id'])
 
         log_audit_event(data['reporter_id'], 'ISSUE_REPORTED', json.dumps({'report_id': report_id}), conn=conn)
         
@@ -651,6 +722,7 @@ def report_issue():
             )
 
         conn.commit()
+        deadline_scheduler.cancel_checkout(data['tool_id'])
         return jsonify({'message': 'Issue reported', 'report_id': report_id})
     finally:
         conn.close()
@@ -664,7 +736,10 @@ def update_issue_status(issue_id):
     conn = get_db_connection()
     try:
         # 1. Update the Issue Ticket Status
-        conn.execute('UPDATE issue_reports SET status = ? WHERE id = ?', (new_status, issue_id))
+        if new_status == 'Closed':
+            conn.execute('UPDATE issue_reports SET status = ?, closed_at = CURRENT_TIMESTAMP WHERE id = ?', (new_status, issue_id))
+        else:
+            conn.execute('UPDATE issue_reports SET status = ? WHERE id = ?', (new_status, issue_id))
         
         # 2. If Supervisor said "Return to Available", Fix the Tool
         if make_available and new_status == 'Closed':
@@ -673,6 +748,8 @@ def update_issue_status(issue_id):
             if issue:
                 tool_id = issue['tool_id']
                 conn.execute("UPDATE tools SET status = 'Available' WHERE id = ?", (tool_id,))
+                # A repaired tool is re-checked before going back on the shelf
+                feature_store.record_calibration(conn, tool_id)
                 print(f"✅ Auto-Fix: Tool {tool_id} marked Available (Case Closed).")
                 
                 # Log it
@@ -692,28 +769,24 @@ def update_issue_status(issue_id):
 
 @app.route('/api/alerts')
 def get_alerts():
+    # Maintained alert set (see alert_engine.py): O(alerts), no table scans
     conn = get_db_connection()
     try:
-        overdue = conn.execute("SELECT * FROM tools WHERE status != 'Under Maintenance' AND date(calibration_due) < date('now')").fetchall()
-        
-        long_checkout = conn.execute('''
-            SELECT t.*, tr.timestamp 
-            FROM tools t 
-            JOIN transactions tr ON t.id = tr.tool_id 
-            WHERE t.status = 'In Use' AND tr.type = 'checkout' 
-            AND tr.timestamp < datetime('now', '-8 hours')
-        ''').fetchall()
-        
-        if telegram_manager:
-            try:
-                telegram_manager.check_and_notify_users()
-            except Exception as e:
-                print(f"Telegram check failed: {e}")
-
-        return jsonify({
-            'overdue': [dict(row) for row in overdue],
-            'long_checkout': [dict(row) for row in long_checkout]
-        })
+        alerts = alert_engine.current_alerts(conn)
+        conn.commit()  # tick() may have promoted deadlines that just passed
+        # FOD Telegram warnings are timer-driven now (deadline_scheduler), not poll-driven
+        return jsonify(alerts)
+    finally:
+        conn.close()
+
+@app.route('/api/alerts/history')
+def get_alert_history():
+    """Raise/clear transitions, newest first: ?since=YYYY-MM-DD&tool_id=&limit="""
+    conn = get_db_connection()
+    try:
+        return jsonify(alert_engine.alert_history(
+            conn, since=request.args.get('since'), tool_id=request.args.get('tool_id'),
+            limit=min(request.args.get('limit', type=int, default=200), 5000)))
     finally:
         conn.close()
 
@@ -778,6 +851,232 @@ def get_audit_trail():
     conn.close()
     return jsonify([dict(row) for row in logs])
 
+# ==========================================
+#           CABINETS
+# ==========================================
+
+@app.route('/api/cabinet/allowlist', methods=['GET'])
+def get_cabinet_allowlist():
+    """Signed badge allowlist for cabinets: ?since=<version>&epoch=<epoch> returns only the changes."""
+    if not CABINET_ALLOWLIST_SECRET:
+        return jsonify({'message': 'Allowlist not enabled'}), 404
+    since = request.args.get('since', 0, type=int)
+    conn = get_db_connection()
+    try:
+        payload = cabinet_allowlist.build_allowlist(conn, since, request.args.get('epoch'))
+    finally:
+        conn.close()
+    payload['signature'] = cabinet_allowlist.sign_payload(payload, CABINET_ALLOWLIST_SECRET)
+    return jsonify(payload)
+
+@app.route('/api/cabinet/<cabinet_id>/slot-map', methods=['GET'])
+def get_cabinet_slot_map(cabinet_id):
+    """Reader wiring for the cabinet's Pi (cabinet_scanner.load_slot_map)."""
+    conn = get_db_connection()
+    try:
+        slot_map = cabinet_registry.get_slot_map(conn, cabinet_id)
+        if slot_map is None:
+            return jsonify({'message': 'Cabinet not configured'}), 404
+        return jsonify(slot_map)
+    finally:
+        conn.close()
+
+@app.route('/api/cabinet/<cabinet_id>/slot-map', methods=['PUT'])
+def set_cabinet_slot_map(cabinet_id):
+    data = request.get_json() or {}
+    conn = get_db_connection()
+    try:
+        slot_map = cabinet_registry.set_slot_map(conn, cabinet_id, data, name=data.get('name'))
+        log_audit_event('USR-001', 'CABINET_SLOT_MAP',
+                        json.dumps({'cabinet': cabinet_id, 'version': slot_map['version'],
+                                    'slots': len(slot_map['slots'])}), conn=conn)
+        conn.commit()
+        return jsonify(slot_map)
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'message': str(e)}), 400
+    finally:
+        conn.close()
+
+def reconcile_session(conn, user_id, changes, at=None):
+    """Applies one door session's changes [(action, uid, slot)] in the caller's transaction.
+
+    All tool UIDs are resolved in one query. A tool that left one slot and came back in
+    another was never out, so it is reported as 'moved' and not touched.
+    Returns (per-slot results, checkouts [(tool_id, user_id, tx_id)], checked-in tool IDs).
+    """
+    uids = sorted({uid for _, uid, _ in changes})
+    tools = {}
+    if uids:
+        marks = ','.join('?' * len(uids))
+        for tool in conn.execute(f'SELECT * FROM tools WHERE nfc_id IN ({marks}) OR id IN ({marks})', uids + uids):
+            tools[tool['id']] = tool
+            if tool['nfc_id']:
+                tools[tool['nfc_id']] = tool
+    removed = {uid for action, uid, _ in changes if action == 'REMOVED'}
+    returned = {uid for action, uid, _ in changes if action == 'RETURNED'}
+
+    results, checkouts, checkins = [], [], []
+    for action, uid, slot in changes:
+        entry = {'slot': slot, 'action': action, 'uid': uid, 'tool_id': None}
+        tool = tools.get(uid)
+        if not tool:
+            entry['result'] = 'not_found'
+        elif uid in removed and uid in returned:
+            entry.update(tool_id=tool['id'], result='moved')
+        elif action == 'REMOVED':
+            result, _, tx_id = perform_checkout(conn, user_id, uid, at=at, tool=tool, user_id=user_id)
+            checkouts.append((tool['id'], user_id, tx_id))
+            entry.update(tool_id=tool['id'], result='checked_out')
+        else:
+            result, _ = perform_checkin(conn, uid, at=at, tool=tool)
+            checkins.append(tool['id'])
+            entry.update(tool_id=tool['id'], result='checked_in', status=result['status'])
+        results.append(entry)
+    return results, checkouts, checkins
+
+@app.route('/api/cabinet/<cabinet_id>/reconcile', methods=['POST'])
+def reconcile_cabinet_session(cabinet_id):
+    """One door session in one request and one transaction.
+
+    Body: {'user_id' (badge UID or user ID), 'session_id', 'baseline' + 'final'
+    ({slot: tool UID or null}) or 'changes' ([{'action', 'uid', 'slot'}]),
+    'created_at' (UTC, optional), 'end_session' (default true)}.
+    A session_id already reconciled returns its stored results without applying anything.
+    """
+    global latest_nfc_scan
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Body must be a JSON object'}), 400
+    session_id = data.get('session_id') or uuid.uuid4().hex
+    at = data.get('created_at')
+    conn = get_db_connection()
+    try:
+        if not data.get('user_id'):
+            raise ValueError("user_id is required")
+        if not isinstance(data['user_id'], str) or not isinstance(session_id, str):
+            raise ValueError("user_id and session_id must be strings")
+        if at is not None and not isinstance(at, str):
+            raise ValueError("created_at must be a 'YYYY-MM-DD HH:MM:SS' string")
+        if at:
+            datetime.strptime(at, '%Y-%m-%d %H:%M:%S')  # ValueError if malformed
+        changes = cabinet_registry.session_changes(data)
+
+        stored = cabinet_registry.get_session_results(conn, cabinet_id, session_id)
+        if stored is not None:
+            return jsonify({'session_id': session_id, 'results': stored, 'replayed': True})
+
+        user_id = resolve_user_id(conn, data['user_id'])
+        results, checkouts, checkins = reconcile_session(conn, user_id, changes, at=at)
+        cabinet_registry.save_session_results(conn, cabinet_id, session_id, user_id, results)
+        conn.commit()
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ RECONCILE ERROR ({cabinet_id}): {e}")
+        return jsonify({'message': 'Reconcile failed; nothing was applied', 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+    checked_out_at = datetime.strptime(at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp() if at else None
+    for tool_id, holder, tx_id in checkouts:
+        deadline_scheduler.register_checkout(tool_id, holder, tx_id, checked_out_at=checked_out_at)
+    for tool_id in checkins:
+        deadline_scheduler.cancel_checkout(tool_id)
+    if data.get('end_session', True):
+        latest_nfc_scan = {}
+        print(f"🔒 SESSION ENDED by {cabinet_id}")
+    return jsonify({'session_id': session_id, 'user_id': user_id, 'results': results, 'replayed': False})
+
+# Session-end events older than this are replays, not the door that just locked
+SESSION_END_FRESH_S = 60
+
+@app.route('/api/cabinet/<cabinet_id>/events', methods=['POST'])
+def ingest_cabinet_events(cabinet_id):
+    """Store-and-forward upload from a cabinet's journal (cabinet_journal.py).
+
+    Body: {'journal_id', 'events': [{'seq', 'session_id', 'kind', 'user_id', 'tool_uid',
+    'slot', 'created_at'}]}. Safe to replay: events already applied are only acknowledged.
+    """
+    global latest_nfc_scan
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Body must be a JSON object'}), 400
+    checkouts, checkins = [], []
+
+    def apply(event):
+        if event['kind'] == 'checkout':
+            result, status, tx_id = perform_checkout(conn, event.get('user_id'), event.get('tool_uid'),
+                                                     at=event['created_at'])
+            if status == 200:
+                checkouts.append((result['tool_id'], result['user_id'], tx_id, event['created_at']))
+        elif event['kind'] == 'checkin':
+            result, status = perform_checkin(conn, event.get('tool_uid'), at=event['created_at'])
+            if status == 200:
+                checkins.append(result['tool_id'])
+        else:
+            return 'applied'
+        return 'applied' if status == 200 else f"rejected: {result['message']}"
+
+    conn = get_db_connection()
+    try:
+        outcome = cabinet_registry.ingest_events(conn, cabinet_id, data.get('journal_id'),
+                                                 data.get('events') or [], apply)
+        conn.commit()
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'message': str(e)}), 400
+    finally:
+        conn.close()
+
+    for tool_id, user_id, tx_id, created_at in checkouts:
+        checked_out_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+        deadline_scheduler.register_checkout(tool_id, user_id, tx_id, checked_out_at=checked_out_at)
+    for tool_id in checkins:
+        deadline_scheduler.cancel_checkout(tool_id)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for event in outcome['new']:
+        if event['kind'] == 'session_end' and \
+                (now - datetime.strptime(event['created_at'], '%Y-%m-%d %H:%M:%S')).total_seconds() < SESSION_END_FRESH_S:
+            latest_nfc_scan = {}
+            print("🔒 SESSION ENDED by Hardware")
+
+    return jsonify({'acked_through': outcome['acked_through'], 'applied': outcome['applied'],
+                    'duplicates': outcome['duplicates']})
+
+# ==========================================
+#           TELEGRAM WEBHOOK
+# ==========================================
+
+@app.route('/api/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Telegram pushes bot updates here (bot_listener.py --set-webhook) instead of being polled."""
+    if not TELEGRAM_WEBHOOK_SECRET or not bot_listener:
+        return jsonify({'message': 'Webhook not enabled'}), 404
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(token, TELEGRAM_WEBHOOK_SECRET):
+        return jsonify({'message': 'Forbidden'}), 403
+
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict) or not isinstance(update.get('update_id'), int):
+        return jsonify({'message': 'Not a Telegram update'}), 400
+
+    # Anything the bot doesn't answer is acknowledged (so Telegram stops retrying) and dropped.
+    if not bot_listener.is_chat_message(update):
+        return jsonify({'ok': True, 'ignored': True})
+
+    # Answered once the update is recorded; the reply is sent from the bot's worker pool.
+    # A redelivered update_id is acknowledged but not handled again.
+    bot_listener.start_dispatcher()
+    new = bot_listener.accept([update])
+    return jsonify({'ok': True, 'duplicate': not new})
+
 # ==========================================
 #           EMERGENCY & UTILS
 # ==========================================
@@ -811,46 +1110,201 @@ def get_calibration_events():
     
     conn = get_db_connection()
     try:
-        rows = conn.execute('''
-            SELECT calibration_due, COUNT(*) as count
-            FROM tools
-            WHERE calibration_due >= ? AND calibration_due < ?
-            GROUP BY calibration_due
-        ''', (start_date, end_date)).fetchall()
-        return jsonify({row['calibration_due']: row['count'] for row in rows})
+        return jsonify(calibration_calendar.day_totals(conn, start_date, end_date))
+    finally:
+        conn.close()
+
+@app.route('/api/calibration/calendar')
+def get_calibration_calendar():
+    """Day buckets (total, by model, by status) for a range: ?start=&end= (end exclusive),
+    or ?year=2025&quarter=3, or just ?year=2025 for the whole year."""
+    year = request.args.get('year', type=int, default=datetime.now().year)
+    quarter = request.args.get('quarter', type=int)
+    if quarter is not None and not 1 <= quarter <= 4:
+        return jsonify({'message': 'quarter must be 1-4'}), 400
+
+    if quarter:
+        start_date = f"{year}-{3 * quarter - 2:02d}-01"
+        end_date = f"{year}-{3 * quarter + 1:02d}-01" if quarter < 4 else f"{year+1}-01-01"
+    else:
+        start_date, end_date = f"{year}-01-01", f"{year+1}-01-01"
+    start_date = request.args.get('start', start_date)
+    end_date = request.args.get('end', end_date)
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'message': 'start/end must be YYYY-MM-DD'}), 400
+
+    conn = get_db_connection()
+    try:
+        return jsonify({'start': start_date, 'end': end_date,
+                        'days': calibration_calendar.day_buckets(conn, start_date, end_date)})
     finally:
         conn.close()
 
 @app.route('/api/calibration/predict', methods=['POST'])
 def get_ai_predictions():
+    # Legacy synchronous endpoint: same cached / coalesced job as the job API, but waits for it.
     try:
-        from predictive_calibration import generate_forecast
-        result = generate_forecast()
+        result = forecast_jobs.run_forecast_blocking()
         return jsonify(result)
-    except ImportError:
-        return jsonify({'status': 'error', 'message': 'AI Module Missing'}), 500
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# --- BACKGROUND FORECAST JOBS ---
+@app.route('/api/calibration/jobs', methods=['POST'])
+def submit_forecast_job():
+    job = forecast_jobs.submit_forecast()
+    return jsonify(job), (200 if job['status'] == 'done' else 202)
+
+@app.route('/api/calibration/jobs/<job_id>', methods=['GET'])
+def get_forecast_job(job_id):
+    job = forecast_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/calibration/jobs/<job_id>/result', methods=['GET'])
+def get_forecast_job_result(job_id):
+    status, result = forecast_jobs.get_result(job_id)
+    if status is None:
+        return jsonify({'message': 'Job not found'}), 404
+    if status in ('queued', 'running'):
+        return jsonify({'status': status, 'message': 'Forecast still running'}), 409
+    return jsonify(result)
+
+@app.route('/api/calibration/jobs/<job_id>', methods=['DELETE'])
+def cancel_forecast_job(job_id):
+    job = forecast_jobs.cancel_job(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/calibration/jobs/<job_id>/stream')
+def stream_forecast_job(job_id):
+    """Server-Sent Events: one 'progress' event per change, then a final 'end' event."""
+    if forecast_jobs.get_job(job_id) is None:
+        return jsonify({'message': 'Job not found'}), 404
+
+    def events():
+        seen = None
+        while True:
+            job = forecast_jobs.wait_for_change(job_id, seen)
+            if job is None:
+                return
+            state = (job['status'], job['progress'], job['message'])
+            if state == seen:
+                yield ": keep-alive\n\n"
+                continue
+            seen = state
+            yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+            if job['status'] not in ('queued', 'running'):
+                yield f"event: end\ndata: {json.dumps(job)}\n\n"
+                return
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+def _parse_outcome(o):
+    """(tool_id, observed_days) from one lab outcome; ValueError if it isn't one."""
+    if isinstance(o, dict) and isinstance(o.get('tool_id'), str) and o['tool_id'] \
+            and not isinstance(o.get('observed_days'), bool):
+        try:
+            days = int(o.get('observed_days'))
+        except (TypeError, ValueError):
+            pass
+        else:
+            if -32768 <= days <= 32767:  # the label is stored as int16
+                return o['tool_id'], days
+    raise ValueError(f"outcomes must be a list of {{tool_id, observed_days}} (whole days); got {o!r}")
+
+@app.route('/api/calibration/outcomes', methods=['POST'])
+def record_calibration_outcomes():
+    """Lab feedback: {"outcomes": [{"tool_id": ..., "observed_days": ...}]} becomes new training rows."""
+    from predictive_calibration import record_outcomes
+    data = request.get_json(silent=True)
+    outcomes = data.get('outcomes') if isinstance(data, dict) else None
+    if not isinstance(outcomes, list) or not outcomes:
+        return jsonify({'message': 'outcomes must be a list of {tool_id, observed_days}'}), 400
+    # The whole body is checked before anything is written: a bad row can't leave the
+    # rows before it stored, to be stored again when the client retries.
+    try:
+        parsed = [_parse_outcome(o) for o in outcomes]
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        recorded, unknown = record_outcomes(conn, parsed)
+        log_audit_event('USR-001', 'CALIBRATION_OUTCOMES', json.dumps({'tools': recorded}), conn=conn)
+        conn.commit()
+        return jsonify({'recorded': len(recorded), 'unknown_tools': unknown})
+    finally:
+        conn.close()
+
+@app.route('/api/calibration/schedule', methods=['POST'])
+def preview_calibration_schedule():
+    """Levels the given recommendations against lab capacity without writing anything."""
+    data = request.get_json() or {}
+    conn = get_db_connection()
+    try:
+        result = calibration_scheduler.build_schedule(
+            conn, data.get('updates', []),
+            capacity=int(data.get('capacity', calibration_scheduler.DAILY_CAPACITY)))
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    finally:
+        conn.close()
+
 @app.route('/api/calibration/apply', methods=['POST'])
 def apply_ai_predictions():
+    # level=true: spread the dates over lab capacity first (never later than recommended)
     data = request.get_json()
     updates = data.get('updates', [])
     
     conn = get_db_connection()
     try:
-        count = 0
-        ids = []
-        for u in updates:
-            conn.execute('UPDATE tools SET calibration_due = ? WHERE id = ?', (u['new_date'], u['tool_id']))
-            ids.append(u['tool_id'])
-            count += 1
-            
-        log_audit_event('USR-001', 'AI_CALIBRATION_UPDATE', json.dumps({'count': count, 'tools': ids}), conn=conn)
+        if data.get('level'):
+            result = calibration_scheduler.build_schedule(
+                conn, updates, capacity=int(data.get('capacity', calibration_scheduler.DAILY_CAPACITY)))
+            schedule = result['schedule']
+        else:
+            result = None
+            schedule = [{'tool_id': u['tool_id'], 'scheduled_date': u['new_date']} for u in updates]
+
+        count = calibration_scheduler.apply_schedule(conn, schedule)
+        ids = [s['tool_id'] for s in schedule]
+        log_audit_event('USR-001', 'AI_CALIBRATION_UPDATE',
+                        json.dumps({'count': count, 'tools': ids, 'levelled': bool(data.get('level'))}), conn=conn)
         conn.commit()
-        return jsonify({'message': f'Updated {count} tools'})
+        response = {'message': f'Updated {count} tools'}
+        if result:
+            response.update(daily_load=result['daily_load'], overbooked=result['overbooked'], late=result['late'])
+        return jsonify(response)
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'message': str(e)}), 400
     finally:
         conn.close()
 
+@app.before_request
+def start_deadline_scheduler():
+    # One FOD timer per serving process (app.run with or without debug, or a WSGI worker),
+    # started by its first request. The debug reloader's parent never serves a request, so
+    # it never runs a second timer; test clients (app.testing) don't start one either.
+    if not app.testing:
+        deadline_scheduler.start()
+
+def warm_calibration_model():
+    """Loads (or trains once) the calibration model so the first forecast click is fast."""
+    try:
+        from predictive_calibration import get_model
+        get_model()
+    except Exception as e:
+        print(f"⚠️ Calibration model warm-up failed: {e}")
+
 if __name__ == '__main__':
+    import threading
+    threading.Thread(target=warm_calibration_model, daemon=True).start()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
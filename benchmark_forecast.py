@@ -0,0 +1,127 @@
+# benchmark_forecast.py
+# Measures generate_forecast() latency on synthetic fleets of different sizes:
+# a full re-score (cold) and a steady-state run after --churn of the fleet changed.
+# Usage: python benchmark_forecast.py [--sizes 1000 10000 100000] [--churn 0.01] [--legacy]
+import argparse
+import contextlib
+import io
+import sqlite3
+import time
+import random
+from datetime import datetime, timedelta
+
+import predictive_calibration
+import feature_store
+
+def build_fleet_db(num_tools, seed=7):
+    """In-memory copy of the tools/issue_reports tables filled with num_tools random tools."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript('''
+        CREATE TABLE tools (
+            id TEXT PRIMARY KEY, model TEXT NOT NULL, name TEXT NOT NULL, status TEXT NOT NULL,
+            current_holder TEXT, calibration_due TEXT,
+            total_checkouts INTEGER DEFAULT 0, total_usage_hours REAL DEFAULT 0.0, nfc_id TEXT
+        );
+        CREATE TABLE issue_reports (
+            id TEXT PRIMARY KEY, tool_id TEXT, reporter_id TEXT, defect_type TEXT,
+            description TEXT, status TEXT DEFAULT 'New', created_at TIMESTAMP, closed_at TIMESTAMP
+        );
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, tool_id TEXT NOT NULL,
+            type TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, last_alert_sent DATETIME
+        );
+    ''')
+    feature_store.ensure_schema(conn)
+    predictive_calibration.ensure_schema(conn)
+    today = datetime.today()
+    statuses = ['Available'] * 17 + ['In Use', 'Overdue', 'Under Maintenance']
+    tools = []
+    for i in range(num_tools):
+        checkouts = rng.randint(0, 400)
+        tools.append((
+            f"BM-{i:06d}", 'M-BENCH', 'Benchmark Tool', rng.choice(statuses), None,
+            (today + timedelta(days=rng.randint(-10, 200))).strftime('%Y-%m-%d'),
+            checkouts, round(checkouts * rng.uniform(0.5, 8.0), 1)
+        ))
+    conn.executemany('''
+        INSERT INTO tools (id, model, name, status, current_holder, calibration_due, total_checkouts, total_usage_hours)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', tools)
+    issues = [(f"REP-{i:07d}", f"BM-{rng.randrange(num_tools):06d}", 'Physical Damage')
+              for i in range(num_tools // 20)]
+    conn.executemany("INSERT INTO issue_reports (id, tool_id, defect_type) VALUES (?, ?, ?)", issues)
+    feature_store.backfill_missing(conn)
+    conn.commit()
+    return conn
+
+def legacy_forecast(conn, model):
+    """The old per-tool loop (one DataFrame + predict() per tool, placeholder features), for timing only."""
+    import pandas as pd
+    tools = conn.execute("SELECT * FROM tools WHERE status != 'Under Maintenance'").fetchall()
+    issue_map = {r['tool_id']: r['count'] for r in
+                 conn.execute("SELECT tool_id, COUNT(*) as count FROM issue_reports GROUP BY tool_id")}
+    for tool in tools:
+        total_checkouts = tool['total_checkouts']
+        total_hours = tool['total_usage_hours']
+        current_due = datetime.strptime(tool['calibration_due'], '%Y-%m-%d')
+        features = pd.DataFrame([{
+            'Total_Checkouts': total_checkouts,
+            'Total_Usage_Hours': total_hours,
+            'Avg_Duration_Hours': (total_hours / total_checkouts) if total_checkouts > 0 else 0,
+            'Days_Since_Last_Cal': max(0, 180 - (current_due - datetime.now()).days),
+            'Tool_Age_Days': 365,
+            'Unique_Users': int(total_checkouts * 0.4),
+            'Past_Failures': issue_map.get(tool['id'], 0),
+            'Env_Stress_Index': 50,
+            'Criticality_Score': 3
+        }]).to_numpy()
+        model.predict(features)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark calibration forecast latency.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--churn', type=float, default=0.01, help="Fraction of tools touched before the incremental run.")
+    parser.add_argument('--legacy', action='store_true', help="Also time the old per-tool loop (sizes <= 10k).")
+    args = parser.parse_args()
+
+    bundle = predictive_calibration.get_model()
+    if not bundle:
+        print("❌ No model available. Run 'generate_training_data.py' first.")
+        return
+
+    print(f"\n{'TOOLS':>8} | {'FULL (ms)':>10} | {'PER TOOL (µs)':>13} | {'INCR (ms)':>10} | {'RESCORED':>8} | {'PROPOSALS':>9} | {'LEGACY (ms)':>11}")
+    print("-" * 90)
+    for size in args.sizes:
+        conn = build_fleet_db(size)
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # keep the table readable
+                result = predictive_calibration.generate_forecast(conn=conn, full_rescore=True)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+
+        # Steady state: a few tools saw activity since the last run
+        touched = [(f"BM-{i:06d}",) for i in random.Random(size).sample(range(size), max(1, int(size * args.churn)))]
+        conn.executemany("UPDATE tools SET total_checkouts = total_checkouts + 1 WHERE id = ?", touched)
+        conn.commit()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            incremental = predictive_calibration.generate_forecast(conn=conn)
+        incremental_ms = (time.perf_counter() - start) * 1000
+
+        legacy = "-"
+        if args.legacy and size <= 10000:
+            start = time.perf_counter()
+            legacy_forecast(conn, bundle['model'])
+            legacy = f"{(time.perf_counter() - start) * 1000:.0f}"
+        conn.close()
+
+        print(f"{size:>8} | {best * 1000:>10.1f} | {best / size * 1e6:>13.1f} | {incremental_ms:>10.1f} | "
+              f"{incremental['rescored']:>8} | {len(incremental['proposals']):>9} | {legacy:>11}")
+
+if __name__ == "__main__":
+    main()
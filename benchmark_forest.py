@@ -0,0 +1,85 @@
+# benchmark_forest.py
+# Compares the sklearn forest with the compact NumPy evaluator (full, quantized, pruned):
+# memory footprint, load time, per-batch latency and max deviation from sklearn.
+# Usage: python benchmark_forest.py [--batches 1 100 1000 10000] [--prune-depth 16]
+import argparse
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+
+import predictive_calibration
+import compact_forest
+import training_store
+
+def best_time(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact forest evaluator against sklearn.")
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 100, 1000, 10000])
+    parser.add_argument('--prune-depth', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    bundle = predictive_calibration.get_model()
+    if not bundle:
+        print("❌ No model available. Run 'generate_training_data.py' first.")
+        return
+    model = bundle['model']
+
+    X_all, _, _ = training_store.load_training_arrays(predictive_calibration.MODEL_FEATURES,
+                                                      predictive_calibration.LABEL_COLUMN)
+    rng = np.random.default_rng(0)
+    X = X_all[rng.integers(0, len(X_all), max(args.batches))]
+    reference = model.predict(X)
+
+    variants = {
+        'compact': compact_forest.export_forest(model),
+        'quantized': compact_forest.export_forest(model, quantize=True),
+        f'pruned@{args.prune_depth}': compact_forest.export_forest(model, max_depth=args.prune_depth),
+        f'quant+pruned@{args.prune_depth}': compact_forest.export_forest(model, quantize=True, max_depth=args.prune_depth),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # --- sklearn baseline ---
+        pkl_path = os.path.join(tmp, 'model.pkl')
+        with open(pkl_path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        def load_pickle():
+            with open(pkl_path, 'rb') as f:
+                pickle.load(f)
+
+        rows = [('sklearn', os.path.getsize(pkl_path), best_time(load_pickle, args.repeats), 0.0,
+                 [best_time(lambda: model.predict(X[:b]), args.repeats) for b in args.batches])]
+
+        # --- compact variants ---
+        for name, forest in variants.items():
+            path = os.path.join(tmp, f'{name}.npz')
+            compact_forest.save_forest(forest, path)
+            values = compact_forest._leaf_values(forest)
+            error = float(np.max(np.abs(compact_forest.predict(forest, X, values) - reference)))
+            rows.append((name, os.path.getsize(path),
+                         best_time(lambda: compact_forest.load_forest(path), args.repeats), error,
+                         [best_time(lambda: compact_forest.predict(forest, X[:b], values), args.repeats)
+                          for b in args.batches]))
+
+    header = f"{'VARIANT':<20} | {'SIZE (MB)':>9} | {'LOAD (ms)':>9} | {'MAX ERR (days)':>14}"
+    header += ''.join(f" | {'B=' + str(b) + ' (ms)':>12}" for b in args.batches)
+    print(f"\nModel v{bundle['version']}: {len(model.estimators_)} trees\n")
+    print(header)
+    print("-" * len(header))
+    for name, size, load, error, latencies in rows:
+        line = f"{name:<20} | {size / 1e6:>9.2f} | {load * 1000:>9.1f} | {error:>14.4f}"
+        line += ''.join(f" | {lat * 1000:>12.2f}" for lat in latencies)
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,265 @@
 # bot_listener.py
-import time
-import requests
-from telegram_manager import handle_my_tools, handle_report, BOT_TOKEN
+# Long-polls Telegram for bot commands and answers them on a small worker pool.
+#
+# Updates from different chats are handled concurrently; updates from the same chat
+# queue up in that chat's "lane" and are handled one at a time, so each technician's
+# commands are answered in the order they were sent.
+#
+# getUpdates confirms everything below the offset it is called with, so before asking
+# for the next batch the new offset and every update not yet handled are written to
+# OFFSET_PATH. On restart the unfinished updates are re-dispatched and polling resumes
+# from the saved offset: nothing is dropped, and only a command that was mid-flight
+# when the process died can be handled twice.
+#
+# Webhook mode: instead of polling, Telegram POSTs each update to the Flask app
+# (/api/telegram/webhook), which hands it to accept() below: same lanes, same handlers,
+# same durable record, with retried deliveries dropped by update_id.
+#   python bot_listener.py --set-webhook https://<host>/api/telegram/webhook
+#   python bot_listener.py --delete-webhook      (back to polling)
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from telegram_manager import handle_my_tools, handle_report, send_telegram_message, session, BASE_URL, HTTP_TIMEOUT_S
 
-BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+OFFSET_PATH = 'bot_offset.json'
+POLL_TIMEOUT_S = 30      # Telegram long-poll; returns as soon as an update arrives
+WORKERS = 8
+MAX_IN_FLIGHT = 256      # polling pauses while this many updates are queued or running
+SEEN_IDS = 10_000        # recent update_ids remembered to drop redelivered updates
 
-def get_updates(offset=None):
-    url = f"{BASE_URL}/getUpdates?timeout=100"
+_lock = threading.Lock()
+_lanes = {}              # chat_id -> deque of updates; present while that chat is being drained
+_unfinished = {}         # update_id -> update, received but not handled yet
+_seen = deque()          # recent update_ids, oldest first (bounded by SEEN_IDS)
+_seen_ids = set()
+_offset = None
+_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+_pool = None
+
+# ==========================================
+#           OFFSET PERSISTENCE
+# ==========================================
+
+def _load_state(path=None):
+    path = path or OFFSET_PATH
+    if not os.path.exists(path):
+        return None, []
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return state.get('offset'), state.get('unfinished', [])
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable {path}: {e}")
+        return None, []
+
+def _save_state(path=None):
+    path = path or OFFSET_PATH
+    with _lock:
+        state = {'offset': _offset, 'unfinished': [_unfinished[k] for k in sorted(_unfinished)]}
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+# ==========================================
+#           TELEGRAM I/O
+# ==========================================
+
+def get_updates(offset=None, timeout=POLL_TIMEOUT_S):
+    params = {'timeout': timeout}
     if offset:
-        url += f"&offset={offset}"
+        params['offset'] = offset
     try:
-        resp = requests.get(url)
+        resp = session.get(f"{BASE_URL}/getUpdates", params=params, timeout=timeout + 10)
         return resp.json()
     except Exception as e:
         print(f"Connection Error: {e}")
         return {}
 
-def send_reply(chat_id, text):
-    url = f"{BASE_URL}/sendMessage"
-    requests.post(url, json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
+def send_reply(chat_id, text, reply_to=None):
+    send_telegram_message(chat_id, text, reply_to=reply_to)
 
-def main():
-    print("🤖 Technician Assistant Bot is Running...")
-    last_update_id = None
+def set_webhook(url, secret):
+    """Switches Telegram to webhook delivery (getUpdates stops working until it is deleted)."""
+    resp = session.post(f"{BASE_URL}/setWebhook", json={'url': url, 'secret_token': secret,
+                                                        'allowed_updates': ['message']},
+                        timeout=HTTP_TIMEOUT_S)
+    return resp.json()
+
+def delete_webhook():
+    return session.post(f"{BASE_URL}/deleteWebhook", timeout=HTTP_TIMEOUT_S).json()
+
+# ==========================================
+#           COMMANDS
+# ==========================================
+
+def handle_update(update):
+    message = update["message"]
+    chat_id = message["chat"]["id"]
+    message_id = message.get("message_id")
+    text = message.get("text", "")
+
+    print(f"📩 Received: {text} from {chat_id}")
+
+    if text.startswith("/mytools"):
+        send_reply(chat_id, handle_my_tools(chat_id), message_id)
+
+    elif text.startswith("/report"):
+        # Expected format: /report TW-001 Broken handle
+        parts = text.split(" ", 2)
+        if len(parts) < 3:
+            send_reply(chat_id, "⚠️ Usage: `/report <TOOL_ID> <ISSUE>`\nExample: `/report TW-001 Screen cracked`", message_id)
+        else:
+            send_reply(chat_id, handle_report(chat_id, parts[1], parts[2]), message_id)
+
+    elif text.startswith("/start"):
+        send_reply(chat_id, "👋 **Welcome to AeroTool Bot!**\n\nCommands:\n`/mytools` - Check what you are holding\n`/report <ID> <Issue>` - Report broken tool", message_id)
+
+# ==========================================
+#           DISPATCH
+# ==========================================
 
+def _finish(update):
+    with _lock:
+        _unfinished.pop(update["update_id"], None)
+    _slots.release()
+    _save_state()
+
+def _drain(chat_id):
+    """Handles one chat's queued updates in order; the lane disappears once it is empty."""
     while True:
-        updates = get_updates(last_update_id)
-        if "result" in updates:
-            for update in updates["result"]:
-                last_update_id = update["update_id"] + 1
-                
-                if "message" not in update: continue
-                
-                chat_id = update["message"]["chat"]["id"]
-                text = update["message"].get("text", "")
-                
-                print(f"📩 Received: {text} from {chat_id}")
-
-                if text.startswith("/mytools"):
-                    response = handle_my_tools(chat_id)
-                    send_reply(chat_id, response)
-                
-                elif text.startswith("/report"):
-                    # Expected format: /report TW-001 Broken handle
-                    parts = text.split(" ", 2)
-                    if len(parts) < 3:
-                        send_reply(chat_id, "⚠️ Usage: `/report <TOOL_ID> <ISSUE>`\nExample: `/report TW-001 Screen cracked`")
-                    else:
-                        response = handle_report(chat_id, parts[1], parts[2])
-                        send_reply(chat_id, response)
-                        
-                elif text.startswith("/start"):
-                    send_reply(chat_id, "👋 **Welcome to AeroTool Bot!**\n\nCommands:\n`/mytools` - Check what you are holding\n`/report <ID> <Issue>` - Report broken tool")
-
-        time.sleep(1)
+        with _lock:
+            lane = _lanes[chat_id]
+            if not lane:
+                del _lanes[chat_id]
+                return
+            update = lane.popleft()
+        try:
+            handle_update(update)
+        except Exception as e:
+            print(f"⚠️ Update {update['update_id']} failed: {e}")
+        finally:
+            _finish(update)
+
+def dispatch(update):
+    """Queues an update on its chat's lane, starting a drain if the chat was idle."""
+    _slots.acquire()  # back-pressure: blocks the poll loop, not the workers
+    try:
+        chat_id = update["message"]["chat"]["id"]
+    except (KeyError, TypeError):
+        _finish(update)  # not a chat message (or malformed): drop it, giving the slot back
+        return
+    with _lock:
+        lane = _lanes.get(chat_id)
+        if lane is not None:
+            lane.append(update)
+            return
+        _lanes[chat_id] = deque([update])
+    _pool.submit(_drain, chat_id)
+
+def is_chat_message(update):
+    """True for the updates the bot answers: a message with an integer chat id."""
+    message = update.get("message")
+    return (isinstance(update.get("update_id"), int) and isinstance(message, dict)
+            and isinstance(message.get("chat"), dict) and isinstance(message["chat"].get("id"), int))
+
+def _remember(update_id):
+    # caller holds _lock
+    _seen.append(update_id)
+    _seen_ids.add(update_id)
+    if len(_seen) > SEEN_IDS:
+        _seen_ids.discard(_seen.popleft())
+
+def accept(updates):
+    """Records new updates durably, then dispatches them. Returns how many were new.
+
+    Used by both the poll loop and the webhook route; update_ids already seen
+    (Telegram retrying a delivery) are dropped, and so is anything that isn't a chat
+    message (it only moves the offset past it, never lands in the unfinished record).
+    """
+    global _offset
+    fresh = []
+    with _lock:
+        before = _offset
+        for update in updates:
+            update_id = update["update_id"]
+            _offset = max(_offset or 0, update_id + 1)
+            if update_id in _seen_ids or update_id in _unfinished or not is_chat_message(update):
+                continue
+            _remember(update_id)
+            _unfinished[update_id] = update
+            fresh.append(update)
+    if fresh or _offset != before:
+        _save_state()  # durable before getUpdates confirms the batch / before the webhook answers 200
+    for update in fresh:
+        dispatch(update)
+    return len(fresh)
+
+def start_dispatcher(workers=WORKERS):
+    """Starts the worker pool (idempotent) and re-dispatches updates left unfinished last run."""
+    global _offset, _pool
+    with _lock:
+        if _pool is not None:
+            return
+        _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot')
+        _offset, leftovers = _load_state()
+        leftovers = [u for u in leftovers if isinstance(u, dict) and is_chat_message(u)]
+        for update in leftovers:
+            _remember(update["update_id"])
+            _unfinished[update["update_id"]] = update
+    if leftovers:
+        print(f"↩️ Re-dispatching {len(leftovers)} unfinished updates from last run.")
+    for update in leftovers:
+        dispatch(update)
+
+def stop_dispatcher():
+    """Waits for queued updates to finish, then saves the offset."""
+    global _pool
+    if _pool is None:
+        return
+    _pool.shutdown(wait=True)
+    _pool = None
+    _save_state()
+
+# ==========================================
+#           MAIN LOOP
+# ==========================================
+
+def main(stop=None, workers=WORKERS, poll_timeout=POLL_TIMEOUT_S):
+    """Runs until Ctrl+C (or until `stop`, a threading.Event, is set)."""
+    print("🤖 Technician Assistant Bot is Running...")
+    stop = stop or threading.Event()
+    start_dispatcher(workers)
+
+    backoff = 1
+    try:
+        while not stop.is_set():
+            updates = get_updates(_offset, poll_timeout)
+            if "result" not in updates:
+                stop.wait(backoff)  # network/API error: back off instead of hammering
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            accept(updates["result"])
+    except KeyboardInterrupt:
+        print("\n🛑 Bot stopped by user.")
+    finally:
+        stop_dispatcher()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="AeroTool Telegram bot (long-polling unless a webhook is set).")
+    parser.add_argument('--set-webhook', metavar='URL', help="Deliver updates to the Flask app at URL instead")
+    parser.add_argument('--delete-webhook', action='store_true', help="Remove the webhook and go back to polling")
+    args = parser.parse_args()
+
+    if args.set_webhook:
+        secret = os.environ.get('TELEGRAM_WEBHOOK_SECRET')
+        if not secret:
+            raise SystemExit("❌ Set TELEGRAM_WEBHOOK_SECRET (same value as the Flask app) first.")
+        print(set_webhook(args.set_webhook, secret))
+    elif args.delete_webhook:
+        print(delete_webhook())
+    else:
+        main()
@@ -0,0 +1,121 @@
+# cabinet_allowlist.py
+# The badge allowlist cabinets cache locally (cabinet_auth.py on the Pi), so a tap is
+# authorized on the cabinet without a round trip to the server.
+#
+# Every change to users.nfc_id (insert, update, delete, from routes or seed scripts alike)
+# is logged by triggers in allowlist_changes; its rowid is the allowlist version. A cabinet
+# asks for the changes since the version it holds and gets back only the cards touched
+# since then, each with its current state, or the whole list when it has nothing usable
+# (first sync, or the database was re-created: a new epoch).
+#
+# Cards are published as SHA-256 digests of the UID, and each reply is signed with
+# HMAC-SHA256 (shared secret CABINET_ALLOWLIST_SECRET) over its canonical JSON, so a cabinet
+# only accepts lists the server issued. The signed issued_at / expires_at stamps stop a
+# captured reply from being replayed later (e.g. an old epoch's full list that still has
+# revoked badges): a cabinet ignores expired replies and any issued before the list it has.
+import hashlib
+import hmac
+import json
+import sqlite3
+import time
+import uuid
+
+REPLY_TTL_S = 300   # a signed reply is only accepted this long after it was issued
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS allowlist_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS allowlist_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_uid TEXT NOT NULL,
+        changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TRIGGER IF NOT EXISTS allowlist_users_insert AFTER INSERT ON users
+    WHEN NEW.nfc_id IS NOT NULL AND NEW.nfc_id != ''
+    BEGIN
+        INSERT INTO allowlist_changes (card_uid) VALUES (NEW.nfc_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS allowlist_users_delete AFTER DELETE ON users
+    WHEN OLD.nfc_id IS NOT NULL AND OLD.nfc_id != ''
+    BEGIN
+        INSERT INTO allowlist_changes (card_uid) VALUES (OLD.nfc_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS allowlist_users_update AFTER UPDATE OF nfc_id ON users
+    WHEN OLD.nfc_id IS NOT NEW.nfc_id
+    BEGIN
+        INSERT INTO allowlist_changes (card_uid) SELECT OLD.nfc_id WHERE OLD.nfc_id IS NOT NULL AND OLD.nfc_id != '';
+        INSERT INTO allowlist_changes (card_uid) SELECT NEW.nfc_id WHERE NEW.nfc_id IS NOT NULL AND NEW.nfc_id != '';
+    END;
+'''
+
+def get_db_connection():
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT OR IGNORE INTO allowlist_meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+
+def init_allowlist(db_path='database.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def rebuild(conn):
+    """New epoch and an empty change log (after the users table was re-created): cabinets resync fully."""
+    ensure_schema(conn)
+    conn.execute('DELETE FROM allowlist_changes')
+    conn.execute("UPDATE allowlist_meta SET value = ? WHERE key = 'epoch'", (uuid.uuid4().hex,))
+
+def card_digest(uid):
+    return hashlib.sha256(uid.encode()).hexdigest()
+
+def _canonical(payload):
+    body = {k: v for k, v in payload.items() if k != 'signature'}
+    return json.dumps(body, sort_keys=True, separators=(',', ':')).encode()
+
+def sign_payload(payload, secret):
+    return hmac.new(secret.encode(), _canonical(payload), hashlib.sha256).hexdigest()
+
+def verify_payload(payload, secret):
+    return hmac.compare_digest(payload.get('signature') or '', sign_payload(payload, secret))
+
+def stamp(payload, now=None):
+    """Adds issued_at / expires_at (unix seconds) to a reply before it is signed."""
+    now = int(time.time() if now is None else now)
+    payload.update(issued_at=now, expires_at=now + REPLY_TTL_S)
+    return payload
+
+def build_allowlist(conn, since=0, epoch=None):
+    """{'epoch', 'version', 'full', 'add': [digests], 'remove': [digests], 'issued_at', 'expires_at'} (unsigned).
+
+    full=True: 'add' is the whole list. Otherwise 'add' / 'remove' are the cards whose
+    state changed after version `since` of the same epoch.
+    """
+    current_epoch = conn.execute("SELECT value FROM allowlist_meta WHERE key = 'epoch'").fetchone()[0]
+    version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM allowlist_changes').fetchone()[0]
+    payload = stamp({'epoch': current_epoch, 'version': version, 'full': False, 'add': [], 'remove': []})
+    if since <= 0 or epoch != current_epoch or since > version:
+        payload['full'] = True
+        cards = conn.execute("SELECT DISTINCT nfc_id FROM users WHERE nfc_id IS NOT NULL AND nfc_id != ''")
+        payload['add'] = sorted(card_digest(row[0]) for row in cards)
+        return payload
+
+    touched = [row[0] for row in conn.execute(
+        'SELECT DISTINCT card_uid FROM allowlist_changes WHERE version > ?', (since,))]
+    if touched:
+        marks = ','.join('?' * len(touched))
+        present = {row[0] for row in conn.execute(f'SELECT DISTINCT nfc_id FROM users WHERE nfc_id IN ({marks})', touched)}
+        payload['add'] = sorted(card_digest(uid) for uid in touched if uid in present)
+        payload['remove'] = sorted(card_digest(uid) for uid in touched if uid not in present)
+    return payload
@@ -0,0 +1,153 @@
+# cabinet_auth.py
+# Pi-side copy of the server's badge allowlist (cabinet_allowlist.py), so a tap is
+# authorized locally with one set lookup instead of a POST to /api/nfc/scan.
+#
+# A background thread delta-syncs it from GET /api/cabinet/allowlist every SYNC_EVERY_S
+# and keeps a signed copy on disk, so the cabinet still opens for known badges after a
+# reboot with the server down. Lists whose signature doesn't check out, that have expired,
+# or that were issued before the list we hold (a replayed reply, even from another epoch)
+# or would take the version backwards, are ignored. The server stays the system of record:
+# the controller still reports every tap to it, just not before unlocking.
+import json
+import os
+import threading
+import time
+import requests
+from cabinet_allowlist import card_digest, sign_payload, verify_payload
+
+ALLOWLIST_PATH = 'allowlist.json'
+SYNC_EVERY_S = 30
+SYNC_TIMEOUT_S = 5
+BACKOFF_MAX_S = 300
+STALE_WARN_S = 24 * 3600   # still used when older than this, but logged
+
+class AllowlistCache:
+    """Local badge allowlist for one cabinet. secret: the server's CABINET_ALLOWLIST_SECRET."""
+
+    def __init__(self, server_url, secret, path=ALLOWLIST_PATH, sync_every=SYNC_EVERY_S):
+        self.url = f"{server_url}/api/cabinet/allowlist"
+        self.secret = secret
+        self.path = path
+        self.sync_every = sync_every
+        self.epoch = None
+        self.version = 0
+        self.issued_at = 0         # server stamp of the newest list accepted; older replies are replays
+        self.cards = frozenset()   # SHA-256 digests of allowed badge UIDs
+        self.loaded = False        # False until a list was loaded or synced: callers ask the server
+        self.synced_at = None
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    def is_authorized(self, uid_str):
+        """True / False from the cached list, or None when there is no list yet."""
+        if not self.loaded:
+            return None
+        return card_digest(uid_str) in self.cards
+
+    # ==========================================
+    #           LOCAL COPY
+    # ==========================================
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Allowlist copy unreadable ({e}); waiting for the server.")
+            return
+        if not verify_payload(saved, self.secret):
+            print("⚠️ Allowlist copy has a bad signature; ignoring it.")
+            return
+        self.epoch, self.version = saved['epoch'], saved['version']
+        self.issued_at = saved.get('issued_at') or 0
+        self.cards = frozenset(saved['cards'])
+        self.synced_at = saved.get('synced_at')
+        self.loaded = True
+        print(f"🔑 Allowlist v{self.version} loaded from disk ({len(self.cards)} badges)")
+
+    def _save(self):
+        saved = {'epoch': self.epoch, 'version': self.version, 'cards': sorted(self.cards),
+                 'issued_at': self.issued_at, 'synced_at': self.synced_at}
+        saved['signature'] = sign_payload(saved, self.secret)
+        with open(f"{self.path}.tmp", 'w') as f:
+            json.dump(saved, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+
+    # ==========================================
+    #           SYNC
+    # ==========================================
+
+    def sync_once(self):
+        """Fetches changes since our version. Returns True if the server answered with a valid list."""
+        params = {'since': self.version, 'epoch': self.epoch or ''}
+        try:
+            response = self.session.get(self.url, params=params, timeout=SYNC_TIMEOUT_S)
+            if response.status_code != 200:
+                print(f"⚠️ Allowlist sync rejected ({response.status_code})")
+                return False
+            payload = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"⚠️ Allowlist sync failed: {e}")
+            return False
+        if not verify_payload(payload, self.secret):
+            print("❌ Allowlist from server has a bad signature; keeping the current one.")
+            return False
+
+        issued_at, expires_at = payload.get('issued_at'), payload.get('expires_at')
+        if not isinstance(issued_at, int) or not isinstance(expires_at, int) or expires_at <= time.time():
+            print("❌ Allowlist from server is unstamped or expired; keeping the current one.")
+            return False
+
+        with self._lock:
+            if issued_at < self.issued_at:
+                print(f"❌ Allowlist issued at {issued_at} predates ours ({self.issued_at}); ignored as a replay.")
+                return False
+            if payload['epoch'] == self.epoch and payload['version'] < self.version:
+                print(f"❌ Allowlist v{payload['version']} is older than ours (v{self.version}); ignored.")
+                return False
+            if payload['full']:
+                cards = frozenset(payload['add'])
+            elif payload['epoch'] == self.epoch:
+                cards = (self.cards - set(payload['remove'])) | set(payload['add'])
+            else:
+                return False  # a delta against a list we don't have
+            changed = cards != self.cards or payload['version'] != self.version or not self.loaded
+            self.epoch, self.version, self.cards = payload['epoch'], payload['version'], cards
+            self.issued_at = issued_at
+            self.synced_at = time.time()
+            self.loaded = True
+        if changed:
+            self._save()
+            delta = 'full' if payload['full'] else f"+{len(payload['add'])} -{len(payload['remove'])}"
+            print(f"🔑 Allowlist v{self.version}: {len(self.cards)} badges ({delta})")
+        return True
+
+    def _run(self):
+        backoff = self.sync_every
+        while not self._stop.is_set():
+            if self.sync_once():
+                backoff = self.sync_every
+            else:
+                backoff = min(backoff * 2, BACKOFF_MAX_S)
+                if self.synced_at and time.time() - self.synced_at > STALE_WARN_S:
+                    print(f"⚠️ Allowlist not refreshed for {(time.time() - self.synced_at) / 3600:.0f} h")
+            self._stop.wait(backoff)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='allowlist-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,244 @@
+# cabinet_controller.py
+# Event-driven cabinet controller: one asyncio state machine instead of sleep loops.
+#
+#   IDLE ──tap + authorized──> UNLOCKED ──door opens──> OPEN ──door shut & settled──> RECONCILING ──> IDLE
+#                                  └── no door within DOOR_OPEN_TIMEOUT_S ──> IDLE
+#
+# - the door reed switch wakes the state machine through its edge callbacks
+#   (gpiozero Button.when_pressed / when_released), nothing polls it;
+# - the badge reader is polled back to back by its own task, and idle rescans of the tool
+#   slots keep the scanner's cached baseline fresh, so a tap unlocks without a scan;
+# - blocking work (I2C reads, HTTP on a keep-alive session, journal writes) runs in worker
+#   threads, and uploads happen in the journal's background thread, so the next user can
+#   badge in while the previous session is still being uploaded;
+# - with a local allowlist (cabinet_auth.AllowlistCache) a known badge unlocks at once and
+#   the tap is reported to the server afterwards; unknown badges, or no list yet, still
+#   ask the server first (a card enrolled a moment ago works before the next sync).
+#
+# The hardware is injected: pi_script_latest.py passes gpiozero devices and PN532 readers,
+# tests and simulators pass cabinet_hardware.FakeDoor / FakeRelay / FakeCabinet readers.
+import asyncio
+import time
+import uuid
+import requests
+from cabinet_scanner import diff_snapshots
+
+USER_READ_S = 0.2          # one badge-reader search; the next starts right away
+AUTH_TIMEOUT_S = 2
+DOOR_OPEN_TIMEOUT_S = 10   # unlocked but never opened: lock again
+DOOR_SETTLE_S = 1.0        # door must stay shut this long before locking and scanning
+RETAP_IGNORE_S = 3         # same badge still on the reader after a session
+IDLE_SCAN_S = 60           # idle rescan period (scanner trusts a cached baseline for 5 min)
+
+IDLE, UNLOCKED, OPEN, RECONCILING = 'IDLE', 'UNLOCKED', 'OPEN', 'RECONCILING'
+
+def badge_uid(uid):
+    """Badge UID bytes -> the string the server knows ("0x4 0xa2 ...")."""
+    return " ".join([hex(i) for i in uid]).lower()
+
+class CabinetController:
+    """Runs one cabinet. authorize: optional async callable(uid_str) -> bool
+    (default: the local allowlist if one is given, else ask the server)."""
+
+    def __init__(self, server_url, lock_relay, door_sensor, user_reader, scanner, journal,
+                 authorize=None, allowlist=None, name='cabinet'):
+        self.server_url = server_url
+        self.lock_relay = lock_relay
+        self.door_sensor = door_sensor   # is_pressed == door shut
+        self.user_reader = user_reader
+        self.scanner = scanner
+        self.journal = journal
+        self.allowlist = allowlist
+        self.authorize = authorize or self.check_badge
+        self.name = name
+        self.http = requests.Session()   # keep-alive to the server
+        self.state = IDLE
+        self.sessions = 0
+        self.unlock_latencies = []       # badge seen -> relay on (s)
+        self.reconcile_latencies = []    # door settled -> session journaled (s)
+        self.local_grants = 0            # taps authorized from the allowlist alone
+        self._door_changed = None
+        self._scan_lock = None
+        self._stop = None
+        self._reports = set()            # tap reports still in flight
+
+    # ==========================================
+    #           SERVER
+    # ==========================================
+
+    async def api_check_user(self, uid_str):
+        """Asks the Laptop: 'Is this user allowed in?'"""
+        try:
+            response = await asyncio.to_thread(self.http.post, f"{self.server_url}/api/nfc/scan",
+                                               json={'uid': uid_str}, timeout=AUTH_TIMEOUT_S)
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            print(f"❌ SERVER DOWN: Cannot reach {self.server_url} ({e})")
+            return False
+
+    async def _report_tap(self, uid_str):
+        if not await self.api_check_user(uid_str):
+            print(f"⚠️ [{self.name}] Server did not confirm {uid_str} (allowlist out of date?)")
+
+    async def check_badge(self, uid_str):
+        """Allowlist first; the server is asked only when the list doesn't know the badge."""
+        allowed = self.allowlist.is_authorized(uid_str) if self.allowlist else None
+        if not allowed:
+            return await self.api_check_user(uid_str)
+        # Known badge: unlock now, tell the server (system of record, station UI) in the background
+        self.local_grants += 1
+        report = asyncio.create_task(self._report_tap(uid_str))
+        self._reports.add(report)
+        report.add_done_callback(self._reports.discard)
+        return True
+
+    # ==========================================
+    #           DOOR
+    # ==========================================
+
+    def _bind_door(self, loop):
+        self._door_changed = asyncio.Event()
+
+        def changed():  # called on gpiozero's thread
+            loop.call_soon_threadsafe(self._door_changed.set)
+        self.door_sensor.when_pressed = changed
+        self.door_sensor.when_released = changed
+
+    def door_shut(self):
+        return self.door_sensor.is_pressed
+
+    async def wait_door(self, shut, timeout=None):
+        """True once the door is shut (or open), False if timeout passes first."""
+        async def wait():
+            while True:
+                self._door_changed.clear()
+                if self.door_shut() == shut:
+                    return
+                await self._door_changed.wait()
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # ==========================================
+    #           SESSION
+    # ==========================================
+
+    async def run_session(self, user_uid, tapped_at):
+        session_id = uuid.uuid4().hex
+        try:
+            # 1. BASELINE (normally the idle scanner's cached snapshot: no scan here)
+            async with self._scan_lock:
+                baseline = await asyncio.to_thread(self.scanner.snapshot, True)
+
+            # 2. UNLOCK
+            self.state = UNLOCKED
+            self.lock_relay.on()
+            self.unlock_latencies.append(time.perf_counter() - tapped_at)
+            print(f"🟢 [{self.name}] UNLOCKED for {user_uid} "
+                  f"({(time.perf_counter() - tapped_at) * 1000:.0f} ms after tap)")
+
+            # 3. WAIT FOR DOOR OPEN
+            if not await self.wait_door(shut=False, timeout=DOOR_OPEN_TIMEOUT_S):
+                print(f"   ⚠️ [{self.name}] TIMEOUT: Door was not opened.")
+                self.lock_relay.off()
+                await asyncio.to_thread(self.journal.record_session, session_id, user_uid, [])
+                return
+
+            # 4. DOOR OPEN: no scanning until it is shut again and has settled
+            self.state = OPEN
+            self.scanner.invalidate()
+            while True:
+                await self.wait_door(shut=True)
+                if not await self.wait_door(shut=False, timeout=DOOR_SETTLE_S):
+                    break  # stayed shut for the whole settle time
+
+            # 5. LOCK & SCAN
+            settled_at = time.perf_counter()
+            self.lock_relay.off()
+            self.state = RECONCILING
+            async with self._scan_lock:
+                final_state = await asyncio.to_thread(self.scanner.snapshot)
+
+            # 6. RECONCILIATION, journaled as one session (uploaded in the background)
+            events = diff_snapshots(baseline, final_state)
+            for action, uid, slot in events:
+                print(f"   {'🔻 ITEM REMOVED' if action == 'REMOVED' else '✅ ITEM RETURNED'}: {uid} (slot {slot})")
+            if not events:
+                print(f"   🤷‍♂️ [{self.name}] No changes detected.")
+            await asyncio.to_thread(self.journal.record_session, session_id, user_uid,
+                                    [("checkout" if action == "REMOVED" else "checkin", uid, slot)
+                                     for action, uid, slot in events])
+            self.reconcile_latencies.append(time.perf_counter() - settled_at)
+            self.sessions += 1
+            print(f"🔒 [{self.name}] SESSION ENDED.")
+        finally:
+            self.lock_relay.off()
+            self.state = IDLE
+
+    # ==========================================
+    #           TASKS
+    # ==========================================
+
+    async def badge_loop(self):
+        last_uid, last_done = None, 0.0
+        while True:
+            if not self.user_reader:
+                await asyncio.sleep(1)
+                continue
+            try:
+                uid = await asyncio.to_thread(self.user_reader.read_passive_target, timeout=USER_READ_S)
+            except (RuntimeError, OSError):
+                uid = None  # reader hiccup (normal)
+            if not uid:
+                continue
+            tapped_at = time.perf_counter()
+            uid_str = badge_uid(uid)
+            if uid_str == last_uid and tapped_at - last_done < RETAP_IGNORE_S:
+                continue  # badge left on the reader
+            try:
+                if await self.authorize(uid_str):
+                    await self.run_session(uid_str, tapped_at)
+                else:
+                    print(f"⛔ [{self.name}] ACCESS DENIED: {uid_str}")
+            except Exception as e:
+                # If anything crashes (wire loose, disk full), keep the cabinet running
+                print(f"⚠️ [{self.name}] ERROR IN SESSION: {e}")
+                await asyncio.sleep(1)
+            last_uid, last_done = uid_str, time.perf_counter()
+
+    async def scan_loop(self):
+        """While idle with the door shut, rescans now and then so the next baseline is cached."""
+        while True:
+            await asyncio.sleep(IDLE_SCAN_S)
+            if self.state != IDLE or not self.door_shut():
+                continue
+            async with self._scan_lock:
+                before = dict(self.scanner.state)
+                after = await asyncio.to_thread(self.scanner.snapshot)
+            for action, uid, slot in diff_snapshots(before, after):
+                print(f"   ⚠️ [{self.name}] {action} with the door shut: {uid} (slot {slot})")
+
+    async def run(self):
+        """Runs until stop() (or cancellation)."""
+        self._stop = asyncio.Event()
+        self._scan_lock = asyncio.Lock()
+        self._bind_door(asyncio.get_running_loop())
+        self.journal.start()
+        if self.allowlist:
+            self.allowlist.start()
+        await asyncio.to_thread(self.scanner.snapshot)  # initial baseline
+        print(f"📡 [{self.name}] SYSTEM READY.")
+        tasks = [asyncio.create_task(self.badge_loop()), asyncio.create_task(self.scan_loop())]
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.lock_relay.off()
+
+    def stop(self):
+        if self._stop:
+            self._stop.set()
@@ -0,0 +1,329 @@
+# cabinet_fleet_sim.py
+# Runs a fleet of virtual cabinets against a local app.py, end to end.
+#
+# Each cabinet is the real cabinet_controller (plus scanner, journal and, with
+# --allowlist, the badge cache) on simulated hardware: FakeCabinet PN532 readers, a
+# FakeDoor reed switch and a FakeRelay lock. Virtual technicians badge in, return tools
+# they hold and take others, with think times, door times and tool counts drawn from the
+# distributions below. The app runs as its own process on a scratch copy of the database,
+# so the simulator's threads don't share its interpreter.
+#
+#   python cabinet_fleet_sim.py --cabinets 10 50 200 [--duration 60] [--allowlist] [--per-cabinet]
+#
+# For each fleet size it reports unlock latency (tap -> relay), reconciliation latency
+# (door settled -> session journaled), upload latency, events lost or applied twice
+# (journaled moves vs. what the server recorded), and how hard the server was working
+# (CPU of the app process, how long the journals took to drain after the run).
+import argparse
+import asyncio
+import contextlib
+import math
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import cabinet_registry
+from benchmark_cabinet_scan import make_slot_map
+from cabinet_controller import CabinetController, badge_uid
+from cabinet_hardware import FakeCabinet, FakeDoor, FakeRelay, reader_key
+from cabinet_journal import EventJournal
+from cabinet_scanner import CabinetScanner, diff_snapshots, format_uid
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ALLOWLIST_SECRET = 'fleet-sim-secret'
+UNLOCK_WAIT_S = 5      # a technician gives up on a tap after this long
+
+def poisson(rng, mean):
+    """Small-mean Poisson sample (Knuth)."""
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+def pct(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+# ==========================================
+#           FLEET SETUP
+# ==========================================
+
+def seed_fleet(db_path, count, args, rng):
+    """Tagged tools, badged technicians and a slot map per cabinet in the scratch database."""
+    conn = sqlite3.connect(db_path)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(tools)')]
+    if 'nfc_id' not in columns:
+        conn.execute('ALTER TABLE tools ADD COLUMN nfc_id TEXT')
+    cabinet_registry.ensure_schema(conn)
+    fleet = []
+    tools, users = [], []
+    for c in range(count):
+        cabinet_id = f"SIM-{c:03d}"
+        slot_map = make_slot_map(args.slots, args.buses)
+        slot_map['cabinet_id'] = cabinet_id
+        cabinet_registry.set_slot_map(conn, cabinet_id, slot_map)
+        tags = {}
+        for slot in slot_map['slots']:
+            if rng.random() < args.fill:
+                uid = bytes(rng.getrandbits(8) for _ in range(7))
+                tags[reader_key(slot)] = uid
+                tools.append((f"{cabinet_id}-T{slot['slot']:02d}", 'M-SIM', 'Simulated Tool', 'Available',
+                              '2099-01-01', format_uid(uid)))
+        badges = []
+        for t in range(args.techs):
+            badge = bytes(rng.getrandbits(8) for _ in range(4))
+            badges.append(badge)
+            users.append((f"{cabinet_id}-U{t}", f"Sim Tech {c}.{t}", 'Technician', badge_uid(badge)))
+        fleet.append({'cabinet_id': cabinet_id, 'slot_map': slot_map, 'tags': tags, 'badges': badges})
+    conn.executemany('INSERT INTO tools (id, model, name, status, calibration_due, nfc_id) VALUES (?, ?, ?, ?, ?, ?)', tools)
+    conn.executemany('INSERT INTO users (id, name, role, nfc_id) VALUES (?, ?, ?, ?)', users)
+    conn.commit()
+    conn.close()
+    return fleet
+
+def start_app(workdir, port, allowlist):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    if allowlist:
+        env['CABINET_ALLOWLIST_SECRET'] = ALLOWLIST_SECRET
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    server = subprocess.Popen(
+        [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/api/session/status", timeout=1).status_code == 200:
+                return server, url
+        except requests.exceptions.RequestException:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.2)
+    server.kill()
+    raise SystemExit(f"❌ app.py did not start (see {workdir}/app.log)")
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process (Linux /proc), or None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+# ==========================================
+#           ONE CABINET
+# ==========================================
+
+class VirtualCabinet:
+    def __init__(self, spec, url, workdir, args):
+        self.id = spec['cabinet_id']
+        self.slot_map = spec['slot_map']
+        self.badges = spec['badges']
+        self.hw = FakeCabinet(self.slot_map['slots'] + [self.slot_map['user_reader']], miss_rate=args.miss_rate)
+        self.hw.tags.update(spec['tags'])
+        self.badge_key = reader_key(self.slot_map['user_reader'])
+        self.slot_of = {reader_key(s): s['slot'] for s in self.slot_map['slots']}
+        self.relay = FakeRelay()
+        self.door = FakeDoor(self.relay)
+        self.scanner = CabinetScanner(self.slot_map, self.hw.readers)
+        self.journal = EventJournal(url, self.id, path=os.path.join(workdir, f"journal-{self.id}.db"))
+        self.allowlist = None
+        if args.allowlist:
+            from cabinet_auth import AllowlistCache
+            self.allowlist = AllowlistCache(url, ALLOWLIST_SECRET, path=os.path.join(workdir, f"allowlist-{self.id}.json"))
+        self.controller = CabinetController(url, self.relay, self.door, self.hw.readers[self.badge_key],
+                                            self.scanner, self.journal, allowlist=self.allowlist, name=self.id)
+        self.held = [dict() for _ in self.badges]   # per technician: reader_key -> tool UID
+        self.expected = []                          # (kind, tool UID, slot) that really happened
+        self.failed_taps = 0
+
+    def truth(self):
+        return {self.slot_of[key]: format_uid(self.hw.tags[key]) if key in self.hw.tags else None
+                for key in self.slot_of}
+
+    async def technicians(self, args, rng, stop_at):
+        """One technician at a time at this cabinet, until stop_at."""
+        while True:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+            if time.time() >= stop_at:
+                return
+            tech = rng.randrange(len(self.badges))
+            done = self.controller.sessions
+            before = self.truth()
+
+            self.hw.tags[self.badge_key] = self.badges[tech]   # tap
+            tapped = time.perf_counter()
+            while not self.relay.is_active and time.perf_counter() - tapped < UNLOCK_WAIT_S:
+                await asyncio.sleep(0.005)
+            del self.hw.tags[self.badge_key]
+            if not self.relay.is_active:
+                self.failed_taps += 1
+                continue
+
+            await asyncio.sleep(rng.uniform(0.2, 1.0))
+            self.door.open()
+            for key, uid in list(self.held[tech].items()):       # bring tools back
+                if rng.random() < args.return_rate:
+                    self.hw.tags[key] = uid
+                    del self.held[tech][key]
+            present = [key for key in self.slot_of if key in self.hw.tags]
+            for key in rng.sample(present, min(len(present), poisson(rng, args.take))):
+                self.held[tech][key] = self.hw.tags.pop(key)
+            await asyncio.sleep(rng.uniform(args.door_min, args.door_max))
+            self.door.close()
+            self.expected += [('checkout' if action == 'REMOVED' else 'checkin', uid, slot)
+                              for action, uid, slot in diff_snapshots(before, self.truth())]
+
+            deadline = time.perf_counter() + 30
+            while self.controller.sessions == done and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+
+# ==========================================
+#           ONE RUN
+# ==========================================
+
+def run_fleet(count, args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix=f"fleet-{count}-")
+    shutil.copy(args.db, os.path.join(workdir, 'database.db'))
+    fleet = seed_fleet(os.path.join(workdir, 'database.db'), count, args, rng)
+    server, url = start_app(workdir, args.port, args.allowlist)
+    quiet = lambda: contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with quiet():
+        cabinets = [VirtualCabinet(spec, url, workdir, args) for spec in fleet]
+        for cabinet in cabinets:
+            if cabinet.allowlist:
+                cabinet.allowlist.sync_once()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=4 * count + 32))
+        stop_at = time.time() + args.duration
+        controllers = [asyncio.create_task(c.controller.run()) for c in cabinets]
+        await asyncio.sleep(1)  # initial baselines
+        await asyncio.gather(*[c.technicians(args, random.Random(rng.random()), stop_at) for c in cabinets])
+        for c in cabinets:
+            c.controller.stop()
+        await asyncio.gather(*controllers, return_exceptions=True)
+
+    cpu_before = cpu_seconds(server.pid)
+    started = time.perf_counter()
+    with quiet():
+        asyncio.run(main())
+        ran = time.perf_counter() - started
+        drain_start = time.perf_counter()
+        while any(c.journal.pending_count() for c in cabinets) and time.perf_counter() - drain_start < args.drain_timeout:
+            time.sleep(0.1)
+        drain = time.perf_counter() - drain_start
+        left = sum(c.journal.pending_count() for c in cabinets)
+        for c in cabinets:
+            c.journal.stop(flush_timeout=0)
+            c.scanner.close()
+            if c.allowlist:
+                c.allowlist.stop()
+    cpu_after = cpu_seconds(server.pid)
+    server.terminate()
+    server.wait()
+
+    # What the server recorded vs what happened, counting only the seeded SIM cabinets and
+    # tools (the copied database may already hold events and transactions of its own)
+    conn = sqlite3.connect(os.path.join(workdir, 'database.db'))
+    rows = {}
+    for cabinet_id, kind, tool_uid, slot, result in conn.execute(
+            "SELECT cabinet_id, kind, tool_uid, slot, result FROM cabinet_events "
+            "WHERE kind != 'session_end' AND cabinet_id LIKE 'SIM-%'"):
+        rows.setdefault(cabinet_id, []).append((kind, tool_uid, slot, result))
+    transactions = conn.execute("SELECT COUNT(*) FROM transactions WHERE tool_id LIKE 'SIM-%'").fetchone()[0]
+    conn.close()
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    per_cabinet = []
+    for c in cabinets:
+        received = Counter((kind, uid, slot) for kind, uid, slot, _ in rows.get(c.id, []))
+        expected = Counter(c.expected)
+        per_cabinet.append({
+            'id': c.id, 'sessions': c.controller.sessions, 'failed_taps': c.failed_taps,
+            'unlock': c.controller.unlock_latencies, 'reconcile': c.controller.reconcile_latencies,
+            'uploads': list(c.journal.upload_latencies),
+            'lost': sum((expected - received).values()), 'extra': sum((received - expected).values()),
+            'rejected': sum(1 for *_, result in rows.get(c.id, []) if result != 'applied'),
+        })
+    applied = sum(1 for events in rows.values() for *_, result in events if result == 'applied')
+    return {
+        'cabinets': count, 'per_cabinet': per_cabinet, 'applied': applied, 'transactions': transactions,
+        'ran': ran, 'drain': drain, 'left': left,
+        'cpu': (cpu_after - cpu_before) / ran if cpu_before is not None and cpu_after is not None else None,
+    }
+
+def report(result, per_cabinet):
+    cabs = result['per_cabinet']
+    unlock = [x for c in cabs for x in c['unlock']]
+    reconcile = [x for c in cabs for x in c['reconcile']]
+    uploads = [x for c in cabs for x in c['uploads']]
+    sessions = sum(c['sessions'] for c in cabs)
+    lost = sum(c['lost'] for c in cabs)
+    extra = sum(c['extra'] for c in cabs)
+    cpu = f"{result['cpu'] * 100:.0f}%" if result['cpu'] is not None else 'n/a'
+    print(f"{result['cabinets']:>5} {sessions:>8} {sessions / result['ran'] * 60:>7.0f} "
+          f"{pct(unlock, 0.5) * 1000:>7.0f} {pct(unlock, 0.95) * 1000:>7.0f} "
+          f"{pct(reconcile, 0.5) * 1000:>7.0f} {pct(reconcile, 0.95) * 1000:>7.0f} "
+          f"{pct(uploads, 0.5) * 1000:>7.0f} {pct(uploads, 0.95) * 1000:>7.0f} "
+          f"{result['drain']:>6.1f} {cpu:>5} {sum(c['failed_taps'] for c in cabs):>6} "
+          f"{lost:>5} {extra:>5} {result['transactions'] - result['applied']:>5}")
+    if per_cabinet:
+        print(f"   {'cabinet':<9} {'sessions':>8} {'unlock p95':>11} {'recon p95':>10} {'lost':>5} {'extra':>5} {'rejected':>8}")
+        for c in sorted(cabs, key=lambda c: -pct(c['unlock'], 0.95) if c['unlock'] else 0):
+            print(f"   {c['id']:<9} {c['sessions']:>8} {pct(c['unlock'], 0.95) * 1000:>9.0f}ms "
+                  f"{pct(c['reconcile'], 0.95) * 1000:>8.0f}ms {c['lost']:>5} {c['extra']:>5} {c['rejected']:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a fleet of cabinets against a local app.py.")
+    parser.add_argument('--cabinets', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--duration', type=float, default=60, help="Seconds of technician activity per fleet size")
+    parser.add_argument('--slots', type=int, default=16)
+    parser.add_argument('--buses', type=int, default=1)
+    parser.add_argument('--fill', type=float, default=0.7, help="Fraction of slots holding a tool at start")
+    parser.add_argument('--techs', type=int, default=3, help="Technicians (badges) per cabinet")
+    parser.add_argument('--think', type=float, default=5.0, help="Mean seconds between sessions at a cabinet (exponential)")
+    parser.add_argument('--take', type=float, default=1.0, help="Mean tools taken per session (Poisson)")
+    parser.add_argument('--return-rate', type=float, default=0.6, help="Chance a held tool is brought back at a session")
+    parser.add_argument('--door-min', type=float, default=0.5)
+    parser.add_argument('--door-max', type=float, default=3.0)
+    parser.add_argument('--miss-rate', type=float, default=0.0, help="Chance a present tag isn't seen on one read")
+    parser.add_argument('--allowlist', action='store_true', help="Authorize badges from the local allowlist cache")
+    parser.add_argument('--drain-timeout', type=float, default=120)
+    parser.add_argument('--db', default='database.db', help="Database to copy as the server's starting point")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--per-cabinet', action='store_true')
+    parser.add_argument('--keep', action='store_true', help="Keep each run's scratch directory")
+    parser.add_argument('--verbose', action='store_true', help="Show the cabinets' own log lines")
+    args = parser.parse_args()
+
+    print(f"🗄️ {args.slots} slots/cabinet, {args.techs} technicians/cabinet, one session every ~{args.think:.0f}s, "
+          f"~{args.take:.1f} tools taken/session, {'allowlist' if args.allowlist else 'server'} authorization")
+    print(f"{'cabs':>5} {'sessions':>8} {'/min':>7} {'unlock':>7} {'p95':>7} {'recon':>7} {'p95':>7} "
+          f"{'upload':>7} {'p95':>7} {'drain':>6} {'cpu':>5} {'failed':>6} {'lost':>5} {'extra':>5} {'dup tx':>5}")
+    print(f"{'':>22} {'(ms)':>7} {'':>7} {'(ms)':>7} {'':>7} {'(ms)':>7} {'':>7} {'(s)':>6}")
+    mismatched = []
+    for count in args.cabinets:
+        result = run_fleet(count, args)
+        report(result, args.per_cabinet)
+        if result['transactions'] != result['applied']:
+            mismatched.append(f"{count} cabinets: {result['transactions']} transactions for {result['applied']} applied moves")
+    if mismatched:
+        raise SystemExit("❌ Transactions don't match applied tool moves (" + '; '.join(mismatched) + ")")
@@ -0,0 +1,172 @@
+# cabinet_hardware.py
+# NFC reader backends for cabinet_scanner.
+#
+# A reader is addressed by (bus, mux, channel): the I2C bus number, the TCA9548A
+# multiplexer's address on that bus, and the mux channel the PN532 sits on. Readers
+# on different buses can be driven at the same time; readers on one bus share its wires.
+#
+#   open_pn532_readers(locations)  real hardware (Raspberry Pi + Adafruit libraries)
+#   FakeCabinet(locations)         simulated readers with PN532-like timing, for
+#                                  benchmarks and tests on any Linux box
+#
+# Both hand out objects with the adafruit_pn532 calls the scanner uses:
+# listen_for_passive_target(), get_passive_target(timeout), read_passive_target(timeout).
+# FakeDoor / FakeRelay stand in for the gpiozero reed switch (Button) and lock relay
+# (DigitalOutputDevice) that cabinet_controller drives.
+import random
+import threading
+import time
+
+def reader_key(location):
+    """{'bus', 'mux', 'channel'} -> hashable key."""
+    return (int(location.get('bus', 1)), int(location.get('mux', 0x70)), int(location['channel']))
+
+# ==========================================
+#           REAL HARDWARE
+# ==========================================
+
+def open_pn532_readers(locations):
+    """{reader_key: PN532_I2C} for every location that answers; failures are reported and skipped."""
+    import board
+    from adafruit_tca9548a import TCA9548A
+    from adafruit_pn532.i2c import PN532_I2C
+
+    buses, muxes, readers = {}, {}, {}
+    for location in locations:
+        key = reader_key(location)
+        bus_id, mux_address, channel = key
+        try:
+            if bus_id not in buses:
+                if bus_id == 1:
+                    buses[bus_id] = board.I2C()
+                else:
+                    from adafruit_extended_bus import ExtendedI2C  # extra buses: dtoverlay=i2c-gpio
+                    buses[bus_id] = ExtendedI2C(bus_id)
+            if (bus_id, mux_address) not in muxes:
+                muxes[(bus_id, mux_address)] = TCA9548A(buses[bus_id], address=mux_address)
+            pn = PN532_I2C(muxes[(bus_id, mux_address)][channel], debug=False)
+            pn.SAM_configuration()
+            readers[key] = pn
+            print(f"✅ Bus {bus_id} mux {mux_address:#x} port {channel}: ONLINE")
+        except Exception as e:
+            print(f"❌ Bus {bus_id} mux {mux_address:#x} port {channel}: FAILED ({e})")
+    return readers
+
+# ==========================================
+#           SIMULATED HARDWARE
+# ==========================================
+
+# Timing model (PN532 over I2C at 100 kHz behind a TCA9548A)
+I2C_OP_S = 0.002            # one command/status/response transfer incl. mux channel select
+DETECT_S = (0.015, 0.040)   # RF time for a PN532 to find a tag that is present
+POLL_S = 0.010              # how often the driver polls the ready bit
+
+class FakePN532:
+    """One simulated reader. The tag it sees is whatever the cabinet has in its slot."""
+
+    def __init__(self, cabinet, key):
+        self.cabinet = cabinet
+        self.key = key
+        self.ready_at = None     # when the pending InListPassiveTarget has an answer
+        self.found = None
+
+    def SAM_configuration(self):
+        pass
+
+    def _transfer(self):
+        with self.cabinet.bus_locks[self.key[0]]:
+            time.sleep(I2C_OP_S)
+
+    def listen_for_passive_target(self, card_baud=0, timeout=1):
+        """Starts a tag search and returns at once; the answer is collected by get_passive_target."""
+        self._transfer()
+        uid = self.cabinet.tags.get(self.key)
+        if uid is not None and random.random() >= self.cabinet.miss_rate:
+            self.ready_at = time.perf_counter() + random.uniform(*DETECT_S)
+            self.found = uid
+        else:
+            self.ready_at = None  # nothing in range (or a missed read): never becomes ready
+            self.found = None
+        return True
+
+    def get_passive_target(self, timeout=1):
+        """The UID found by the pending search, or None if it isn't ready within timeout."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            self._transfer()  # read the ready bit
+            now = time.perf_counter()
+            if self.ready_at is not None and now >= self.ready_at:
+                self._transfer()  # read the response frame
+                self.ready_at = None
+                return self.found
+            if now >= deadline:
+                return None
+            time.sleep(min(POLL_S, deadline - now))
+
+    def read_passive_target(self, card_baud=0, timeout=1):
+        self.listen_for_passive_target(card_baud, timeout)
+        return self.get_passive_target(timeout)
+
+class FakeCabinet:
+    """Simulated cabinet: readers at the given locations and the tags currently in the slots.
+
+    Mutate `tags` ({reader_key: bytes UID}) to take tools out or put them back.
+    """
+
+    def __init__(self, locations, miss_rate=0.0):
+        self.miss_rate = miss_rate
+        self.tags = {}
+        self.readers = {reader_key(loc): FakePN532(self, reader_key(loc)) for loc in locations}
+        self.bus_locks = {key[0]: threading.Lock() for key in self.readers}
+
+    def fill(self, fraction=1.0, seed=None):
+        """Puts a random tag in `fraction` of the slots."""
+        rng = random.Random(seed)
+        for key in self.readers:
+            if rng.random() < fraction:
+                self.tags[key] = bytes(rng.getrandbits(8) for _ in range(7))
+            else:
+                self.tags.pop(key, None)
+
+class FakeRelay:
+    """Lock relay with DigitalOutputDevice's on()/off()."""
+
+    def __init__(self):
+        self.is_active = False
+        self.unlocks = 0
+
+    def on(self):
+        if not self.is_active:
+            self.unlocks += 1
+        self.is_active = True
+
+    def off(self):
+        self.is_active = False
+
+class FakeDoor:
+    """Reed switch with gpiozero Button's interface: is_pressed while the door is shut.
+
+    open()/close() move the door (from any thread) and fire the edge callbacks as
+    gpiozero would. open() only works while the relay is unlocked.
+    """
+
+    def __init__(self, relay=None):
+        self.relay = relay
+        self.is_pressed = True
+        self.when_pressed = None
+        self.when_released = None
+
+    def open(self):
+        if not self.is_pressed or (self.relay and not self.relay.is_active):
+            return False
+        self.is_pressed = False
+        if self.when_released:
+            self.when_released()
+        return True
+
+    def close(self):
+        if self.is_pressed:
+            return
+        self.is_pressed = True
+        if self.when_pressed:
+            self.when_pressed()
@@ -0,0 +1,176 @@
+# cabinet_journal.py
+# Store-and-forward journal for cabinet events on the Pi.
+#
+# Every reconciliation event (checkout, checkin, session end) is first appended to a
+# local SQLite journal (WAL, synchronous=FULL: on disk before record() returns) with a
+# sequence number and the session it belongs to. A background uploader drains the
+# journal to POST /api/cabinet/<id>/events in seq order, in batches, backing off while
+# the server is unreachable. An event is only marked sent once the server acknowledges
+# it; the server ignores seqs it has already applied, so resending after a lost reply
+# is harmless. A WiFi drop now delays events instead of losing them.
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+import requests
+
+JOURNAL_PATH = 'cabinet_journal.db'
+BATCH_SIZE = 50
+UPLOAD_TIMEOUT_S = 5
+BACKOFF_MIN_S = 1
+BACKOFF_MAX_S = 60
+IDLE_WAIT_S = 30          # re-check the journal at least this often
+KEEP_SENT_S = 7 * 86400   # acknowledged events are kept a week for troubleshooting
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        kind TEXT NOT NULL,            -- 'checkout' | 'checkin' | 'session_end'
+        user_id TEXT,
+        tool_uid TEXT,
+        slot INTEGER,
+        created_at TEXT NOT NULL,      -- UTC 'YYYY-MM-DD HH:MM:SS'
+        sent_at REAL                   -- NULL until the server acknowledged it
+    );
+    CREATE INDEX IF NOT EXISTS idx_events_unsent ON events (seq) WHERE sent_at IS NULL;
+'''
+
+def _utc_now():
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+class EventJournal:
+    """One cabinet's journal plus its uploader thread."""
+
+    def __init__(self, server_url, cabinet_id, path=JOURNAL_PATH, batch_size=BATCH_SIZE):
+        self.url = f"{server_url}/api/cabinet/{cabinet_id}/events"
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'journal_id'").fetchone()
+        if row:
+            self.journal_id = row[0]
+        else:  # a recreated journal restarts seq at 1, so the server keys events by journal too
+            self.journal_id = uuid.uuid4().hex
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('journal_id', ?)", (self.journal_id,))
+        self.session = requests.Session()
+        self.uploads = 0
+        self.failures = 0
+        self.upload_latencies = deque(maxlen=1000)   # seconds per acknowledged upload
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, session_id, kind, user_id=None, tool_uid=None, slot=None):
+        """Appends one event (durable on return) and nudges the uploader. Returns its seq."""
+        with self._lock:
+            seq = self.conn.execute('''
+                INSERT INTO events (session_id, kind, user_id, tool_uid, slot, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (session_id, kind, user_id, tool_uid, slot, _utc_now())).lastrowid
+        self._wake.set()
+        return seq
+
+    def record_session(self, session_id, user_id, changes):
+        """Appends a finished door session [(kind, tool_uid, slot)] plus its session_end
+        in one transaction, so the uploader never sees half a session. Returns the last seq."""
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                created_at = _utc_now()
+                for kind, tool_uid, slot in changes:
+                    self.conn.execute('''
+                        INSERT INTO events (session_id, kind, user_id, tool_uid, slot, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (session_id, kind, user_id, tool_uid, slot, created_at))
+                seq = self.conn.execute('''
+                    INSERT INTO events (session_id, kind, user_id, created_at) VALUES (?, 'session_end', ?, ?)
+                ''', (session_id, user_id, created_at)).lastrowid
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        self._wake.set()
+        return seq
+
+    def pending_count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM events WHERE sent_at IS NULL').fetchone()[0]
+
+    def upload_batch(self):
+        """Sends the oldest unsent events. Returns how many were acknowledged, or None on failure."""
+        with self._lock:
+            # Whole sessions only: the server applies one upload in one transaction, so a
+            # session's checkouts, checkins and session end land together or not at all
+            rows = self.conn.execute('''
+                SELECT seq, session_id, kind, user_id, tool_uid, slot, created_at
+                FROM events
+                WHERE sent_at IS NULL AND (seq IN (SELECT seq FROM events WHERE sent_at IS NULL ORDER BY seq LIMIT ?)
+                                           OR session_id IN (SELECT session_id FROM events WHERE sent_at IS NULL
+                                                             ORDER BY seq LIMIT ?))
+                ORDER BY seq
+            ''', (self.batch_size, self.batch_size)).fetchall()
+        if not rows:
+            return 0
+        events = [dict(zip(('seq', 'session_id', 'kind', 'user_id', 'tool_uid', 'slot', 'created_at'), row))
+                  for row in rows]
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.url, json={'journal_id': self.journal_id, 'events': events},
+                                         timeout=UPLOAD_TIMEOUT_S)
+            if response.status_code != 200:
+                print(f"⚠️ Journal upload rejected ({response.status_code}): {response.text[:200]}")
+                return None
+            acked_through = response.json().get('acked_through')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"⚠️ Journal upload failed: {e}")
+            return None
+        if acked_through is None:
+            return None
+        with self._lock:
+            acked = self.conn.execute('UPDATE events SET sent_at = ? WHERE sent_at IS NULL AND seq <= ?',
+                                      (time.time(), acked_through)).rowcount
+            self.conn.execute('DELETE FROM events WHERE sent_at < ?', (time.time() - KEEP_SENT_S,))
+        self.uploads += 1
+        self.upload_latencies.append(time.perf_counter() - started)
+        return acked
+
+    def _run(self):
+        backoff = BACKOFF_MIN_S
+        while not self._stop.is_set():
+            acked = self.upload_batch()
+            if acked is None:
+                self.failures += 1
+                self._stop.wait(backoff)  # server down: don't spin, and don't give up
+                backoff = min(backoff * 2, BACKOFF_MAX_S)
+                continue
+            backoff = BACKOFF_MIN_S
+            if acked == 0:
+                self._wake.wait(IDLE_WAIT_S)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='journal-upload', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush_timeout=5):
+        """Tries to drain what's left for up to flush_timeout seconds, then stops the uploader."""
+        deadline = time.time() + flush_timeout
+        while self.pending_count() and time.time() < deadline:
+            time.sleep(0.1)
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        self.conn.close()
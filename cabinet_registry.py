@@ -0,0 +1,231 @@
+# cabinet_registry.py
+# Server-side cabinet configuration: where each NFC reader of a cabinet is wired.
+#
+# A slot map is served to the cabinet's Pi (GET /api/cabinet/<id>/slot-map) so adding
+# slots or a second multiplexer is a server edit, not a script change on every Pi.
+#   {'cabinet_id', 'version', 'user_reader': {bus, mux, channel},
+#    'slots': [{'slot', 'bus', 'mux', 'channel'}, ...]}
+# bus = I2C bus number, mux = TCA9548A address (0x70-0x77), channel = mux port (0-7).
+#
+# Cabinet events (checkouts/checkins reconciled on the Pi) arrive through the Pi's
+# store-and-forward journal (cabinet_journal.py) and may be delivered more than once.
+# cabinet_events records every (cabinet, journal, seq) applied, in the same transaction
+# as the checkout/checkin itself, so a replayed event is acknowledged but not re-applied.
+#
+# A whole session can also be reconciled in one request (POST /api/cabinet/<id>/reconcile)
+# from the baseline and final snapshots; cabinet_sessions keeps each session's per-slot
+# results so a retried request gets the same answer instead of a second checkout.
+import json
+import sqlite3
+from datetime import datetime
+from cabinet_scanner import diff_snapshots
+
+USER_READER_SLOT = 0   # the badge reader is stored as slot 0
+EVENT_KINDS = ('checkout', 'checkin', 'session_end')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS cabinets (
+        cabinet_id TEXT PRIMARY KEY,
+        name TEXT,
+        slot_map_version INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS cabinet_slots (
+        cabinet_id TEXT NOT NULL,
+        slot INTEGER NOT NULL,
+        bus INTEGER NOT NULL DEFAULT 1,
+        mux INTEGER NOT NULL DEFAULT 112,
+        channel INTEGER NOT NULL,
+        PRIMARY KEY (cabinet_id, slot)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS cabinet_events (
+        cabinet_id TEXT NOT NULL,
+        journal_id TEXT NOT NULL,        -- the Pi journal's identity (seq restarts if it is recreated)
+        seq INTEGER NOT NULL,
+        session_id TEXT,
+        kind TEXT NOT NULL,              -- 'checkout' | 'checkin' | 'session_end'
+        user_id TEXT,
+        tool_uid TEXT,
+        slot INTEGER,
+        created_at TEXT NOT NULL,        -- UTC, when it happened at the cabinet
+        received_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        result TEXT,                     -- 'applied' or why it was not
+        PRIMARY KEY (cabinet_id, journal_id, seq)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS cabinet_sessions (
+        cabinet_id TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        user_id TEXT,
+        results TEXT NOT NULL,           -- JSON list of per-slot results
+        reconciled_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (cabinet_id, session_id)
+    ) WITHOUT ROWID;
+'''
+
+def get_db_connection():
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+def init_cabinet_registry(db_path='database.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_slot_map(conn, cabinet_id):
+    """The cabinet's slot map, or None if it has never been configured."""
+    cabinet = conn.execute('SELECT slot_map_version FROM cabinets WHERE cabinet_id = ?', (cabinet_id,)).fetchone()
+    if not cabinet:
+        return None
+    slot_map = {'cabinet_id': cabinet_id, 'version': cabinet[0], 'user_reader': None, 'slots': []}
+    for slot, bus, mux, channel in conn.execute(
+            'SELECT slot, bus, mux, channel FROM cabinet_slots WHERE cabinet_id = ? ORDER BY slot', (cabinet_id,)):
+        location = {'bus': bus, 'mux': mux, 'channel': channel}
+        if slot == USER_READER_SLOT:
+            slot_map['user_reader'] = location
+        else:
+            slot_map['slots'].append({'slot': slot, **location})
+    return slot_map
+
+def _location(entry, what):
+    try:
+        bus, mux, channel = int(entry.get('bus', 1)), int(entry.get('mux', 0x70)), int(entry['channel'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{what}: needs integer bus, mux and channel")
+    if not 0x70 <= mux <= 0x77 or not 0 <= channel <= 7 or bus < 0:
+        raise ValueError(f"{what}: mux must be 0x70-0x77 and channel 0-7")
+    return bus, mux, channel
+
+def set_slot_map(conn, cabinet_id, slot_map, name=None):
+    """Replaces the cabinet's slot map and bumps its version; the caller commits."""
+    rows = []
+    if slot_map.get('user_reader'):
+        rows.append((USER_READER_SLOT, *_location(slot_map['user_reader'], 'user_reader')))
+    for entry in slot_map.get('slots', []):
+        slot = entry.get('slot')
+        if not isinstance(slot, int) or slot <= USER_READER_SLOT:
+            raise ValueError(f"Slot numbers must be positive integers (got {slot!r})")
+        rows.append((slot, *_location(entry, f"slot {slot}")))
+    if len({r[0] for r in rows}) != len(rows):
+        raise ValueError("Duplicate slot number")
+    if len({r[1:] for r in rows}) != len(rows):
+        raise ValueError("Two slots share the same bus/mux/channel")
+
+    conn.execute('''
+        INSERT INTO cabinets (cabinet_id, name, slot_map_version) VALUES (?, ?, 1)
+        ON CONFLICT (cabinet_id) DO UPDATE SET slot_map_version = slot_map_version + 1,
+                                               name = COALESCE(excluded.name, name)
+    ''', (cabinet_id, name))
+    conn.execute('DELETE FROM cabinet_slots WHERE cabinet_id = ?', (cabinet_id,))
+    conn.executemany('INSERT INTO cabinet_slots (cabinet_id, slot, bus, mux, channel) VALUES (?, ?, ?, ?, ?)',
+                     [(cabinet_id, *row) for row in rows])
+    return get_slot_map(conn, cabinet_id)
+
+# ==========================================
+#           EVENT INGEST
+# ==========================================
+
+def ingest_events(conn, cabinet_id, journal_id, events, apply):
+    """Records and applies a batch of journal events in seq order; the caller commits.
+
+    apply(event) -> result string, called once per event not seen before. If it raises,
+    whatever it wrote is rolled back and the event is recorded as rejected, so one bad
+    event can't hold up the rest of the journal.
+    Returns {'acked_through', 'applied', 'duplicates', 'new': [events applied]}.
+    """
+    if not journal_id or not isinstance(journal_id, str):
+        raise ValueError("journal_id is required")
+    if not isinstance(events, list):
+        raise ValueError("events must be a list")
+    for event in events:
+        if (not isinstance(event, dict) or event.get('kind') not in EVENT_KINDS
+                or not isinstance(event.get('seq'), int) or not isinstance(event.get('created_at'), str)):
+            raise ValueError(f"Bad event: {event!r}")
+        datetime.strptime(event['created_at'], '%Y-%m-%d %H:%M:%S')  # ValueError if malformed
+        if event['kind'] != 'session_end' and not all(
+                isinstance(event.get(field), str) and event[field] for field in ('user_id', 'tool_uid')):
+            raise ValueError(f"Bad event (user_id and tool_uid must be non-empty strings): {event!r}")
+        if (any(event.get(field) is not None and not isinstance(event[field], str)
+                for field in ('session_id', 'user_id', 'tool_uid'))
+                or event.get('slot') is not None and not isinstance(event['slot'], int)):
+            raise ValueError(f"Bad event (session_id/user_id/tool_uid must be strings, slot an integer): {event!r}")
+
+    applied, duplicates, new = 0, 0, []
+    acked_through = None
+    for event in sorted(events, key=lambda e: e['seq']):
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO cabinet_events
+                (cabinet_id, journal_id, seq, session_id, kind, user_id, tool_uid, slot, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (cabinet_id, journal_id, event['seq'], event.get('session_id'), event['kind'],
+              event.get('user_id'), event.get('tool_uid'), event.get('slot'), event['created_at']))
+        acked_through = event['seq']
+        if cursor.rowcount == 0:
+            duplicates += 1
+            continue
+        conn.execute('SAVEPOINT cabinet_event')
+        try:
+            result = apply(event)
+        except Exception as e:
+            conn.execute('ROLLBACK TO cabinet_event')
+            print(f"❌ Cabinet event {cabinet_id}/{journal_id}#{event['seq']} failed: {e}")
+            result = f"rejected: {e}"
+        conn.execute('RELEASE cabinet_event')
+        conn.execute('UPDATE cabinet_events SET result = ? WHERE cabinet_id = ? AND journal_id = ? AND seq = ?',
+                     (result, cabinet_id, journal_id, event['seq']))
+        applied += 1
+        new.append(event)
+    return {'acked_through': acked_through, 'applied': applied, 'duplicates': duplicates, 'new': new}
+
+# ==========================================
+#           SESSION RECONCILE
+# ==========================================
+
+ACTIONS = ('REMOVED', 'RETURNED')
+
+def _snapshot(raw, what):
+    """JSON snapshot {"slot": uid or null} -> {int slot: uid or None}."""
+    if not isinstance(raw, dict):
+        raise ValueError(f"{what} must be an object of slot -> tool UID")
+    if any(uid is not None and not isinstance(uid, str) for uid in raw.values()):
+        raise ValueError(f"{what}: tool UIDs must be strings (or null for an empty slot)")
+    try:
+        return {int(slot): uid or None for slot, uid in raw.items()}
+    except (TypeError, ValueError):
+        raise ValueError(f"{what}: slot numbers must be integers")
+
+def session_changes(data):
+    """[(action, uid, slot)] from a reconcile body: 'baseline' + 'final' snapshots, or 'changes'."""
+    if 'changes' in data:
+        changes = []
+        if not isinstance(data['changes'] or [], list):
+            raise ValueError("changes must be a list")
+        for change in data['changes'] or []:
+            if (not isinstance(change, dict) or change.get('action') not in ACTIONS
+                    or not isinstance(change.get('uid'), str) or not change['uid']
+                    or change.get('slot') is not None and not isinstance(change['slot'], int)):
+                raise ValueError(f"Bad change: {change!r}")
+            changes.append((change['action'], change['uid'], change.get('slot')))
+        return changes
+    if 'baseline' not in data or 'final' not in data:
+        raise ValueError("Send either 'baseline' and 'final' snapshots or 'changes'")
+    return diff_snapshots(_snapshot(data['baseline'], 'baseline'), _snapshot(data['final'], 'final'))
+
+def get_session_results(conn, cabinet_id, session_id):
+    """Stored per-slot results of an already reconciled session, or None."""
+    row = conn.execute('SELECT results FROM cabinet_sessions WHERE cabinet_id = ? AND session_id = ?',
+                       (cabinet_id, session_id)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_session_results(conn, cabinet_id, session_id, user_id, results):
+    """Records a reconciled session in the caller's transaction."""
+    conn.execute('INSERT INTO cabinet_sessions (cabinet_id, session_id, user_id, results) VALUES (?, ?, ?, ?)',
+                 (cabinet_id, session_id, user_id, json.dumps(results)))
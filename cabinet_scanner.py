@@ -0,0 +1,195 @@
+# cabinet_scanner.py
+# Scan engine for cabinets with many NFC tool slots spread over TCA9548A multiplexers.
+#
+# The slot map (which reader sits on which bus / mux / channel) comes from the server
+# (GET /api/cabinet/<id>/slot-map), with a local copy for when the server is down.
+#
+# A snapshot no longer costs one full read timeout per slot:
+#   - each I2C bus gets its own worker thread, so independent buses are read at once;
+#   - on a bus, every reader is told to start searching first (listen_for_passive_target),
+#     then the pending ones are polled round-robin, so all PN532s search in parallel and
+#     the bus only carries the short command/status/response transfers;
+#   - the search window adapts to how fast tags have actually been answering, and a slot
+#     that reads empty is searched again (and, if it held a tool, once more at full length)
+#     before it is reported as empty (a missed read is not a checkout);
+#   - while the door stays shut, the last snapshot is reused as the next session's
+#     baseline, and idle polling visits long-unchanged slots less often.
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from cabinet_hardware import reader_key
+
+SLOT_MAP_CACHE = 'slot_map.json'
+
+# Today's wiring: one mux on the Pi's I2C bus, badge reader on port 2, tools on ports 3 and 6
+DEFAULT_SLOT_MAP = {
+    'cabinet_id': None,
+    'version': 0,
+    'user_reader': {'bus': 1, 'mux': 0x70, 'channel': 2},
+    'slots': [
+        {'slot': 1, 'bus': 1, 'mux': 0x70, 'channel': 3},
+        {'slot': 2, 'bus': 1, 'mux': 0x70, 'channel': 6},
+    ],
+}
+
+INITIAL_WINDOW_S = 0.2   # search window before any tag has been timed (the old snapshot timeout)
+MIN_WINDOW_S = 0.06
+MAX_WINDOW_S = 0.5
+WINDOW_MARGIN = 2.0      # window = margin x slowest recent tag detection
+CONFIRM_WINDOW_S = 0.25  # last look at a slot that held a tool and still reads empty
+PROBE_S = 0.001          # ready-bit check while polling pending searches round-robin
+CACHE_TTL_S = 300        # a door-closed snapshot is trusted as the next baseline this long
+STABLE_SCANS = 5         # idle polls a slot must stay unchanged ...
+STABLE_EVERY = 4         # ... before it is only polled every Nth idle poll
+
+def format_uid(uid):
+    return " ".join("{:02x}".format(i) for i in uid)
+
+def load_slot_map(server_url, cabinet_id, cache_path=SLOT_MAP_CACHE):
+    """Server slot map, else the last one we saved, else DEFAULT_SLOT_MAP."""
+    try:
+        response = requests.get(f"{server_url}/api/cabinet/{cabinet_id}/slot-map", timeout=2)
+        if response.status_code == 200:
+            slot_map = response.json()
+            with open(f"{cache_path}.tmp", 'w') as f:
+                json.dump(slot_map, f)
+            os.replace(f"{cache_path}.tmp", cache_path)
+            return slot_map
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️ Slot map fetch failed ({e}); using local copy.")
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+    return DEFAULT_SLOT_MAP
+
+def diff_snapshots(before, after):
+    """[(action, uid, slot)] for 'REMOVED' / 'RETURNED'; a swapped slot yields both."""
+    events = []
+    for slot in sorted(set(before) | set(after)):
+        old_uid, new_uid = before.get(slot), after.get(slot)
+        if old_uid == new_uid:
+            continue
+        if old_uid:
+            events.append(('REMOVED', old_uid, slot))
+        if new_uid:
+            events.append(('RETURNED', new_uid, slot))
+    return events
+
+class CabinetScanner:
+    """Snapshots the tool slots of one cabinet. readers: {reader_key: PN532-like}."""
+
+    def __init__(self, slot_map, readers):
+        self.readers = {}
+        self.by_bus = {}
+        for slot in slot_map['slots']:
+            key = reader_key(slot)
+            if key not in readers:
+                print(f"⚠️ Slot {slot['slot']}: no reader at bus {key[0]} mux {key[1]:#x} port {key[2]}")
+                continue
+            self.readers[slot['slot']] = readers[key]
+            self.by_bus.setdefault(key[0], []).append(slot['slot'])
+        self.state = {slot: None for slot in self.readers}   # slot -> UID string or None
+        self.unchanged = {slot: 0 for slot in self.readers}  # consecutive idle polls without change
+        self.detections = deque(maxlen=50)                   # recent tag detection times (s)
+        self.cached_at = None
+        self.polls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.by_bus), 1), thread_name_prefix='nfc-bus')
+
+    def window(self):
+        with self._lock:
+            if not self.detections:
+                return INITIAL_WINDOW_S
+            return min(max(WINDOW_MARGIN * max(self.detections), MIN_WINDOW_S), MAX_WINDOW_S)
+
+    def _search(self, slots, window):
+        """One pipelined pass over slots on one bus -> {slot: UID string or None}; unreadable slots left out.
+
+        Every reader starts searching, then the pending ones are polled round-robin until
+        they answer or the window closes, so an empty slot never holds up its neighbours.
+        """
+        listened = {}
+        for slot in slots:
+            try:
+                self.readers[slot].listen_for_passive_target()
+                listened[slot] = time.perf_counter()
+            except (RuntimeError, OSError):
+                self.errors += 1
+        found = {}
+        deadline = time.perf_counter() + window
+        while listened:
+            for slot, listened_at in list(listened.items()):
+                try:
+                    uid = self.readers[slot].get_passive_target(timeout=PROBE_S)
+                except (RuntimeError, OSError):
+                    self.errors += 1
+                    del listened[slot]
+                    continue
+                if uid:
+                    with self._lock:
+                        self.detections.append(time.perf_counter() - listened_at)
+                    found[slot] = format_uid(uid)
+                    del listened[slot]
+            if time.perf_counter() >= deadline:
+                break
+            time.sleep(PROBE_S)
+        found.update({slot: None for slot in listened})
+        return found
+
+    def _scan_bus(self, slots, expected):
+        window = self.window()
+        found = self._search(slots, window)
+        # Empty slots get a second look (a present tag occasionally misses one search), and a
+        # tool that was there and still reads empty gets a full-length third before it counts as gone
+        empty = [slot for slot in slots if slot in found and not found[slot]]
+        if empty:
+            found.update({slot: uid for slot, uid in self._search(empty, window).items() if uid})
+        recheck = [slot for slot in empty if expected.get(slot) and not found[slot]]
+        if recheck:
+            found.update({slot: uid for slot, uid in self._search(recheck, CONFIRM_WINDOW_S).items() if uid})
+        return found
+
+    def _scan(self, slots_by_bus):
+        expected = dict(self.state)
+        futures = [self._pool.submit(self._scan_bus, slots, expected) for slots in slots_by_bus.values() if slots]
+        found = {}
+        for future in futures:
+            found.update(future.result())
+        return found
+
+    def snapshot(self, use_cache=False):
+        """{slot: UID string or None} for every slot. use_cache: reuse the last snapshot if still trusted."""
+        if use_cache and self.cached_at and time.time() - self.cached_at < CACHE_TTL_S:
+            return dict(self.state)
+        found = self._scan(self.by_bus)
+        for slot, uid in found.items():  # unreadable slots keep their last known value
+            if uid != self.state[slot]:
+                self.unchanged[slot] = 0
+            self.state[slot] = uid
+        self.cached_at = time.time()
+        return dict(self.state)
+
+    def invalidate(self):
+        """Door opened: the next baseline must be a real scan."""
+        self.cached_at = None
+
+    def poll(self):
+        """Idle re-scan (door shut). Returns diff_snapshots events; long-stable slots are visited less often."""
+        self.polls += 1
+        due = {bus: [slot for slot in slots
+                     if self.unchanged[slot] < STABLE_SCANS or self.polls % STABLE_EVERY == 0]
+               for bus, slots in self.by_bus.items()}
+        found = self._scan(due)
+        before = {slot: self.state[slot] for slot in found}
+        for slot, uid in found.items():
+            self.unchanged[slot] = self.unchanged[slot] + 1 if uid == self.state[slot] else 0
+            self.state[slot] = uid
+        return diff_snapshots(before, found)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
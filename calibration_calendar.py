@@ -0,0 +1,113 @@
+# calibration_calendar.py
+# Per-day calibration due counts, broken down by model and status, kept current by
+# triggers on every write to tools (routes, seed scripts, bulk applies alike).
+# A quarter or a year of calendar is one primary-key range scan instead of a
+# GROUP BY over every tool.
+import sqlite3
+
+SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_tools_calibration_due ON tools (calibration_due);
+
+    CREATE TABLE IF NOT EXISTS calibration_calendar (
+        due_date TEXT NOT NULL,
+        model TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (due_date, model, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS calendar_tools_insert AFTER INSERT ON tools
+    WHEN NEW.calibration_due IS NOT NULL
+    BEGIN
+        INSERT INTO calibration_calendar (due_date, model, status, count)
+        VALUES (NEW.calibration_due, COALESCE(NEW.model, ''), NEW.status, 1)
+        ON CONFLICT (due_date, model, status) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS calendar_tools_delete AFTER DELETE ON tools
+    WHEN OLD.calibration_due IS NOT NULL
+    BEGIN
+        UPDATE calibration_calendar SET count = count - 1
+        WHERE due_date = OLD.calibration_due AND model = COALESCE(OLD.model, '') AND status = OLD.status;
+        DELETE FROM calibration_calendar
+        WHERE due_date = OLD.calibration_due AND model = COALESCE(OLD.model, '') AND status = OLD.status AND count <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS calendar_tools_update AFTER UPDATE OF calibration_due, model, status ON tools
+    WHEN OLD.calibration_due IS NOT NEW.calibration_due OR OLD.model IS NOT NEW.model OR OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE calibration_calendar SET count = count - 1
+        WHERE OLD.calibration_due IS NOT NULL
+          AND due_date = OLD.calibration_due AND model = COALESCE(OLD.model, '') AND status = OLD.status;
+        DELETE FROM calibration_calendar
+        WHERE due_date = OLD.calibration_due AND model = COALESCE(OLD.model, '') AND status = OLD.status AND count <= 0;
+        INSERT INTO calibration_calendar (due_date, model, status, count)
+        SELECT NEW.calibration_due, COALESCE(NEW.model, ''), NEW.status, 1
+        WHERE NEW.calibration_due IS NOT NULL
+        ON CONFLICT (due_date, model, status) DO UPDATE SET count = count + 1;
+    END;
+'''
+
+def get_db_connection():
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+def rebuild_calendar(conn):
+    """Recounts the whole calendar from tools (startup self-heal, bulk loads that bypass triggers)."""
+    conn.execute('DELETE FROM calibration_calendar')
+    conn.execute('''
+        INSERT INTO calibration_calendar (due_date, model, status, count)
+        SELECT calibration_due, COALESCE(model, ''), status, COUNT(*)
+        FROM tools WHERE calibration_due IS NOT NULL
+        GROUP BY calibration_due, COALESCE(model, ''), status
+    ''')
+
+def _in_sync(conn):
+    total = conn.execute('SELECT COALESCE(SUM(count), 0) FROM calibration_calendar').fetchone()[0]
+    expected = conn.execute('SELECT COUNT(*) FROM tools WHERE calibration_due IS NOT NULL').fetchone()[0]
+    return total == expected
+
+def init_calendar(db_path='database.db'):
+    """Creates the table/triggers/index and rebuilds the counts if they drifted (or never existed)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+        if not _in_sync(conn):
+            rebuild_calendar(conn)
+            print("📅 Calibration calendar rebuilt from tools.")
+        conn.commit()
+    finally:
+        conn.close()
+
+# ==========================================
+#               QUERIES
+# ==========================================
+
+def day_totals(conn, start_date, end_date):
+    """{date: count} for start_date <= date < end_date."""
+    rows = conn.execute('''
+        SELECT due_date, SUM(count) FROM calibration_calendar
+        WHERE due_date >= ? AND due_date < ?
+        GROUP BY due_date
+    ''', (start_date, end_date)).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+def day_buckets(conn, start_date, end_date):
+    """{date: {'total', 'by_model': {...}, 'by_status': {...}}} for start_date <= date < end_date."""
+    rows = conn.execute('''
+        SELECT due_date, model, status, count FROM calibration_calendar
+        WHERE due_date >= ? AND due_date < ?
+    ''', (start_date, end_date)).fetchall()
+    days = {}
+    for due_date, model, status, count in rows:
+        day = days.get(due_date)
+        if day is None:
+            day = days[due_date] = {'total': 0, 'by_model': {}, 'by_status': {}}
+        day['total'] += count
+        day['by_model'][model] = day['by_model'].get(model, 0) + count
+        day['by_status'][status] = day['by_status'].get(status, 0) + count
+    return days
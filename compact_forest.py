@@ -0,0 +1,161 @@
+# compact_forest.py
+# Flattens the trained RandomForestRegressor into a handful of contiguous NumPy arrays
+# and evaluates it with NumPy only (no sklearn needed, so it also runs on the cabinet Pi).
+#
+# Layout: all trees' nodes are concatenated. Leaves point to themselves, so evaluation
+# steps every (tree, row) pair one level down per pass and drops pairs that reached a leaf.
+#
+# Usage: python compact_forest.py [--quantize] [--max-depth N] [--out calibration_forest.npz]
+import argparse
+import numpy as np
+
+COMPACT_MODEL_PATH = 'calibration_forest.npz'
+BATCH_ROWS = 4096  # bounds the (trees x rows) working set during predict
+
+# ==========================================
+#               EXPORT
+# ==========================================
+
+def _node_depths(tree):
+    """Depth of every node, computed level by level."""
+    depth = np.zeros(tree.node_count, dtype=np.int64)
+    frontier, level = np.array([0]), 0
+    while len(frontier):
+        depth[frontier] = level
+        internal = frontier[tree.children_left[frontier] != -1]
+        frontier = np.concatenate([tree.children_left[internal], tree.children_right[internal]])
+        level += 1
+    return depth
+
+def _flatten_tree(tree, max_depth=None):
+    """Returns (feature, threshold, left, right, value, depth) for one sklearn tree, with local
+    indices. With max_depth, nodes at that depth become leaves (they keep their mean value)
+    and everything below them is dropped."""
+    depth = _node_depths(tree)
+    if max_depth is None:
+        keep = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+    else:
+        keep = np.flatnonzero(depth <= max_depth)
+        is_leaf = (tree.children_left[keep] == -1) | (depth[keep] == max_depth)
+
+    new_index = np.full(tree.node_count, -1, dtype=np.int64)
+    new_index[keep] = np.arange(len(keep))
+    local = np.arange(len(keep))
+    left = np.where(is_leaf, local, new_index[tree.children_left[keep]])
+    right = np.where(is_leaf, local, new_index[tree.children_right[keep]])
+
+    feature = np.where(is_leaf, 0, tree.feature[keep])
+    threshold = np.where(is_leaf, np.inf, tree.threshold[keep])
+    value = tree.value[keep, 0, 0].astype(np.float64)
+    return feature, threshold, left, right, value, int(depth[keep].max())
+
+def _float32_floor(threshold):
+    """Largest float32 <= each threshold. sklearn compares float32 inputs against float64
+    thresholds, so `x <= floor32(t)` gives exactly the same split as `x <= t`: lossless."""
+    t32 = threshold.astype(np.float32)
+    too_high = t32.astype(np.float64) > threshold
+    t32[too_high] = np.nextafter(t32[too_high], np.float32(-np.inf))
+    return t32
+
+def export_forest(model, quantize=False, max_depth=None):
+    """Flattens a fitted RandomForestRegressor (single output) into a dict of arrays.
+
+    quantize=True stores thresholds as float32 (without changing any split) and leaf values
+    as uint16 codes plus a scale/offset. max_depth prunes every tree to that depth.
+    """
+    parts, roots, offset, depth = [], [], 0, 0
+    for estimator in model.estimators_:
+        feature, threshold, left, right, value, tree_depth = _flatten_tree(estimator.tree_, max_depth)
+        parts.append((feature, threshold, left + offset, right + offset, value))
+        roots.append(offset)
+        offset += len(feature)
+        depth = max(depth, tree_depth)
+
+    feature, threshold, left, right, value = (np.concatenate(col) for col in zip(*parts))
+    forest = {
+        'feature': feature.astype(np.uint8 if model.n_features_in_ <= 255 else np.int32),
+        'left': left.astype(np.int32),
+        'right': right.astype(np.int32),
+        'roots': np.array(roots, dtype=np.int32),
+        'depth': np.array(depth, dtype=np.int32),
+        'n_features': np.array(model.n_features_in_, dtype=np.int32),
+    }
+    if quantize:
+        low, high = float(value.min()), float(value.max())
+        scale = (high - low) / 65535.0 or 1.0
+        forest['threshold'] = _float32_floor(threshold)
+        forest['value_q'] = np.round((value - low) / scale).astype(np.uint16)
+        forest['value_scale'] = np.array([scale, low], dtype=np.float64)
+    else:
+        forest['threshold'] = threshold
+        forest['value'] = value
+    return forest
+
+def save_forest(forest, path=COMPACT_MODEL_PATH):
+    np.savez(path, **forest)
+
+def load_forest(path=COMPACT_MODEL_PATH):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def forest_nbytes(forest):
+    return sum(arr.nbytes for arr in forest.values())
+
+# ==========================================
+#               EVALUATION
+# ==========================================
+
+def _leaf_values(forest):
+    if 'value' in forest:
+        return forest['value']
+    scale, low = forest['value_scale']
+    return forest['value_q'].astype(np.float64) * scale + low
+
+def predict(forest, X, values=None):
+    """Vectorized batch evaluation; matches RandomForestRegressor.predict (X is compared as float32, like sklearn)."""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X[None, :]
+    if values is None:
+        values = _leaf_values(forest)
+    feature, threshold = forest['feature'], forest['threshold']
+    left, right, roots = forest['left'], forest['right'], forest['roots']
+    depth = int(forest['depth'])
+
+    n_trees = len(roots)
+    out = np.empty(len(X))
+    for start in range(0, len(X), BATCH_ROWS):
+        batch = X[start:start + BATCH_ROWS]
+        n = len(batch)
+        flat = batch.ravel()
+        node = np.repeat(roots, n)                                          # tree-major (trees * rows)
+        row_base = np.tile(np.arange(n, dtype=np.int64) * batch.shape[1], n_trees)
+        active = np.arange(len(node))
+        for _ in range(depth):
+            current = node[active]
+            x = flat[row_base[active] + feature[current]]
+            step = np.where(x <= threshold[current], left[current], right[current])
+            node[active] = step
+            active = active[step != current]  # leaves point to themselves
+            if not len(active):
+                break
+        out[start:start + n] = values[node].reshape(n_trees, n).mean(axis=0)
+    return out
+
+if __name__ == "__main__":
+    import predictive_calibration
+
+    parser = argparse.ArgumentParser(description="Export the calibration forest to compact NumPy arrays.")
+    parser.add_argument('--quantize', action='store_true')
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--out', default=COMPACT_MODEL_PATH)
+    args = parser.parse_args()
+
+    bundle = predictive_calibration.get_model()
+    if not bundle:
+        raise SystemExit("❌ No model available. Run 'generate_training_data.py' first.")
+    forest = export_forest(bundle['model'], quantize=args.quantize, max_depth=args.max_depth)
+    save_forest(forest, args.out)
+    print(f"✅ Exported model v{bundle['version']} to {args.out}: "
+          f"{len(forest['feature'])} nodes, depth {int(forest['depth'])}, {forest_nbytes(forest) / 1e6:.1f} MB")
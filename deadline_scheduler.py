@@ -0,0 +1,221 @@
+# deadline_scheduler.py
+# FOD checkout deadlines: warn the holder at 7h, alert the supervisor at 8h and every
+# 4h after that while the tool is still out.
+#
+# Deadlines are registered when a tool is checked out and cancelled when it comes back,
+# kept in a heap and fired by one thread that sleeps until the earliest one, so timing
+# no longer depends on someone loading the dashboard and nothing is scanned per tick.
+# On startup the heap is rebuilt from the open checkouts in the database.
+#
+# Deadlines within DIGEST_WINDOW_S of the earliest one fire as one batch, sent once the
+# last of them is due (never before any of their own deadlines, at most DIGEST_WINDOW_S
+# after the first): one digest message per chat, one UPDATE stamping last_alert_sent,
+# one commit.
+import calendar
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import telegram_manager
+except ImportError:
+    telegram_manager = None
+
+WARNING_AFTER_S = 7 * 3600
+CRITICAL_AFTER_S = 8 * 3600
+REALERT_EVERY_S = 4 * 3600
+DIGEST_WINDOW_S = 60           # deadlines this close together go out in the same digest (held for the last one)
+SQL_BATCH = 500                # ids per IN (...) list, under SQLite's variable limit
+
+_lock = threading.Lock()
+_wakeup = threading.Condition(_lock)
+_heap = []                     # [fire_at, seq, entry]
+_by_tool = {}                  # tool_id -> live entries (for O(1) cancel)
+_seq = itertools.count()
+_thread = None
+_start_lock = threading.Lock()    # concurrent first requests start one timer
+_sender = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fod-send')  # slow HTTP never delays the timer
+
+def get_db_connection():
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _utc_epoch(timestamp):
+    """SQLite CURRENT_TIMESTAMP string (UTC) -> epoch seconds."""
+    return calendar.timegm(time.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S'))
+
+# ==========================================
+#           REGISTRATION
+# ==========================================
+
+def _push(fire_at, tool_id, kind, tx_id, user_id):
+    # caller holds _lock
+    entry = {'fire_at': fire_at, 'tool_id': tool_id, 'kind': kind, 'tx_id': tx_id,
+             'user_id': user_id, 'cancelled': False}
+    heapq.heappush(_heap, [fire_at, next(_seq), entry])
+    _by_tool.setdefault(tool_id, []).append(entry)
+    if _heap[0][2] is entry:
+        _wakeup.notify()  # new earliest deadline: re-arm the sleep
+
+def _cancel(tool_id):
+    # caller holds _lock. Entries stay in the heap flagged; they're dropped when they surface.
+    for entry in _by_tool.pop(tool_id, []):
+        entry['cancelled'] = True
+
+def register_checkout(tool_id, user_id, tx_id, checked_out_at=None):
+    """Call after a checkout commits. Replaces any deadlines left from an earlier checkout."""
+    start = checked_out_at if checked_out_at is not None else time.time()
+    with _lock:
+        _cancel(tool_id)
+        _push(start + WARNING_AFTER_S, tool_id, 'warning', tx_id, user_id)
+        _push(start + CRITICAL_AFTER_S, tool_id, 'critical', tx_id, user_id)
+
+def cancel_checkout(tool_id):
+    """Call after a checkin (or anything that takes the tool out of 'In Use') commits."""
+    with _lock:
+        _cancel(tool_id)
+
+def pending_count():
+    with _lock:
+        return sum(len(entries) for entries in _by_tool.values())
+
+def rebuild_from_db(conn=None):
+    """Re-registers deadlines for every open checkout, honouring alerts already sent."""
+    should_close = False
+    if conn is None:
+        conn = get_db_connection()
+        should_close = True
+    try:
+        rows = conn.execute('''
+            SELECT t.id AS tool_id, t.current_holder, tr.id AS tx_id, tr.timestamp, tr.last_alert_sent
+            FROM tools t
+            JOIN transactions tr ON tr.id = (SELECT MAX(id) FROM transactions
+                                             WHERE tool_id = t.id AND type = 'checkout')
+            WHERE t.status = 'In Use'
+        ''').fetchall()
+    finally:
+        if should_close:
+            conn.close()
+
+    now = time.time()
+    with _lock:
+        _heap.clear()
+        _by_tool.clear()
+        for row in rows:
+            try:
+                start = _utc_epoch(row['timestamp'])
+                last_sent = _utc_epoch(row['last_alert_sent']) if row['last_alert_sent'] else None
+            except (TypeError, ValueError):
+                continue
+            if now < start + CRITICAL_AFTER_S and not (last_sent and last_sent >= start + WARNING_AFTER_S):
+                _push(start + WARNING_AFTER_S, row['tool_id'], 'warning', row['tx_id'], row['current_holder'])
+            critical_at = start + CRITICAL_AFTER_S
+            if last_sent and last_sent >= critical_at:
+                critical_at = last_sent + REALERT_EVERY_S  # already alerted: wait for the re-alert
+            _push(critical_at, row['tool_id'], 'critical', row['tx_id'], row['current_holder'])
+        _wakeup.notify()
+    return len(rows)
+
+# ==========================================
+#           FIRING
+# ==========================================
+
+def _fire(entries):
+    """Sends the FOD digests for a batch of due deadlines, then schedules the re-alerts.
+
+    Deadlines whose checkout has ended (returned or re-issued without us hearing about
+    it) are dropped.
+    """
+    conn = get_db_connection()
+    try:
+        tool_ids = list({e['tool_id'] for e in entries})
+        tools = {}
+        for i in range(0, len(tool_ids), SQL_BATCH):
+            chunk = tool_ids[i:i + SQL_BATCH]
+            for row in conn.execute(f'''
+                SELECT t.id, t.name AS tool_name, t.status, t.current_holder, u.contact_id, u.name AS user_name
+                FROM tools t LEFT JOIN users u ON u.id = t.current_holder
+                WHERE t.id IN ({','.join('?' * len(chunk))})
+            ''', chunk):
+                tools[row['id']] = row
+
+        live = [(e, tools[e['tool_id']]) for e in entries
+                if e['tool_id'] in tools and tools[e['tool_id']]['status'] == 'In Use'
+                and tools[e['tool_id']]['current_holder'] == e['user_id']]
+        if not live:
+            return
+        warnings = [(row['contact_id'], row['user_name'], row['tool_name'])
+                    for e, row in live if e['kind'] == 'warning' and row['contact_id']]
+        criticals = [(row['tool_name'], row['user_name']) for e, row in live if e['kind'] == 'critical']
+        sent = telegram_manager.send_fod_digest(warnings, criticals) if telegram_manager else 0
+
+        now = time.time()
+        with _lock:
+            for e, _ in live:
+                if e['kind'] == 'critical' and not e['cancelled']:
+                    _push(now + REALERT_EVERY_S, e['tool_id'], 'critical', e['tx_id'], e['user_id'])
+
+        tx_ids = list({e['tx_id'] for e, _ in live})
+        for i in range(0, len(tx_ids), SQL_BATCH):
+            chunk = tx_ids[i:i + SQL_BATCH]
+            conn.execute(f"UPDATE transactions SET last_alert_sent = datetime('now') WHERE id IN ({','.join('?' * len(chunk))})",
+                         chunk)
+        conn.commit()
+        print(f"⏰ FOD alerts: {len(warnings)} warnings, {len(criticals)} critical in {sent} messages")
+    except Exception as e:
+        print(f"⚠️ FOD deadline batch failed ({len(entries)} deadlines): {e}")
+    finally:
+        conn.close()
+
+def _run():
+    while True:
+        with _wakeup:
+            while True:
+                while _heap and _heap[0][2]['cancelled']:
+                    heapq.heappop(_heap)
+                if not _heap:
+                    _wakeup.wait()
+                    continue
+                delay = _heap[0][0] - time.time()
+                if delay <= 0:
+                    break
+                _wakeup.wait(delay)
+            batch = []
+            window_end = _heap[0][0] + DIGEST_WINDOW_S
+            while True:
+                now = time.time()
+                while _heap and _heap[0][0] <= now:
+                    _, _, entry = heapq.heappop(_heap)
+                    if entry['cancelled']:
+                        continue
+                    batch.append(entry)
+                    remaining = [e for e in _by_tool.get(entry['tool_id'], []) if e is not entry]
+                    if remaining:
+                        _by_tool[entry['tool_id']] = remaining
+                    else:
+                        _by_tool.pop(entry['tool_id'], None)
+                while _heap and _heap[0][2]['cancelled']:
+                    heapq.heappop(_heap)
+                if not _heap or _heap[0][0] > window_end:
+                    break
+                _wakeup.wait(_heap[0][0] - now)  # hold the digest for the next deadline in the window
+            batch = [e for e in batch if not e['cancelled']]
+        if batch:
+            _sender.submit(_fire, batch)
+
+def start():
+    """Rebuilds from the database and starts the timer thread (idempotent, thread-safe)."""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    with _start_lock:
+        if _thread and _thread.is_alive():
+            return
+        count = rebuild_from_db()
+        _thread = threading.Thread(target=_run, name='fod-deadlines', daemon=True)
+        _thread.start()
+    print(f"⏰ FOD deadline scheduler running ({count} open checkouts).")
@@ -1,5 +1,6 @@
 # demo_prep.py
 import sqlite3
+import feature_store
 from datetime import datetime, timedelta
 
 def prepare_demo_data():
@@ -29,6 +30,8 @@ def prepare_demo_data():
     # The AI looks for "Usage Density" (High Hours / Low Checkouts).
     # We will create a "Stressed Tool" that fits this pattern perfectly.
     cursor.execute("DELETE FROM tools WHERE id = 'AI-DEMO-OBJ'")
+    feature_store.ensure_schema(conn)
+    feature_store.remove_tool(conn, 'AI-DEMO-OBJ')
     cursor.execute("""
         INSERT INTO tools (id, model, name, status, current_holder, calibration_due, total_checkouts, total_usage_hours)
         VALUES ('AI-DEMO-OBJ', 'M-TW-DIG', 'High-Stress Torque Wrench', 'Available', NULL, ?, 10, 500.0)
@@ -42,6 +45,7 @@ def prepare_demo_data():
     cursor.execute("UPDATE tools SET calibration_due = ?, status = 'Available' WHERE id = 'MM-001'", (today,))
     print(f"✅ Created Calendar Task: MM-001 due today.")
 
+    feature_store.backfill_missing(conn)  # fresh feature row for the AI candidate
     conn.commit()
     conn.close()
     print("\n🚀 DEMO DATA READY! Start app.py now.")
@@ -0,0 +1,347 @@
+# fake_cabinet_server.py
+# A local stand-in for the cabinet events endpoint (POST /api/cabinet/<id>/events) with
+# fault injection, for exercising cabinet_journal without the app or a flaky WiFi.
+#
+#   python fake_cabinet_server.py serve [--port 5001]
+#       then point an EventJournal at http://127.0.0.1:5001
+#   python fake_cabinet_server.py bench --events 2000 --drop-rate 0.2 --ack-loss-rate 0.2 --outage 3
+#       records events into a fresh journal while the server drops requests, applies
+#       batches but loses the reply, and goes fully offline for a while; restarts the
+#       uploader halfway through, then checks every event was applied once, in order.
+#   python fake_cabinet_server.py app --events 200
+#       replays a journal into the real ingest route (Flask test client, database.db),
+#       uploading every batch twice, and checks nothing was applied twice.
+#   python fake_cabinet_server.py controller --sessions 10 --latency 0.5
+#       runs cabinet_controller on simulated hardware (FakeCabinet readers, FakeDoor,
+#       FakeRelay) with a technician badging in and moving tools, against this server
+#       (which also answers /api/nfc/scan); reports tap -> unlock latency and checks the
+#       server received exactly the tool moves that happened. --allowlist makes the
+#       cabinet authorize from a synced copy of the server's signed allowlist instead.
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+class FakeCabinetServer:
+    """Idempotent event store keyed by (journal_id, seq), plus the faults to inject."""
+
+    def __init__(self, drop_rate=0.0, ack_loss_rate=0.0, latency=0.0):
+        self.drop_rate = drop_rate          # request fails before anything is applied
+        self.ack_loss_rate = ack_loss_rate  # batch is applied but the reply is lost
+        self.latency = latency
+        self.offline_until = 0.0
+        self.lock = threading.Lock()
+        self.applied = []                   # (journal_id, seq) in the order they were applied
+        self.events = []                    # the applied events themselves
+        self.badges = None                  # /api/nfc/scan: allowed badge UIDs (None = everyone)
+        self.allowlist_secret = None        # serves GET /api/cabinet/allowlist (full list of badges) when set
+        self.seen = set()
+        self.requests = 0
+        self.duplicates = 0
+
+    def go_offline(self, seconds):
+        self.offline_until = time.time() + seconds
+
+    def ingest(self, cabinet_id, body):
+        """-> (HTTP status, reply dict)"""
+        with self.lock:
+            self.requests += 1
+            journal_id = body.get('journal_id')
+            acked_through = None
+            for event in sorted(body.get('events') or [], key=lambda e: e['seq']):
+                key = (journal_id, event['seq'])
+                acked_through = event['seq']
+                if key in self.seen:
+                    self.duplicates += 1
+                    continue
+                self.seen.add(key)
+                self.applied.append(key)
+                self.events.append(event)
+        return 200, {'acked_through': acked_through}
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, body, status=200):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if urlparse(self.path).path != '/api/cabinet/allowlist' or not fake.allowlist_secret:
+                return self._reply({'message': 'Not found'}, 404)
+            from cabinet_allowlist import card_digest, sign_payload, stamp
+            payload = stamp({'epoch': 'fake', 'version': len(fake.badges or ()), 'full': True,
+                             'add': sorted(card_digest(uid) for uid in fake.badges or ()), 'remove': []})
+            payload['signature'] = sign_payload(payload, fake.allowlist_secret)
+            self._reply(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            parts = self.path.strip('/').split('/')  # api/cabinet/<id>/events
+            if time.time() < fake.offline_until:
+                self.close_connection = True  # like the WiFi being gone: no answer at all
+                return
+            if fake.latency:
+                time.sleep(fake.latency)
+            if parts == ['api', 'nfc', 'scan']:
+                if fake.badges is None or body.get('uid') in fake.badges:
+                    return self._reply({'status': 'success'})
+                return self._reply({'status': 'error', 'message': 'Unknown card'}, 404)
+            if len(parts) != 4 or parts[:2] != ['api', 'cabinet'] or parts[3] != 'events':
+                return self._reply({'message': 'Not found'}, 404)
+            if random.random() < fake.drop_rate:
+                return self._reply({'message': 'Injected failure'}, 503)
+            status, reply = fake.ingest(parts[2], body)
+            if random.random() < fake.ack_loss_rate:
+                return self._reply({'message': 'Injected lost acknowledgement'}, 500)
+            self._reply(reply, status)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def start_server(fake, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def fresh_journal(url, path, **kwargs):
+    import cabinet_journal
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return cabinet_journal.EventJournal(url, 'BENCH', path=path, **kwargs)
+
+def wait_drained(journal, timeout):
+    deadline = time.time() + timeout
+    while journal.pending_count() and time.time() < deadline:
+        time.sleep(0.05)
+    return journal.pending_count()
+
+def bench(args):
+    import cabinet_journal
+    cabinet_journal.BACKOFF_MAX_S = 2  # keep the bench short; the Pi uses 60
+    random.seed(args.seed)
+    fake = FakeCabinetServer(args.drop_rate, args.ack_loss_rate, args.latency)
+    server = start_server(fake)
+    url = f"http://127.0.0.1:{server.server_port}"
+    path = 'cabinet_journal.bench.db'
+    journal = fresh_journal(url, path, batch_size=args.batch)
+    journal_id = journal.journal_id
+    journal.start()
+
+    start = time.perf_counter()
+    for i in range(args.events):
+        kind = ('checkout', 'checkin', 'session_end')[i % 3]
+        journal.record(f"S{i // 3}", kind, user_id='0x4 0xa2', tool_uid=f"{i:014x}", slot=i % 32 + 1)
+        if i == args.events // 4:
+            print(f"📴 Server offline for {args.outage}s...")
+            fake.go_offline(args.outage)
+        if i == args.events // 2:
+            print("🔁 Restarting uploader (as after a Pi reboot)...")
+            journal.stop(flush_timeout=0)
+            journal = cabinet_journal.EventJournal(url, 'BENCH', path=path, batch_size=args.batch)
+            journal.start()
+        time.sleep(args.interval)
+    left = wait_drained(journal, args.outage + 60)
+    elapsed = time.perf_counter() - start
+    journal.stop(flush_timeout=0)
+    server.shutdown()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    seqs = [seq for jid, seq in fake.applied if jid == journal_id]
+    missing = args.events - len(set(seqs))
+    print(f"📒 {args.events} events, batch {args.batch}, drop {args.drop_rate:.0%}, "
+          f"lost acks {args.ack_loss_rate:.0%}, {args.outage}s outage")
+    print(f"   drained in {elapsed:.2f}s with {fake.requests} requests; "
+          f"{fake.duplicates} redelivered events ignored by the server")
+    print(f"   missing {missing}, applied twice {len(seqs) - len(set(seqs))}, "
+          f"in order {seqs == sorted(seqs)}, left in journal {left}")
+    if missing or len(seqs) != len(set(seqs)) or seqs != sorted(seqs) or left:
+        raise SystemExit("❌ Journal check failed")
+    print("✅ Every event applied exactly once, in order.")
+
+def controller(args):
+    """A technician works a simulated cabinet; the server must see exactly what moved."""
+    import asyncio
+    import cabinet_controller
+    from benchmark_cabinet_scan import make_slot_map, truth
+    from cabinet_hardware import FakeCabinet, FakeDoor, FakeRelay, reader_key
+    from cabinet_scanner import CabinetScanner, diff_snapshots
+
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    fake = FakeCabinetServer(latency=args.latency)
+    server = start_server(fake)
+    url = f"http://127.0.0.1:{server.server_port}"
+    slot_map = make_slot_map(args.slots, 1)
+    cabinet = FakeCabinet(slot_map['slots'] + [slot_map['user_reader']])
+    cabinet.fill(0.7, seed=args.seed)
+    badge_key = reader_key(slot_map['user_reader'])
+    cabinet.tags.pop(badge_key, None)  # nobody at the badge reader yet
+    relay = FakeRelay()
+    door = FakeDoor(relay)
+    scanner = CabinetScanner(slot_map, cabinet.readers)
+    journal = fresh_journal(url, 'cabinet_journal.bench.db')
+    badge = bytes([0x04, 0xa2, 0x11, 0x22])
+    allowlist = None
+    if args.allowlist:
+        from cabinet_auth import AllowlistCache
+        fake.badges = {cabinet_controller.badge_uid(badge)}
+        fake.allowlist_secret = 'bench-secret'
+        if os.path.exists('allowlist.bench.json'):
+            os.remove('allowlist.bench.json')
+        allowlist = AllowlistCache(url, fake.allowlist_secret, path='allowlist.bench.json')
+        allowlist.sync_once()
+    ctl = cabinet_controller.CabinetController(url, relay, door, cabinet.readers[badge_key], scanner, journal,
+                                               allowlist=allowlist, name='SIM')
+
+    async def technician():
+        expected = []
+        while ctl.state != cabinet_controller.IDLE or not ctl._door_changed:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)  # initial baseline
+        for _ in range(args.sessions):
+            done = ctl.sessions
+            before = truth(cabinet, slot_map)
+            cabinet.tags[badge_key] = badge               # tap
+            while not relay.is_active:
+                await asyncio.sleep(0.001)
+            del cabinet.tags[badge_key]
+            await asyncio.sleep(rng.uniform(0.1, 0.5))
+            door.open()
+            for key in rng.sample([reader_key(s) for s in slot_map['slots']], rng.randint(1, 3)):
+                if key in cabinet.tags:
+                    del cabinet.tags[key]
+                else:
+                    cabinet.tags[key] = bytes(rng.getrandbits(8) for _ in range(7))
+            await asyncio.sleep(rng.uniform(0.2, 1.0))
+            door.close()
+            expected += diff_snapshots(before, truth(cabinet, slot_map))
+            while ctl.sessions == done:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(rng.uniform(0, 0.3))      # next technician, upload may still be in flight
+        ctl.stop()
+        return expected
+
+    async def main():
+        result = await asyncio.gather(ctl.run(), technician())
+        return result[1]
+
+    start = time.perf_counter()
+    expected = asyncio.run(main())
+    left = wait_drained(journal, 30)
+    elapsed = time.perf_counter() - start
+    journal.stop(flush_timeout=0)
+    scanner.close()
+    if allowlist:
+        allowlist.stop()
+        os.remove('allowlist.bench.json')
+    server.shutdown()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists('cabinet_journal.bench.db' + suffix):
+            os.remove('cabinet_journal.bench.db' + suffix)
+
+    received = sorted((e['kind'], e['tool_uid'], e['slot']) for e in fake.events if e['kind'] != 'session_end')
+    wanted = sorted(('checkout' if a == 'REMOVED' else 'checkin', uid, slot) for a, uid, slot in expected)
+    ends = sum(1 for e in fake.events if e['kind'] == 'session_end')
+    unlock = sorted(ctl.unlock_latencies)
+    reconcile = sorted(ctl.reconcile_latencies)
+    print(f"🗄️ {args.sessions} sessions, {args.slots} slots, {args.latency * 1000:.0f} ms server latency, "
+          f"{'local allowlist' if args.allowlist else 'server'} authorization, {elapsed:.1f}s")
+    print(f"   tap -> unlock p50 {unlock[len(unlock) // 2] * 1000:.0f} ms, max {unlock[-1] * 1000:.0f} ms; "
+          f"door settled -> journaled p50 {reconcile[len(reconcile) // 2] * 1000:.0f} ms")
+    print(f"   tool moves {len(wanted)}, received {len(received)}, session ends {ends}, left in journal {left}")
+    if received != wanted or ends != args.sessions or left:
+        raise SystemExit("❌ Controller check failed")
+    print("✅ Every tool move reached the server once.")
+
+def app_replay(args):
+    """Uploads a journal into the real route twice; the second pass must be all duplicates."""
+    import cabinet_journal
+    from app import app, get_db_connection
+    app.testing = True  # no FOD timer from the bench
+    client = app.test_client()
+
+    conn = get_db_connection()
+    tools = [row['id'] for row in conn.execute('SELECT id FROM tools LIMIT 20')]
+    user = conn.execute('SELECT id FROM users LIMIT 1').fetchone()['id']
+    before = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+    conn.close()
+
+    journal = fresh_journal('http://unused', 'cabinet_journal.bench.db')
+    for i in range(args.events):
+        tool = tools[(i // 2) % len(tools)]
+        journal.record(f"S{i // 2}", 'checkout' if i % 2 == 0 else 'checkin', user_id=user, tool_uid=tool, slot=1)
+    rows = journal.conn.execute('SELECT seq, session_id, kind, user_id, tool_uid, slot, created_at FROM events ORDER BY seq').fetchall()
+    events = [dict(zip(('seq', 'session_id', 'kind', 'user_id', 'tool_uid', 'slot', 'created_at'), row)) for row in rows]
+    body = {'journal_id': journal.journal_id}
+    totals = {'applied': 0, 'duplicates': 0}
+    for start in range(0, len(events), args.batch):
+        for _ in range(2):  # every batch delivered twice, as after a lost reply
+            reply = client.post('/api/cabinet/BENCH/events', json={**body, 'events': events[start:start + args.batch]})
+            if reply.status_code != 200:
+                raise SystemExit(f"❌ Ingest failed: {reply.status_code} {reply.get_json()}")
+            totals['applied'] += reply.get_json()['applied']
+            totals['duplicates'] += reply.get_json()['duplicates']
+    journal.stop(flush_timeout=0)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists('cabinet_journal.bench.db' + suffix):
+            os.remove('cabinet_journal.bench.db' + suffix)
+
+    conn = get_db_connection()
+    written = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] - before
+    conn.close()
+    print(f"📒 {args.events} events uploaded twice: applied {totals['applied']}, "
+          f"duplicates {totals['duplicates']}, transactions written {written}")
+    if totals['applied'] != args.events or written != args.events:
+        raise SystemExit("❌ Replay was not idempotent")
+    print("✅ Replays acknowledged without being applied again.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake cabinet events endpoint for testing cabinet_journal.")
+    parser.add_argument('mode', choices=['serve', 'bench', 'app', 'controller'])
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.002, help="bench: seconds between recorded events")
+    parser.add_argument('--drop-rate', type=float, default=0.2, help="Chance a request fails outright")
+    parser.add_argument('--ack-loss-rate', type=float, default=0.2, help="Chance a batch is applied but the reply lost")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds per request")
+    parser.add_argument('--outage', type=float, default=3, help="bench: seconds the server is unreachable")
+    parser.add_argument('--port', type=int, default=5001, help="serve: port to listen on")
+    parser.add_argument('--sessions', type=int, default=10, help="controller: door sessions to run")
+    parser.add_argument('--slots', type=int, default=16, help="controller: tool slots in the cabinet")
+    parser.add_argument('--allowlist', action='store_true', help="controller: authorize from a local allowlist")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        fake = FakeCabinetServer(args.drop_rate, args.ack_loss_rate, args.latency)
+        server = start_server(fake, args.port)
+        print(f"🗄️ Fake cabinet server on http://127.0.0.1:{server.server_port}")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"   {len(fake.applied)} events applied, {fake.duplicates} duplicates ignored")
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.mode == 'bench':
+        bench(args)
+    elif args.mode == 'controller':
+        controller(args)
+    else:
+        app_replay(args)
@@ -0,0 +1,290 @@
+# fake_telegram_server.py
+# A local stand-in for the Telegram Bot API (getUpdates long-poll + sendMessage) for
+# exercising bot_listener without a real bot.
+#
+#   python fake_telegram_server.py serve --updates 500
+#       then: TELEGRAM_API_URL=http://127.0.0.1:8081 python bot_listener.py
+#   python fake_telegram_server.py bench --updates 2000 --chats 50 --latency 0.05
+#       runs bot_listener against the fake, kills it (SIGKILL, mid-batch) halfway through,
+#       restarts it and checks every command got a reply, in order within each chat, and
+#       every update left unfinished in the offset file was handled exactly once after the
+#       restart. The only duplicates allowed are replies that were in flight at the kill.
+#   python fake_telegram_server.py webhook --updates 500 [--target http://127.0.0.1:5000/api/telegram/webhook]
+#       POSTs the same fixture updates to the Flask webhook route (each one twice, plus one
+#       with a wrong secret token) and checks the same things plus per-command latency.
+#       Without --target the app is loaded in-process; with it, start the app with
+#       TELEGRAM_API_URL=http://127.0.0.1:<--port> and TELEGRAM_WEBHOOK_SECRET=<--secret>.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+COMMANDS = ['/mytools', '/start', '/report']
+
+class FakeTelegram:
+    """Update queue + sent-message log shared by the request handlers."""
+
+    def __init__(self, latency=0.0, batch=100):
+        self.latency = latency        # simulated round trip for sendMessage
+        self.batch = batch            # max updates per getUpdates, whatever the client asks for
+        self.cond = threading.Condition()
+        self.updates = []             # pending updates, ascending update_id
+        self.sent = []                # (chat_id, reply_to_message_id, text)
+        self.sent_at = {}             # reply_to_message_id -> time the reply arrived
+        self.next_update_id = 1
+        self.next_message_id = 1
+
+    def make_updates(self, count, chats):
+        """Fixture updates: `count` commands spread round-robin over `chats` chats."""
+        updates = []
+        with self.cond:
+            for i in range(count):
+                chat_id = 100000 + (i % chats)
+                updates.append({
+                    'update_id': self.next_update_id,
+                    'message': {'message_id': self.next_message_id, 'chat': {'id': chat_id},
+                                'date': int(time.time()), 'text': COMMANDS[i % len(COMMANDS)]},
+                })
+                self.next_update_id += 1
+                self.next_message_id += 1
+        return updates
+
+    def push_messages(self, count, chats):
+        updates = self.make_updates(count, chats)
+        with self.cond:
+            self.updates.extend(updates)
+            self.cond.notify_all()
+
+    def get_updates(self, offset, timeout, limit):
+        deadline = time.time() + timeout
+        with self.cond:
+            if offset:
+                self.updates = [u for u in self.updates if u['update_id'] >= offset]  # confirmed
+            while not self.updates and time.time() < deadline:
+                self.cond.wait(deadline - time.time())
+            return self.updates[:min(limit, self.batch)]
+
+    def send_message(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.cond:
+            self.sent.append((payload.get('chat_id'), payload.get('reply_to_message_id'), payload.get('text')))
+            self.sent_at[payload.get('reply_to_message_id')] = time.perf_counter()
+            self.next_message_id += 1
+            return {'message_id': self.next_message_id, 'chat': {'id': payload.get('chat_id')}, 'text': payload.get('text')}
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def _reply(self, body, status=200):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _params(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                params.update(json.loads(self.rfile.read(length)))
+            return url.path.rsplit('/', 1)[-1], params
+
+        def _handle(self):
+            method, params = self._params()
+            if method == 'getUpdates':
+                result = fake.get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0),
+                                          int(params.get('limit') or 100))
+            elif method == 'sendMessage':
+                result = fake.send_message(params)
+            else:
+                return self._reply({'ok': False, 'error_code': 404, 'description': 'Not Found'}, 404)
+            self._reply({'ok': True, 'result': result})
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def start_server(fake, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def bench(args):
+    fake = FakeTelegram(latency=args.latency, batch=args.batch)
+    server = start_server(fake)
+    os.environ['TELEGRAM_API_URL'] = f"http://127.0.0.1:{server.server_port}"
+    import bot_listener  # reads TELEGRAM_API_URL at import
+    bot_listener.OFFSET_PATH = 'bot_offset.bench.json'
+    if os.path.exists(bot_listener.OFFSET_PATH):
+        os.remove(bot_listener.OFFSET_PATH)
+
+    def replied():
+        with fake.cond:
+            return len({reply_to for _, reply_to, _ in fake.sent})
+
+    fake.push_messages(args.updates, args.chats)
+    start = time.perf_counter()
+
+    # 1. First run in a child process, killed without any shutdown once half is answered:
+    #    whatever was queued or mid-flight is only in the offset file now
+    crashed = subprocess.Popen(
+        [sys.executable, '-c', 'import sys, bot_listener; bot_listener.OFFSET_PATH = sys.argv[1]; '
+                               'bot_listener.main(None, int(sys.argv[2]), 1)',
+         bot_listener.OFFSET_PATH, str(args.workers)],
+        env=os.environ.copy(), stdout=subprocess.DEVNULL)
+    while replied() < args.updates // 2:
+        if crashed.poll() is not None:
+            raise SystemExit("❌ Bot process exited on its own")
+        time.sleep(0.01)
+    crashed.kill()
+    crashed.wait()
+    time.sleep(args.latency + 0.2)  # sendMessage calls the fake had already received land now
+    with fake.cond:
+        before_restart = len(fake.sent)
+        answered_before = {reply_to for _, reply_to, _ in fake.sent}
+    _, leftovers = bot_listener._load_state()
+    unfinished = {u['message']['message_id'] for u in leftovers if 'message' in u}
+    if not unfinished:
+        raise SystemExit("❌ Kill landed between batches (nothing unfinished); raise --latency")
+    print(f"💥 Killed bot after {before_restart} replies, {len(unfinished)} updates unfinished")
+
+    # 2. Restart in-process; it must replay the unfinished updates from the offset file
+    stop = threading.Event()
+    bot = threading.Thread(target=bot_listener.main, args=(stop, args.workers, 1))
+    bot.start()
+    while replied() < args.updates:
+        time.sleep(0.01)
+    stop.set()
+    bot.join()
+    elapsed = time.perf_counter() - start
+    os.remove(bot_listener.OFFSET_PATH)
+    server.shutdown()
+
+    after = [reply_to for _, reply_to, _ in fake.sent[before_restart:]]
+    replays = {m: after.count(m) for m in unfinished}
+    wrong = {m: c for m, c in replays.items() if c != 1}
+    print(f"📨 {args.updates} updates, {args.chats} chats, {args.workers} workers, {args.latency * 1000:.0f} ms send latency")
+    print(f"   {elapsed:.2f}s ({args.updates / elapsed:.0f} updates/s)")
+    print(f"   unfinished updates handled after restart: {len(replays) - len(wrong)}/{len(replays)} exactly once")
+    if wrong:
+        raise SystemExit(f"❌ Unfinished updates not handled exactly once after restart: {wrong}")
+    # Handled and answered, but killed before the offset file said so: the documented replay
+    check_replies(fake, args.updates, allowed_duplicates=unfinished & answered_before)
+
+def check_replies(fake, expected, allowed_duplicates=frozenset()):
+    replied = [reply_to for _, reply_to, _ in fake.sent]
+    missing = expected - len(set(replied))
+    duplicates = len(replied) - len(set(replied))
+    in_flight = sum(1 for m in allowed_duplicates if replied.count(m) == 2)
+    if in_flight:
+        print(f"   {in_flight} commands answered twice (in flight at the kill)")
+        duplicates -= in_flight
+    by_chat = {}
+    for chat_id, reply_to, _ in fake.sent:
+        by_chat.setdefault(chat_id, []).append(reply_to)
+    out_of_order = sum(1 for ids in by_chat.values() if ids != sorted(ids))
+    print(f"   missing {missing}, duplicates {duplicates}, chats out of order {out_of_order}")
+    if missing or duplicates or out_of_order:
+        raise SystemExit("❌ Bot check failed")
+    print("✅ Every command answered, in order per chat, none lost or repeated beyond the kill.")
+
+def webhook(args):
+    fake = FakeTelegram(latency=args.latency)
+    server = start_server(fake, args.port if args.target else 0)
+    if args.target:
+        import requests
+        http = requests.Session()
+        post = lambda body, secret: http.post(args.target, json=body, timeout=30,
+                                              headers={'X-Telegram-Bot-Api-Secret-Token': secret}).status_code
+    else:
+        os.environ['TELEGRAM_API_URL'] = f"http://127.0.0.1:{server.server_port}"
+        os.environ['TELEGRAM_WEBHOOK_SECRET'] = args.secret
+        import bot_listener
+        bot_listener.OFFSET_PATH = 'bot_offset.bench.json'
+        from app import app  # reads both variables at import
+        app.testing = True  # no FOD timer from the bench
+        client = app.test_client()
+        post = lambda body, secret: client.post('/api/telegram/webhook', json=body,
+                                                headers={'X-Telegram-Bot-Api-Secret-Token': secret}).status_code
+
+    updates = fake.make_updates(args.updates, args.chats)
+    if post(updates[0], 'wrong-secret') != 403:
+        raise SystemExit("❌ Webhook accepted a wrong secret token")
+
+    # Each chat is a technician who sends a command and waits for the answer before the
+    # next one; every delivery is repeated, as Telegram does when it retries.
+    posted_at = {}
+    def deliver(chat_updates):
+        for update in chat_updates:
+            message_id = update['message']['message_id']
+            posted_at[message_id] = time.perf_counter()
+            for _ in range(2):
+                if post(update, args.secret) != 200:
+                    raise SystemExit(f"❌ Webhook rejected update {update['update_id']}")
+            deadline = time.perf_counter() + 10
+            while message_id not in fake.sent_at and time.perf_counter() < deadline:
+                time.sleep(0.001)
+    by_chat = {}
+    for update in updates:
+        by_chat.setdefault(update['message']['chat']['id'], []).append(update)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(by_chat)) as pool:
+        list(pool.map(deliver, by_chat.values()))
+    while len(fake.sent) < args.updates and time.perf_counter() - start < 60:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    if not args.target and os.path.exists('bot_offset.bench.json'):
+        os.remove('bot_offset.bench.json')
+
+    latencies = sorted(fake.sent_at[m] - posted_at[m] for m in posted_at if m in fake.sent_at)
+    print(f"📨 {args.updates} webhook updates (+ {args.updates} redeliveries), {args.chats} chats, "
+          f"{args.latency * 1000:.0f} ms send latency")
+    if latencies:
+        print(f"   {elapsed:.2f}s; command -> reply p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms")
+    check_replies(fake, args.updates)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for testing bot_listener.")
+    parser.add_argument('mode', choices=['serve', 'bench', 'webhook'])
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per sendMessage")
+    parser.add_argument('--batch', type=int, default=20, help="Max updates per getUpdates response")
+    parser.add_argument('--workers', type=int, default=8, help="bench: bot worker threads")
+    parser.add_argument('--port', type=int, default=8081, help="serve/webhook: port the fake API listens on")
+    parser.add_argument('--target', help="webhook: URL of a running app's webhook route (default: in-process)")
+    parser.add_argument('--secret', default='local-test-secret', help="webhook: secret token to send")
+    args = parser.parse_args()
+
+    if args.mode == 'bench':
+        bench(args)
+    elif args.mode == 'webhook':
+        webhook(args)
+    else:
+        fake = FakeTelegram(latency=args.latency, batch=args.batch)
+        fake.push_messages(args.updates, args.chats)
+        start_server(fake, args.port)
+        print(f"🧪 Fake Telegram API on http://127.0.0.1:{args.port} with {args.updates} queued updates. Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"   {len(fake.sent)} replies so far")
+        except KeyboardInterrupt:
+            pass
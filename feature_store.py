@@ -0,0 +1,205 @@
+# feature_store.py
+# Per-tool model features, kept up to date by the transaction routes (O(1) work per event)
+# so the calibration forecast can read real features in one indexed scan.
+import json
+import sqlite3
+from datetime import datetime
+
+# Model -> (Criticality_Score, Env_Stress_Index). Mirrors the rules used to
+# generate the training data: pneumatic tools vibrate more, torque tools are safety-critical.
+MODEL_PROFILES = {
+    'M-DRILL': (3, 70),
+    'M-RIVET': (3, 70),
+    'M-TW-DIG': (5, 50),
+}
+DEFAULT_PROFILE = (2, 50)
+
+TOOL_FEATURES_COLUMNS = '''(
+        tool_id TEXT PRIMARY KEY,
+        created_at TEXT,                 -- first seen; NULL if unknown (the forecast assumes a year)
+        total_checkouts INTEGER NOT NULL DEFAULT 0,
+        completed_checkouts INTEGER NOT NULL DEFAULT 0,
+        total_usage_hours REAL NOT NULL DEFAULT 0.0,
+        unique_users INTEGER NOT NULL DEFAULT 0,
+        past_failures INTEGER NOT NULL DEFAULT 0,
+        last_calibration_date TEXT,
+        criticality_score INTEGER NOT NULL DEFAULT 2,
+        env_stress_index REAL NOT NULL DEFAULT 50,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )'''
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS tool_features {TOOL_FEATURES_COLUMNS};
+
+    -- Distinct (tool, user) pairs: one PK probe tells us if a checkout adds a new user.
+    CREATE TABLE IF NOT EXISTS tool_feature_users (
+        tool_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        PRIMARY KEY (tool_id, user_id)
+    ) WITHOUT ROWID;
+'''
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+    columns = conn.execute('PRAGMA table_info(tool_features)').fetchall()
+    if any(col[1] == 'created_at' and col[3] for col in columns):
+        _allow_unknown_created_at(conn)
+
+def _allow_unknown_created_at(conn):
+    """One-off migration: created_at used to be NOT NULL, and tools backfilled without any
+    history got today's date (age 0). Rebuilds the table with a nullable created_at and
+    re-derives every tool's date from history, NULL where there is none."""
+    triggers = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'tool_features'")]
+    conn.executescript(f'''
+        BEGIN;
+        CREATE TABLE tool_features_new {TOOL_FEATURES_COLUMNS};
+        INSERT INTO tool_features_new SELECT * FROM tool_features;
+        DROP TABLE tool_features;
+        ALTER TABLE tool_features_new RENAME TO tool_features;
+        COMMIT;
+    ''')
+    for sql in triggers:  # dropped with the old table
+        conn.execute(sql)
+    first_seen = _first_seen(conn)
+    conn.executemany('UPDATE tool_features SET created_at = ? WHERE tool_id = ?',
+                     [(first_seen.get(tool_id), tool_id) for (tool_id,) in conn.execute('SELECT tool_id FROM tool_features')])
+    conn.commit()
+
+def _first_seen(conn):
+    """tool_id -> 'YYYY-MM-DD' of its earliest transaction or TOOL_CREATED audit entry."""
+    first = dict(conn.execute(
+        'SELECT tool_id, date(MIN(timestamp)) FROM transactions GROUP BY tool_id').fetchall())
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_log'").fetchone():
+        for details, day in conn.execute("SELECT details, date(timestamp) FROM audit_log WHERE action = 'TOOL_CREATED'"):
+            try:
+                tool_id = json.loads(details)['tool_id']
+            except (TypeError, ValueError, KeyError):
+                continue
+            if day and (first.get(tool_id) is None or day < first[tool_id]):
+                first[tool_id] = day
+    return first
+
+def profile_for_model(model):
+    return MODEL_PROFILES.get(model, DEFAULT_PROFILE)
+
+# ==========================================
+#           EVENT HOOKS (O(1) EACH)
+# ==========================================
+# Every hook runs inside the caller's transaction; the caller commits.
+
+def register_tool(conn, tool_id, model=None, created_at=None):
+    """Creates the feature row for a new tool (no-op if it already exists)."""
+    criticality, stress = profile_for_model(model)
+    conn.execute('''
+        INSERT OR IGNORE INTO tool_features (tool_id, created_at, criticality_score, env_stress_index)
+        VALUES (?, ?, ?, ?)
+    ''', (tool_id, created_at or datetime.now().strftime('%Y-%m-%d'), criticality, stress))
+
+def _ensure_row(conn, tool_id):
+    if conn.execute('SELECT 1 FROM tool_features WHERE tool_id = ?', (tool_id,)).fetchone():
+        return
+    tool = conn.execute('SELECT model FROM tools WHERE id = ?', (tool_id,)).fetchone()
+    register_tool(conn, tool_id, tool[0] if tool else None)
+
+def record_checkout(conn, tool_id, user_id):
+    _ensure_row(conn, tool_id)
+    new_user = conn.execute('INSERT OR IGNORE INTO tool_feature_users (tool_id, user_id) VALUES (?, ?)',
+                            (tool_id, user_id)).rowcount
+    conn.execute('''
+        UPDATE tool_features
+        SET total_checkouts = total_checkouts + 1,
+            unique_users = unique_users + ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE tool_id = ?
+    ''', (1 if new_user == 1 else 0, tool_id))
+
+def record_checkin(conn, tool_id, duration_hours):
+    _ensure_row(conn, tool_id)
+    conn.execute('''
+        UPDATE tool_features
+        SET completed_checkouts = completed_checkouts + 1,
+            total_usage_hours = total_usage_hours + ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE tool_id = ?
+    ''', (duration_hours, tool_id))
+
+def record_failure(conn, tool_id):
+    _ensure_row(conn, tool_id)
+    conn.execute('''
+        UPDATE tool_features
+        SET past_failures = past_failures + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE tool_id = ?
+    ''', (tool_id,))
+
+def record_calibration(conn, tool_id, calibrated_on=None):
+    _ensure_row(conn, tool_id)
+    conn.execute('''
+        UPDATE tool_features
+        SET last_calibration_date = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE tool_id = ?
+    ''', (calibrated_on or datetime.now().strftime('%Y-%m-%d'), tool_id))
+
+def remove_tool(conn, tool_id):
+    conn.execute('DELETE FROM tool_features WHERE tool_id = ?', (tool_id,))
+    conn.execute('DELETE FROM tool_feature_users WHERE tool_id = ?', (tool_id,))
+
+# ==========================================
+#           BACKFILL FROM HISTORY
+# ==========================================
+
+def backfill_missing(conn):
+    """Builds feature rows for tools that don't have one yet (existing databases, seed scripts).
+
+    This is the only place that aggregates over history; it runs at startup and only
+    touches tools missing from the store.
+    """
+    missing = conn.execute('''
+        SELECT t.id, t.model, t.total_checkouts, t.total_usage_hours
+        FROM tools t LEFT JOIN tool_features f ON f.tool_id = t.id
+        WHERE f.tool_id IS NULL
+    ''').fetchall()
+    if not missing:
+        return 0
+
+    first_seen = _first_seen(conn)  # tools with no history stay NULL: the forecast's 365-day fallback
+    checkins = dict(conn.execute(
+        "SELECT tool_id, COUNT(*) FROM transactions WHERE type = 'checkin' GROUP BY tool_id").fetchall())
+    failures = dict(conn.execute(
+        'SELECT tool_id, COUNT(*) FROM issue_reports GROUP BY tool_id').fetchall())
+
+    rows = []
+    for tool_id, model, total_checkouts, total_hours in missing:
+        criticality, stress = profile_for_model(model)
+        rows.append((tool_id, first_seen.get(tool_id), total_checkouts or 0,
+                     checkins.get(tool_id, 0), total_hours or 0.0, failures.get(tool_id, 0),
+                     criticality, stress))
+    conn.executemany('''
+        INSERT OR IGNORE INTO tool_features
+            (tool_id, created_at, total_checkouts, completed_checkouts, total_usage_hours,
+             past_failures, criticality_score, env_stress_index)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    conn.execute('''
+        INSERT OR IGNORE INTO tool_feature_users (tool_id, user_id)
+        SELECT DISTINCT tool_id, user_id FROM transactions WHERE type = 'checkout'
+    ''')
+    conn.execute('''
+        UPDATE tool_features
+        SET unique_users = (SELECT COUNT(*) FROM tool_feature_users u WHERE u.tool_id = tool_features.tool_id)
+        WHERE tool_id IN (SELECT tool_id FROM tool_feature_users)
+    ''')
+    return len(rows)
+
+def init_feature_store(db_path='database.db'):
+    """Creates the tables and backfills any tools that predate the feature store."""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+        added = backfill_missing(conn)
+        conn.commit()
+        if added:
+            print(f"🧮 Feature store: backfilled {added} tools from history.")
+    finally:
+        conn.close()
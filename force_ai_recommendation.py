@@ -1,6 +1,7 @@
 import sqlite3
 from datetime import datetime, timedelta
 import uuid
+import feature_store
 
 def inject_stressed_tool():
     conn = sqlite3.connect('database.db')
@@ -21,6 +22,8 @@ def inject_stressed_tool():
     # We give it EXTREME stats: 80 checkouts, 600 hours (7.5 hours per use!)
     # This creates a huge "Usage Density" that will trigger the outlier detection.
     cursor.execute("DELETE FROM tools WHERE id = ?", (tool_id,))
+    feature_store.ensure_schema(conn)
+    feature_store.remove_tool(conn, tool_id)
     cursor.execute("""
         INSERT INTO tools (id, model, name, status, current_holder, calibration_due, total_checkouts, total_usage_hours)
         VALUES (?, 'M-TW-DIG', ?, 'Available', NULL, ?, 80, 600.0)
@@ -43,6 +46,7 @@ def inject_stressed_tool():
         VALUES (?, ?, 'Physical Damage', 'Dropped on concrete', 'Closed', datetime('now', '-3 months'))
     """, (f"REP-{str(uuid.uuid4())[:8]}", tool_id))
 
+    feature_store.backfill_missing(conn)  # rebuild features incl. the 2 injected failures
     conn.commit()
     conn.close()
     
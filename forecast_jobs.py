@@ -0,0 +1,236 @@
+# forecast_jobs.py
+# Runs calibration forecasts in a background thread pool.
+# submit -> job id -> poll / stream progress -> fetch result.
+# Finished results are cached per (model version, inventory version, day), and
+# identical requests that arrive while a forecast is running share that one job. Each
+# caller handed a queued/running job counts as a watcher; cancelling only drops that
+# caller's interest, and the job is stopped once nobody is watching it any more.
+import sqlite3
+import threading
+import uuid
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import predictive_calibration
+
+MAX_WORKERS = 2
+MAX_JOBS_KEPT = 50
+MAX_CACHED_RESULTS = 8
+
+# Anything that can change a forecast bumps this counter (see INVENTORY_VERSION_SCHEMA).
+INVENTORY_VERSION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS inventory_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO inventory_version (id, version) VALUES (1, 0);
+
+    CREATE TRIGGER IF NOT EXISTS inventory_bump_tools_insert AFTER INSERT ON tools
+    BEGIN UPDATE inventory_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS inventory_bump_tools_update AFTER UPDATE ON tools
+    BEGIN UPDATE inventory_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS inventory_bump_tools_delete AFTER DELETE ON tools
+    BEGIN UPDATE inventory_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS inventory_bump_issues_insert AFTER INSERT ON issue_reports
+    BEGIN UPDATE inventory_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS inventory_bump_features_insert AFTER INSERT ON tool_features
+    BEGIN UPDATE inventory_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS inventory_bump_features_update AFTER UPDATE ON tool_features
+    BEGIN UPDATE inventory_version SET version = version + 1 WHERE id = 1; END;
+'''
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='forecast')
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)   # notified on every progress/status change
+_jobs = OrderedDict()                   # job_id -> job dict
+_running_by_key = {}                    # cache key -> job_id of the in-flight job
+_result_cache = OrderedDict()           # cache key -> job_id of a finished job
+
+def get_db_connection():
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript(INVENTORY_VERSION_SCHEMA)
+
+def init_forecast_jobs(db_path='database.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+        predictive_calibration.ensure_schema(conn)  # stored predictions + dirty set
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_inventory_version(conn=None):
+    should_close = False
+    if conn is None:
+        conn = get_db_connection()
+        should_close = True
+    try:
+        row = conn.execute('SELECT version FROM inventory_version WHERE id = 1').fetchone()
+        return row[0] if row else 0
+    finally:
+        if should_close:
+            conn.close()
+
+def _cache_key(model_version, inventory_version):
+    # Day is part of the key: "days since calibration" moves every midnight.
+    return (model_version, inventory_version, datetime.now().strftime('%Y-%m-%d'))
+
+def _public(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],          # queued | running | done | error | cancelled
+        'progress': job['progress'],
+        'message': job['message'],
+        'cached': job['cached'],
+        'watchers': job['watchers'],
+        'submitted_at': job['submitted_at'],
+        'finished_at': job['finished_at'],
+    }
+
+# ==========================================
+#           JOB LIFECYCLE
+# ==========================================
+
+def _new_job(key):
+    job = {
+        'id': uuid.uuid4().hex[:12],
+        'key': key,
+        'status': 'queued',
+        'progress': 0,
+        'message': 'Queued',
+        'cached': False,
+        'result': None,
+        'cancel': threading.Event(),
+        'watchers': 0,                    # callers waiting on it; cancelled when this drops to 0
+        'submitted_at': datetime.now().isoformat(timespec='seconds'),
+        'finished_at': None,
+    }
+    _jobs[job['id']] = job
+    while len(_jobs) > MAX_JOBS_KEPT:
+        old_id, old_job = next(iter(_jobs.items()))
+        if old_job['status'] in ('queued', 'running'):
+            break
+        _jobs.pop(old_id)
+    return job
+
+def _forget_running(job):
+    # Only drop the mapping if it still points at this job (a newer one may have replaced it).
+    if _running_by_key.get(job['key']) == job['id']:
+        del _running_by_key[job['key']]
+
+def _update(job, **fields):
+    with _changed:
+        job.update(fields)
+        _changed.notify_all()
+
+def _run(job):
+    _update(job, status='running', message='Starting')
+    try:
+        result = predictive_calibration.generate_forecast(
+            progress=lambda pct, msg: _update(job, progress=pct, message=msg),
+            cancel=job['cancel'],
+        )
+    except Exception as e:
+        print(f"❌ Forecast job {job['id']} failed: {e}")
+        result = {'status': 'error', 'message': str(e)}
+
+    with _changed:
+        _forget_running(job)
+        job['result'] = result
+        job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        if result.get('status') == 'success':
+            job.update(status='done', progress=100, message='Done')
+            # The model may have been (re)trained inside the job: file under the real version.
+            key = (result.get('model_version'),) + job['key'][1:]
+            _result_cache[key] = job['id']
+            _result_cache.move_to_end(key)
+            while len(_result_cache) > MAX_CACHED_RESULTS:
+                _result_cache.popitem(last=False)
+        elif result.get('status') == 'cancelled':
+            job.update(status='cancelled', message='Cancelled')
+        else:
+            job.update(status='error', message=result.get('message', 'Forecast failed'))
+        _changed.notify_all()
+
+def submit_forecast():
+    """Returns a job for the current inventory: cached, already running, or newly started."""
+    key = _cache_key(predictive_calibration.current_model_version(), get_inventory_version())
+
+    with _changed:
+        cached_id = _result_cache.get(key)
+        if cached_id and cached_id in _jobs:
+            return _public(_jobs[cached_id]) | {'cached': True}
+
+        running_id = _running_by_key.get(key)
+        if running_id and _jobs[running_id]['status'] in ('queued', 'running'):
+            _jobs[running_id]['watchers'] += 1
+            return _public(_jobs[running_id])
+
+        job = _new_job(key)
+        job['watchers'] = 1
+        _running_by_key[key] = job['id']
+
+    _executor.submit(_run, job)
+    return _public(job)
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return _public(job) if job else None
+
+def get_result(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None, None
+        return job['status'], job['result']
+
+def cancel_job(job_id):
+    """One caller stops watching a queued/running job; the job itself is only stopped
+    when that was the last caller sharing it."""
+    with _changed:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] in ('queued', 'running') and not job['cancel'].is_set():
+            job['watchers'] = max(job['watchers'] - 1, 0)
+            if job['watchers'] > 0:
+                return _public(job)
+            job['cancel'].set()
+            _forget_running(job)
+            job['message'] = 'Cancelling'
+            _changed.notify_all()
+        return _public(job)
+
+def wait_for_change(job_id, last_seen, timeout=15.0):
+    """Blocks until the job's (status, progress, message) differs from last_seen, or timeout."""
+    deadline = time.monotonic() + timeout
+    with _changed:
+        while True:
+            job = _jobs.get(job_id)
+            if job is None:
+                return None
+            current = _public(job)
+            state = (current['status'], current['progress'], current['message'])
+            remaining = deadline - time.monotonic()
+            if state != last_seen or remaining <= 0:
+                return current
+            _changed.wait(remaining)
+
+def run_forecast_blocking():
+    """Submit + wait: keeps the old synchronous /api/calibration/predict contract."""
+    job = submit_forecast()
+    seen = None
+    while job and job['status'] in ('queued', 'running'):
+        job = wait_for_change(job['job_id'], seen)
+        seen = (job['status'], job['progress'], job['message']) if job else None
+    if job is None:
+        return {'status': 'error', 'message': 'Job disappeared'}
+    _, result = get_result(job['job_id'])
+    return result or {'status': 'error', 'message': job['message']}
@@ -1,118 +1,128 @@
+import argparse
+import os
+import time
 import pandas as pd
 import numpy as np
-import random
-from datetime import datetime, timedelta
 
-def generate_synthetic_data(num_records=10000):
+OUTPUT_PATH = 'historical_training_data.csv'
+CHUNK_ROWS = 100_000  # rows generated + written per step; bounds memory at any dataset size
+
+# --- 1. Define Categories & Probabilities ---
+TOOL_TYPES = ['Pneumatic Drill', 'Digital Torque Wrench', 'Multimeter', 'Borescope', 'Hydraulic Pump']
+BRANDS = ['Snap-on', 'Facom', 'Bosch', 'Fluke', 'Makita']
+
+# Tool type -> (checkouts low/high (inclusive), avg duration low/high in hours, criticality)
+TYPE_PROFILES = {
+    'Pneumatic Drill':       ((50, 500), (2.0, 8.0), 3),   # High usage, high vibration
+    'Digital Torque Wrench': ((20, 200), (0.5, 4.0), 5),   # Moderate usage, critical for safety
+}
+DEFAULT_TYPE_PROFILE = ((10, 150), (1.0, 12.0), 2)         # Standard usage
+
+COLUMNS = [
+    'Tool_Type', 'Brand', 'Tool_Age_Days', 'Days_Since_Last_Cal', 'Total_Checkouts',
+    'Total_Usage_Hours', 'Avg_Duration_Hours', 'Unique_Users', 'Past_Failures',
+    'Env_Stress_Index', 'Criticality_Score', 'Maintenance_Cost', 'Label_Recommended_Days_Until_Cal',
+]
+
+def parse_type_mix(text):
+    """'Pneumatic Drill=3,Multimeter=1' -> normalized probabilities over TOOL_TYPES."""
+    weights = dict.fromkeys(TOOL_TYPES, 0.0)
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in weights:
+            raise ValueError(f"Unknown tool type '{name}'. Choose from: {', '.join(TOOL_TYPES)}")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Tool type mix needs at least one positive weight")
+    return [weights[t] / total for t in TOOL_TYPES]
+
+def generate_chunk(rng, n, type_probs=None):
+    """Generates n rows as a DataFrame. Same distributions and label rules as the original per-row loop."""
+    # -- Random Basic Attributes --
+    type_idx = rng.choice(len(TOOL_TYPES), size=n, p=type_probs)
+    brand_idx = rng.integers(0, len(BRANDS), size=n)
+    age_days = rng.integers(30, 1825, size=n, endpoint=True)  # 1 month to 5 years old
+
+    # -- Derived Usage Stats (Correlated to Type) --
+    checkouts = np.empty(n, dtype=np.int64)
+    avg_duration = np.empty(n)
+    criticality = np.empty(n, dtype=np.int64)
+    for i, tool_type in enumerate(TOOL_TYPES):
+        mask = type_idx == i
+        count = int(mask.sum())
+        (lo, hi), (d_lo, d_hi), crit = TYPE_PROFILES.get(tool_type, DEFAULT_TYPE_PROFILE)
+        checkouts[mask] = rng.integers(lo, hi, size=count, endpoint=True)
+        avg_duration[mask] = rng.uniform(d_lo, d_hi, size=count)  # Hours per checkout
+        criticality[mask] = crit
+    is_drill = type_idx == TOOL_TYPES.index('Pneumatic Drill')
+
+    total_hours = checkouts * avg_duration
+    days_since_cal = rng.integers(1, 365, size=n, endpoint=True)
+    unique_users = (checkouts * rng.uniform(0.2, 0.8, size=n)).astype(np.int64)  # Not everyone uses every tool
+
+    # Past Failures: older, pneumatic tools fail more
+    fail_prob = 0.05 + 0.0001 * age_days + np.where(is_drill, 0.1, 0.0)
+    past_failures = rng.poisson(fail_prob * 5)
+
+    env_stress = rng.integers(0, 100, size=n, endpoint=True) + np.where(is_drill, 20, 0)  # Drills vibrate more
+    maint_cost = past_failures * 150 + age_days * 0.1
+
+    # -- TARGET VARIABLE: "Recommended_Next_Cal_In_Days" --
+    # High usage + High Age + Failures = Calibrate SOON (Low days)
+    base_interval = 180  # Standard 6 months
+    penalty = (30 * (total_hours > 500) + 40 * (past_failures > 2)
+               + 20 * (env_stress > 80) + 20 * (age_days > 1000))
+    theoretical_days = np.maximum(7, base_interval - penalty - days_since_cal)
+    noise = rng.integers(-15, 15, size=n, endpoint=True)  # +/- 15 days of real-world variance
+
+    return pd.DataFrame({
+        'Tool_Type': np.array(TOOL_TYPES)[type_idx],
+        'Brand': np.array(BRANDS)[brand_idx],
+        'Tool_Age_Days': age_days,
+        'Days_Since_Last_Cal': days_since_cal,
+        'Total_Checkouts': checkouts,
+        'Total_Usage_Hours': np.round(total_hours, 1),
+        'Avg_Duration_Hours': np.round(avg_duration, 1),
+        'Unique_Users': unique_users,
+        'Past_Failures': past_failures,
+        'Env_Stress_Index': env_stress,
+        'Criticality_Score': criticality,
+        'Maintenance_Cost': np.round(maint_cost, 2),
+        'Label_Recommended_Days_Until_Cal': theoretical_days + noise,
+    }, columns=COLUMNS)
+
+def generate_synthetic_data(num_records=10000, seed=42, chunk_rows=CHUNK_ROWS, type_probs=None, out_path=OUTPUT_PATH):
+    """Streams num_records rows to out_path in chunks. Same seed + chunk size -> identical file."""
     print(f"🏭 Generating {num_records} records of historical maintenance data...")
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    # Write to a temp file and swap it in, so the model registry never hashes a half-written CSV.
+    tmp_path = out_path + '.tmp'
+    written = 0
+    with open(tmp_path, 'w', newline='') as f:
+        while written < num_records:
+            n = min(chunk_rows, num_records - written)
+            generate_chunk(rng, n, type_probs).to_csv(f, index=False, header=(written == 0))
+            written += n
+            if num_records > chunk_rows:
+                print(f"   ... {written:,}/{num_records:,} rows")
+    os.replace(tmp_path, out_path)
 
-    # --- 1. Define Categories & Probabilities ---
-    tool_types = ['Pneumatic Drill', 'Digital Torque Wrench', 'Multimeter', 'Borescope', 'Hydraulic Pump']
-    brands = ['Snap-on', 'Facom', 'Bosch', 'Fluke', 'Makita']
-    
-    data = []
-
-    for i in range(num_records):
-        # -- Random Basic Attributes --
-        tool_type = random.choice(tool_types)
-        brand = random.choice(brands)
-        age_days = random.randint(30, 1825) # 1 month to 5 years old
-        
-        # -- Derived Usage Stats (Correlated to Type) --
-        if tool_type == 'Pneumatic Drill':
-            # High usage, high vibration
-            checkouts = random.randint(50, 500)
-            avg_duration = random.uniform(2.0, 8.0) # Hours per checkout
-            criticality = 3
-        elif tool_type == 'Digital Torque Wrench':
-            # Moderate usage, high precision
-            checkouts = random.randint(20, 200)
-            avg_duration = random.uniform(0.5, 4.0)
-            criticality = 5 # Critical for safety
-        else:
-            # Standard usage
-            checkouts = random.randint(10, 150)
-            avg_duration = random.uniform(1.0, 12.0)
-            criticality = 2
-
-        # Calculate Totals
-        total_hours = checkouts * avg_duration
-        
-        # -- 10+ PARAMETERS (THE REQUIREMENT) --
-        
-        # 1. Total Usage Hours
-        # 2. Total Checkouts
-        # 3. Tool Age (Days)
-        # 4. Days Since Last Calibration
-        days_since_cal = random.randint(1, 365)
-        
-        # 5. Average Checkout Duration (Derived)
-        
-        # 6. Unique Users (How many different hands touched it?)
-        unique_users = int(checkouts * random.uniform(0.2, 0.8)) # Not everyone uses every tool
-        
-        # 7. Past Failures (Repair History)
-        # Older, pneumatic tools fail more
-        fail_prob = 0.05 + (0.0001 * age_days) 
-        if tool_type == 'Pneumatic Drill': fail_prob += 0.1
-        past_failures = np.random.poisson(fail_prob * 5)
-        
-        # 8. Criticality Score (1-5 Safety Rating)
-        # (Already set above)
-        
-        # 9. Environmental Stress (Simulated Temp/Vibration exposure 0-100)
-        env_stress = random.randint(0, 100)
-        if tool_type == 'Pneumatic Drill': env_stress += 20 # Drills vibrate more
-        
-        # 10. Cost of Maintenance (Simulated $)
-        maint_cost = (past_failures * 150) + (age_days * 0.1)
-
-        # -- TARGET VARIABLE: "Recommended_Next_Cal_In_Days" --
-        # This is what the AI learns to predict.
-        # Logic: High usage + High Age + Failures = Calibrate SOON (Low days)
-        
-        base_interval = 180 # Standard 6 months
-        
-        penalty = 0
-        if total_hours > 500: penalty += 30
-        if past_failures > 2: penalty += 40
-        if env_stress > 80: penalty += 20
-        if age_days > 1000: penalty += 20
-        
-        # The "Perfect" Math Answer
-        theoretical_days = max(7, base_interval - penalty - days_since_cal)
-
-        # ADD NOISE: The "Real World" Factor
-        # Sometimes tools last longer or fail sooner for no reason.
-        # We add a random variance of +/- 15 days to prevent "99% Accuracy" overfitting.
-        noise = random.randint(-15, 15) 
-
-        # The Final Label the AI tries to guess
-        label_days = theoretical_days + noise
-
-        # Append Row
-        data.append({
-            'Tool_Type': tool_type,               # Param 1 (Categorical)
-            'Brand': brand,                       # Param 2 (Categorical)
-            'Tool_Age_Days': age_days,            # Param 3
-            'Days_Since_Last_Cal': days_since_cal,# Param 4
-            'Total_Checkouts': checkouts,         # Param 5
-            'Total_Usage_Hours': round(total_hours, 1), # Param 6
-            'Avg_Duration_Hours': round(avg_duration, 1), # Param 7
-            'Unique_Users': unique_users,         # Param 8
-            'Past_Failures': past_failures,       # Param 9
-            'Env_Stress_Index': env_stress,       # Param 10
-            'Criticality_Score': criticality,     # Extra
-            'Maintenance_Cost': round(maint_cost, 2), # Extra
-            # TARGET
-            'Label_Recommended_Days_Until_Cal': int(label_days)
-        })
-
-    # Save to CSV
-    df = pd.DataFrame(data)
-    df.to_csv('historical_training_data.csv', index=False)
-    print(f"✅ Success! Created 'historical_training_data.csv' with {len(df)} rows.")
+    print(f"✅ Success! Created '{out_path}' with {written} rows in {time.perf_counter() - start:.1f}s.")
     print("Show this file to your supervisor to prove data robustness.")
 
 if __name__ == "__main__":
-    generate_synthetic_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic calibration history for training.")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--mix', default=None,
+                        help="Tool type weights, e.g. 'Pneumatic Drill=3,Digital Torque Wrench=1' (default: uniform)")
+    parser.add_argument('--out', default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    generate_synthetic_data(args.rows, seed=args.seed, chunk_rows=args.chunk_rows,
+                            type_probs=parse_type_mix(args.mix) if args.mix else None, out_path=args.out)
@@ -3,6 +3,11 @@ import sqlite3
 import json
 import random
 from datetime import datetime, timedelta
+import feature_store
+import calibration_calendar
+import alert_engine
+import cabinet_registry
+import cabinet_allowlist
 
 connection = sqlite3.connect('database.db')
 cursor = connection.cursor()
@@ -15,6 +20,15 @@ cursor.executescript("""
     DROP TABLE IF EXISTS audit_log;
     DROP TABLE IF EXISTS tools;
     DROP TABLE IF EXISTS users;
+    DROP TABLE IF EXISTS tool_features;
+    DROP TABLE IF EXISTS tool_feature_users;
+    DROP TABLE IF EXISTS forecast_predictions;
+    DROP TABLE IF EXISTS forecast_dirty;
+    DROP TABLE IF EXISTS forecast_state;
+    DROP TABLE IF EXISTS calibration_calendar;
+    DROP TABLE IF EXISTS active_alerts;
+    DROP TABLE IF EXISTS alert_deadlines;
+    DROP TABLE IF EXISTS alert_history;
     
     CREATE TABLE users (
         id TEXT PRIMARY KEY,
@@ -134,11 +148,10 @@ tools_data.append(('ALERT-01', 'M-TEST', 'Overdue Checkout Tool', 'In Use', 'USR
 tools_data.append(('AI-TEST', 'M-AI', 'AI Calibration Test Tool', 'Available', None, (today + timedelta(days=7)).strftime('%Y-%m-%d')))
 
 # Insert all generated tools
-for tool in tools_data:
-    cursor.execute("""
-        INSERT INTO tools (id, model, name, status, current_holder, calibration_due)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, tool)
+cursor.executemany("""
+    INSERT INTO tools (id, model, name, status, current_holder, calibration_due)
+    VALUES (?, ?, ?, ?, ?, ?)
+""", tools_data)
 
 # 5. SEED PROJECTS (Full List 001-017)
 projects_data = [
@@ -194,13 +207,30 @@ projects_data = [
      json.dumps(["M-RIVET", "M-MULTI"]))
 ]
 
-for project in projects_data:
-    cursor.execute("INSERT INTO projects (id, name, briefing, tool_list) VALUES (?, ?, ?, ?)", project)
+cursor.executemany("INSERT INTO projects (id, name, briefing, tool_list) VALUES (?, ?, ?, ?)", projects_data)
 
 # 6. SEED AUDIT LOG
 cursor.execute("INSERT INTO audit_log (user_id, action, details) VALUES (?, ?, ?)", 
                ('USR-001', 'SYSTEM_RESET', f'Mass Inventory Generated: {len(tools_data)} Tools'))
 
+# 7. MODEL FEATURE STORE
+feature_store.ensure_schema(connection)
+feature_store.backfill_missing(connection)
+
+# 8. CALIBRATION CALENDAR (per-day due counts, trigger-maintained from here on)
+calibration_calendar.ensure_schema(connection)
+calibration_calendar.rebuild_calendar(connection)
+
+# 9. ALERT ENGINE (current alerts + deadlines, event-maintained from here on)
+alert_engine.ensure_schema(connection)
+alert_engine.rebuild(connection)
+
+# 10. CABINET SLOT MAPS (not dropped above: they describe wiring, not demo data)
+cabinet_registry.ensure_schema(connection)
+
+# 11. CABINET BADGE ALLOWLIST (users were re-created: new epoch, cabinets resync in full)
+cabinet_allowlist.rebuild(connection)
+
 connection.commit()
 connection.close()
 
@@ -1,72 +1,209 @@
+# monitor_db.py
+# Live terminal view of the tools table while testing checkouts/checkins.
+#
+# Nothing is queried until the database actually changes: PRAGMA data_version (a counter
+# SQLite bumps whenever another connection commits) is checked a few times a second, and
+# only then are the tool rows re-read and the new transactions (by id) pulled in. Those
+# new transactions also drive the live checkouts/min figure. The screen is drawn with
+# curses, which only sends the characters that changed; rows that just changed are
+# highlighted for a moment.
+#
+#   python monitor_db.py                         tools In Use
+#   python monitor_db.py --status "Under Maintenance" --model M-DRILL --holder USR-001
+#   python monitor_db.py --ids TW-001 TW-999     specific tools (and anything In Use)
+#   python monitor_db.py --all --plain           every tool, printed only when it changes
+import argparse
 import sqlite3
-import time
-import os
 import sys
+import time
+from collections import deque
+from datetime import datetime
 
 # Configuration
 DB_PATH = 'database.db'
-REFRESH_RATE = 1.0  # Seconds
-
-def clear_screen():
-    # Clears the terminal window
-    os.system('cls' if os.name == 'nt' else 'clear')
+POLL_S = 0.25          # data_version check interval (no query unless something committed)
+RATE_WINDOW_S = 60     # checkouts/min is counted over this window
+HIGHLIGHT_S = 3        # how long a changed row stays highlighted
 
 def get_db():
     return sqlite3.connect(DB_PATH)
 
-def monitor():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    print("👀 STARTING DATABASE MONITOR...")
-    time.sleep(1)
+def data_version(conn):
+    return conn.execute('PRAGMA data_version').fetchone()[0]
 
-    try:
-        while True:
-            # 1. Fetch Data (Only showing relevant columns for clarity)
-            # We filter for tools that are "In Use" OR your specific demo tools (e.g., TW-001)
-            # Change 'TW-001' to whatever tool ID you are testing with.
-            cursor.execute("""
-                SELECT id, name, status, current_holder, total_checkouts 
-                FROM tools 
-                WHERE status = 'In Use' OR id IN ('TW-001', 'TW-999')
-                ORDER BY id ASC
-            """)
-            rows = cursor.fetchall()
-
-            # 2. Draw the Interface
-            clear_screen()
-            print("===================================================================")
-            print(f"🔴 LIVE DATABASE MONITOR | {time.strftime('%H:%M:%S')}")
-            print("===================================================================")
-            print(f"{'ID':<10} | {'STATUS':<12} | {'HOLDER':<10} | {'NAME'}")
-            print("-" * 65)
+def build_query(args):
+    """SELECT for the rows to show, from the command-line filters."""
+    where, params = [], []
+    if not args.all:
+        statuses = args.status or ['In Use']
+        where.append(f"status IN ({','.join('?' * len(statuses))})")
+        params += statuses
+    for column, values in (('model', args.model), ('current_holder', args.holder)):
+        if values:
+            where.append(f"{column} IN ({','.join('?' * len(values))})")
+            params += values
+    sql = 'SELECT id, name, model, status, current_holder, total_checkouts FROM tools'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if args.ids:  # named tools are always shown, whatever the other filters say
+        sql += (' OR ' if where else ' WHERE ') + f"id IN ({','.join('?' * len(args.ids))})"
+        params += args.ids
+    return sql + ' ORDER BY id ASC LIMIT ?', params + [args.limit]
+
+def describe_filters(args):
+    parts = ['all tools' if args.all else 'status ' + '/'.join(args.status or ['In Use'])]
+    if args.model:
+        parts.append('model ' + '/'.join(args.model))
+    if args.holder:
+        parts.append('holder ' + '/'.join(args.holder))
+    if args.ids:
+        parts.append('+ ' + ', '.join(args.ids))
+    return ', '.join(parts)
+
+# ==========================================
+#           CHANGE FEED
+# ==========================================
+
+class Feed:
+    """Re-reads tools and the new transactions only when data_version moves."""
+
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.sql, self.params = build_query(args)
+        self.version = None
+        self.rows = []
+        self.changed_at = {}   # tool id -> when its row last changed
+        self.recent = deque()  # (seen_at, 'checkout' | 'checkin') within RATE_WINDOW_S
+        self.queries = 0
+        self.polls = 0
+        self.last_tx_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+        # Start the rate from what happened in the last window, not from zero
+        now = time.time()
+        for tx_type, stamp in conn.execute('''
+                SELECT type, timestamp FROM transactions WHERE timestamp >= datetime('now', ?)
+            ''', (f"-{RATE_WINDOW_S} seconds",)):
+            try:
+                age = (datetime.utcnow() - datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S')).total_seconds()
+            except (TypeError, ValueError):
+                continue
+            self.recent.append((now - max(age, 0), tx_type))
+
+    def poll(self):
+        """True if the database changed since the last poll (and the rows were re-read)."""
+        self.polls += 1
+        version = data_version(self.conn)
+        if version == self.version:
+            return False
+        self.version = version
+        self.queries += 1
+        now = time.time()
+
+        old = {row[0]: row for row in self.rows}
+        self.rows = self.conn.execute(self.sql, self.params).fetchall()
+        for row in self.rows:
+            if old.get(row[0]) != row:
+                self.changed_at[row[0]] = now
 
-            if not rows:
-                print("   (No active tools found matching criteria...)")
-            
-            for r in rows:
-                id_, name, status, holder, checks = r
-                
-                # Visual Highlight for 'In Use'
-                status_str = status
-                if status == 'In Use':
-                    status_str = f"► {status} ◄" 
-                
-                holder_str = holder if holder else "---"
-                
-                print(f"{id_:<10} | {status_str:<12} | {holder_str:<10} | {name}")
-
-            print("\n-------------------------------------------------------------------")
-            print("Press Ctrl+C to Stop")
-            
-            # 3. Wait
-            time.sleep(REFRESH_RATE)
+        for tx_id, tx_type in self.conn.execute(
+                'SELECT id, type FROM transactions WHERE id > ? ORDER BY id', (self.last_tx_id,)):
+            self.last_tx_id = tx_id
+            self.recent.append((now, tx_type))
+        return True
 
+    def per_minute(self, tx_type):
+        cutoff = time.time() - RATE_WINDOW_S
+        while self.recent and self.recent[0][0] < cutoff:
+            self.recent.popleft()
+        return sum(1 for _, t in self.recent if t == tx_type) * 60 / RATE_WINDOW_S
+
+# ==========================================
+#           DISPLAY
+# ==========================================
+
+def format_row(row):
+    id_, name, model, status, holder, checks = row
+    # Visual Highlight for 'In Use'
+    status_str = f"► {status} ◄" if status == 'In Use' else status
+    return f"{id_:<10} | {status_str:<18} | {(holder or '---'):<10} | {model or '':<12} | {checks or 0:>5} | {name}"
+
+def header_lines(feed, filters):
+    return [
+        f"🔴 LIVE DATABASE MONITOR | {time.strftime('%H:%M:%S')} | {len(feed.rows)} tools | {filters}",
+        f"   checkouts/min {feed.per_minute('checkout'):>5.1f} | checkins/min {feed.per_minute('checkin'):>5.1f}"
+        f" | {feed.queries} queries in {feed.polls} polls",
+        f"{'ID':<10} | {'STATUS':<18} | {'HOLDER':<10} | {'MODEL':<12} | {'OUTS':>5} | NAME",
+    ]
+
+def run_curses(stdscr, feed, filters):
+    import curses
+    curses.curs_set(0)
+    stdscr.timeout(int(POLL_S * 1000))  # getch() doubles as the poll wait
+    while True:
+        feed.poll()
+        height, width = stdscr.getmaxyx()
+        stdscr.erase()  # curses only sends what differs from the last refresh
+        for y, line in enumerate(header_lines(feed, filters)):
+            stdscr.addnstr(y, 0, line, width - 1, curses.A_BOLD if y == 0 else 0)
+        stdscr.addnstr(3, 0, '-' * (width - 1), width - 1)
+        now = time.time()
+        visible = feed.rows[:max(height - 6, 0)]
+        if not feed.rows:
+            stdscr.addnstr(4, 0, "   (No tools match the filters...)", width - 1)
+        for y, row in enumerate(visible, start=4):
+            fresh = now - feed.changed_at.get(row[0], 0) < HIGHLIGHT_S
+            stdscr.addnstr(y, 0, format_row(row), width - 1, curses.A_REVERSE if fresh else 0)
+        if len(feed.rows) > len(visible):
+            stdscr.addnstr(height - 2, 0, f"   ... {len(feed.rows) - len(visible)} more", width - 1)
+        stdscr.addnstr(height - 1, 0, "Press q (or Ctrl+C) to Stop", width - 1)
+        stdscr.refresh()
+        if stdscr.getch() in (ord('q'), ord('Q')):
+            return
+
+def run_plain(feed, filters):
+    """No terminal control: prints the table only when the database changed."""
+    while True:
+        if feed.poll():
+            print("\n===================================================================")
+            for line in header_lines(feed, filters):
+                print(line)
+            print("-" * 65)
+            if not feed.rows:
+                print("   (No tools match the filters...)")
+            for row in feed.rows:
+                print(format_row(row))
+        time.sleep(POLL_S)
+
+def monitor(args):
+    conn = get_db()
+    feed = Feed(conn, args)
+    filters = describe_filters(args)
+    print("👀 STARTING DATABASE MONITOR...")
+    try:
+        if args.plain or not sys.stdout.isatty():
+            run_plain(feed, filters)
+        else:
+            try:
+                import curses
+            except ImportError:  # e.g. Windows without windows-curses
+                run_plain(feed, filters)
+            else:
+                curses.wrapper(run_curses, feed, filters)
     except KeyboardInterrupt:
-        print("\nStopping Monitor...")
+        pass
     finally:
+        print("\nStopping Monitor...")
         conn.close()
 
 if __name__ == "__main__":
-    monitor()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Live view of the tools table, redrawn only when it changes.")
+    parser.add_argument('--status', nargs='+', help="Statuses to show (default: In Use)")
+    parser.add_argument('--model', nargs='+', help="Only these models")
+    parser.add_argument('--holder', nargs='+', help="Only tools held by these users")
+    parser.add_argument('--ids', nargs='+', help="Always show these tool IDs (e.g. TW-001 TW-999)")
+    parser.add_argument('--all', action='store_true', help="Any status")
+    parser.add_argument('--limit', type=int, default=500, help="Max rows fetched")
+    parser.add_argument('--plain', action='store_true', help="Print changes instead of a full-screen view")
+    parser.add_argument('--db', default=DB_PATH)
+    args = parser.parse_args()
+    DB_PATH = args.db
+    monitor(args)
@@ -0,0 +1,443 @@
+# seed_history.py
+# Builds a synthetic fleet with months of consistent history: the standard dataset for
+# benchmarks and for seeing how the app behaves after a year of use.
+#
+# Technicians work fixed shifts; each shift a share of the fleet is checked out and back in
+# by that shift's technicians. A return can come with an issue report (the tool then sits
+# Under Maintenance until the case is closed), and every tool is calibrated on its model's
+# interval, sometimes late (Overdue in between, not handed out). The final tool rows
+# (status, holder, totals, calibration_due) are what that history leaves behind, and the
+# audit log has the same entries app.py would have written.
+#
+# The history is generated in memory and written with executemany (multi-row INSERTs) in one
+# transaction with the journal and fsyncs off, into a temp file that replaces --db only once
+# it is complete. The feature store is filled from the same replay (the app's per-event
+# hooks, not a backfill over history); the trigger-maintained tables (calendar, alerts,
+# allowlist) didn't exist during the load and are rebuilt afterwards as init_db.py does.
+#
+# Usage: python seed_history.py [--tools 2000] [--users 200] [--days 365] [--shifts 2] [--db bench.db]
+#        python seed_history.py --db database.db     # run app.py on it
+#        python seed_history.py --until '2026-01-05 09:00'   # same dataset every run
+import argparse
+import heapq
+from itertools import chain
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import feature_store
+import calibration_calendar
+import alert_engine
+import cabinet_registry
+import cabinet_allowlist
+from cabinet_controller import badge_uid
+from cabinet_scanner import format_uid
+
+SHIFT_STARTS = (6, 14, 22)   # UTC hour each shift starts; --shifts uses the first N
+SHIFT_MIN = 8 * 60
+CHECKOUT_WINDOW_MIN = 6 * 60   # checkouts happen in the first 6 h of a shift
+MEAN_USE_MIN = 150
+FLUSH_ROWS = 200000
+MAX_VARIABLES = 999    # SQLite's lowest compiled-in limit on ? per statement
+
+# Same fleet mix as init_db.py, scaled to --tools
+FLEET_MIX = [
+    ('DR', 'M-DRILL', 'Pneumatic Drill', 25),
+    ('RT', 'M-RIVET', 'Rivet Gun (Pneumatic)', 25),
+    ('TW', 'M-TW-DIG', 'Digital Torque Wrench', 25),
+    ('MM', 'M-MULTI', 'Digital Multimeter', 25),
+    ('CAL', 'M-CAL', 'Pressure Calibrator', 20),
+    ('SK', 'M-SOCK', 'Socket Wrench Set', 20),
+    ('CL', 'M-CLAMP', 'Current Clamp Meter', 10),
+    ('BO', 'M-BORE', 'Borescope Camera', 8),
+    ('VT', 'M-VID', 'Video Inspection Probe', 5),
+]
+CAL_INTERVAL_DAYS = {'M-CAL': 90, 'M-TW-DIG': 180, 'M-MULTI': 365, 'M-CLAMP': 365, 'M-SOCK': 730}
+DEFAULT_CAL_INTERVAL_DAYS = 180
+DEFECTS = [('Calibration Error', 'Reading off against the reference'),
+           ('Physical Damage', 'Housing cracked after a drop'),
+           ('Battery Issue', 'Does not hold charge'),
+           ('Other', 'Intermittent fault, needs a look')]
+OPEN_ISSUE_STATUSES = ['New', 'Working on it', 'On Hold']
+FIRST_NAMES = ['Sarah', 'John', 'Maya', 'David', 'Alex', 'Ellen', 'Priya', 'Tom', 'Aisha', 'Ken',
+               'Lucia', 'Omar', 'Nina', 'Ravi', 'Grace', 'Leo', 'Mei', 'Sam', 'Ines', 'Jonas']
+LAST_NAMES = ['Adams', 'Doe', 'Lin', 'Chen', 'Rogan', 'Ripley', 'Patel', 'Novak', 'Khan', 'Sato',
+              'Garcia', 'Haddad', 'Berg', 'Iyer', 'Okafor', 'Moreau', 'Wong', 'Silva', 'Kowal', 'Vogel']
+
+# Same tables as init_db.py (tools with the nfc_id column app.py reads)
+SCHEMA = '''
+    CREATE TABLE users (
+        id TEXT PRIMARY KEY, name TEXT NOT NULL, role TEXT NOT NULL, contact_id TEXT, nfc_id TEXT
+    );
+    CREATE TABLE tools (
+        id TEXT PRIMARY KEY, model TEXT NOT NULL, name TEXT NOT NULL, status TEXT NOT NULL,
+        current_holder TEXT, calibration_due TEXT,
+        total_checkouts INTEGER DEFAULT 0, total_usage_hours REAL DEFAULT 0.0, nfc_id TEXT
+    );
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, tool_id TEXT NOT NULL,
+        type TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, last_alert_sent DATETIME,
+        FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(tool_id) REFERENCES tools(id)
+    );
+    CREATE TABLE issue_reports (
+        id TEXT PRIMARY KEY, tool_id TEXT, reporter_id TEXT, defect_type TEXT, description TEXT,
+        status TEXT DEFAULT 'New', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, closed_at TIMESTAMP,
+        FOREIGN KEY(tool_id) REFERENCES tools(id), FOREIGN KEY(reporter_id) REFERENCES users(id)
+    );
+    CREATE TABLE projects (
+        id TEXT PRIMARY KEY, name TEXT NOT NULL, briefing TEXT NOT NULL, tool_list TEXT NOT NULL
+    );
+    CREATE TABLE audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_id TEXT, action TEXT NOT NULL, details TEXT
+    );
+'''
+
+LOAD_PRAGMAS = '''
+    PRAGMA journal_mode = OFF;
+    PRAGMA synchronous = OFF;
+    PRAGMA locking_mode = EXCLUSIVE;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -262144;
+'''
+
+def bulk_insert(conn, table, columns, rows):
+    """executemany with as many rows per INSERT as the variable limit allows.
+
+    One row per statement makes AUTOINCREMENT tables update sqlite_sequence per row;
+    multi-row VALUES loads the same rows about 2.5x faster.
+    """
+    per = max(1, MAX_VARIABLES // len(columns))
+    head = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    row_marks = f"({', '.join('?' * len(columns))})"
+    full = len(rows) // per * per
+    if full:
+        conn.executemany(head + ', '.join([row_marks] * per),
+                         (list(chain.from_iterable(rows[i:i + per])) for i in range(0, full, per)))
+    if full < len(rows):
+        conn.execute(head + ', '.join([row_marks] * (len(rows) - full)), list(chain.from_iterable(rows[full:])))
+
+# Event kinds, in the order they are applied when they share a minute
+CHECKIN, CHECKOUT, RESOLVED, CALIBRATED = range(4)
+
+# ==========================================
+#           FLEET & PEOPLE
+# ==========================================
+
+def make_users(count, shifts, rng):
+    """One supervisor per 20 people, the rest badged technicians spread over the shifts."""
+    users, techs_by_shift, seen = [], [[] for _ in range(shifts)], set()
+    width = max(3, len(str(count)))
+    for i in range(count):
+        user_id = f"USR-{i + 1:0{width}d}"
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if i % 20 == 0:
+            users.append((user_id, name, 'Supervisor', None, None))
+            continue
+        badge = rng.getrandbits(32)
+        while badge in seen:
+            badge = rng.getrandbits(32)
+        seen.add(badge)
+        users.append((user_id, name, 'Technician', None, badge_uid(badge.to_bytes(4, 'big'))))
+        techs_by_shift[i % shifts].append(user_id)
+    if not all(techs_by_shift):
+        raise SystemExit("❌ Not enough users for one technician per shift")
+    return users, techs_by_shift
+
+def make_tools(count, rng):
+    """(id, model, name, nfc_id) in init_db.py's proportions."""
+    weight = sum(share for *_, share in FLEET_MIX)
+    tools, seen = [], set()
+    for n, (prefix, model, name, share) in enumerate(FLEET_MIX):
+        size = count - len(tools) if n == len(FLEET_MIX) - 1 else round(count * share / weight)
+        width = max(3, len(str(size)))
+        for i in range(1, size + 1):
+            tag = rng.getrandbits(56)
+            while tag in seen:
+                tag = rng.getrandbits(56)
+            seen.add(tag)
+            tools.append((f"{prefix}-{i:0{width}d}", model, name, format_uid(tag.to_bytes(7, 'big'))))
+    return tools
+
+def calibration_plan(interval_min, now_m, rng):
+    """Calibration times up to now, the overdue windows (due, done) between them, and the next due."""
+    done, windows = [], []
+    last = -rng.randrange(interval_min)
+    while True:
+        due = last + interval_min
+        # Most tools are calibrated in the two weeks before they fall due, some go overdue
+        lag = rng.randrange(1, 10 * 1440) if rng.random() < 0.3 else -rng.randrange(14 * 1440)
+        at = max(due + lag, 0)
+        if at > now_m:
+            if due < now_m:
+                windows.append((due, at))  # overdue right now
+            return done, windows, due
+        done.append(at)
+        if at > due:
+            windows.append((due, at))
+        last = at
+
+# ==========================================
+#           HISTORY
+# ==========================================
+
+def generate(conn, args, rng):
+    now = (datetime.strptime(args.until, '%Y-%m-%d %H:%M') if args.until
+           else datetime.utcnow().replace(second=0, microsecond=0))
+    start = datetime(now.year, now.month, now.day) - timedelta(days=args.days)
+    now_m = int((now - start).total_seconds() // 60)
+    # 'YYYY-MM-DD HH:MM:SS' without strftime per row: day prefix + minute-of-day suffix
+    day_str = [(start + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(args.days + 2)]
+    minute_str = [f" {m // 60:02d}:{m % 60:02d}:00" for m in range(1440)]
+
+    def stamp(m):
+        return day_str[m // 1440] + minute_str[m % 1440]
+
+    users, techs_by_shift = make_users(args.users, args.shifts, rng)
+    tools = make_tools(args.tools, rng)
+    n = len(tools)
+    tool_ids = [t[0] for t in tools]
+    checkout_details = {name: json.dumps({'tool': name}) for _, _, name, _ in FLEET_MIX}
+    checkout_detail = [checkout_details[t[2]] for t in tools]
+
+    user_at = {user[0]: i for i, user in enumerate(users)}
+    seen_pairs = bytearray((n * len(users) + 7) // 8)  # (tool, user) bitmap -> unique_users
+
+    checkouts = [0] * n
+    checkins = [0] * n
+    failures = [0] * n
+    unique_users = [0] * n
+    first_m = [None] * n
+    usage_min = [0] * n
+    holder = [None] * n          # open checkout at the end of the history
+    blocked_until = [0] * n      # Under Maintenance until this minute
+    open_issue = [None] * n
+    last_calibrated = [None] * n  # minute of the last calibration / repair
+    windows, window_at, next_due = [], [0] * n, []
+    draws = np.random.default_rng(rng.getrandbits(64))
+    pending = []                 # heap of (minute, kind, tool, payload): repairs and calibrations
+    for t, (_, model, _, _) in enumerate(tools):
+        done, overdue, due = calibration_plan(CAL_INTERVAL_DAYS.get(model, DEFAULT_CAL_INTERVAL_DAYS) * 1440,
+                                              now_m, rng)
+        windows.append(overdue)
+        next_due.append(due)
+        for at in done:
+            pending.append((at, CALIBRATED, t, None))
+    heapq.heapify(pending)
+
+    tx_rows, audit_rows, pair_rows, issues = [], [], [], []
+    counts = {'transactions': 0, 'audit_log': 0, 'tool_feature_users': 0}
+
+    def flush(final=False):
+        if tx_rows and (final or len(tx_rows) >= FLUSH_ROWS):
+            bulk_insert(conn, 'transactions', ('user_id', 'tool_id', 'type', 'timestamp'), tx_rows)
+            counts['transactions'] += len(tx_rows)
+            tx_rows.clear()
+        if audit_rows and (final or len(audit_rows) >= FLUSH_ROWS):
+            bulk_insert(conn, 'audit_log', ('timestamp', 'user_id', 'action', 'details'), audit_rows)
+            counts['audit_log'] += len(audit_rows)
+            audit_rows.clear()
+        if pair_rows and (final or len(pair_rows) >= FLUSH_ROWS):
+            bulk_insert(conn, 'tool_feature_users', ('tool_id', 'user_id'), pair_rows)
+            counts['tool_feature_users'] += len(pair_rows)
+            pair_rows.clear()
+
+    def apply(events):
+        events.sort()  # by minute, then kind (never two events of one kind for a tool in a minute)
+        for m, kind, t, payload in events:
+            ts = stamp(m)
+            if kind == CHECKOUT:
+                tx_rows.append((payload, tool_ids[t], 'checkout', ts))
+                audit_rows.append((ts, payload, 'TOOL_CHECKOUT', checkout_detail[t]))
+            elif kind == CHECKIN:
+                user, minutes, issue = payload
+                tx_rows.append((user, tool_ids[t], 'checkin', ts))
+                final_status = 'Under Maintenance' if issue else 'Available'
+                audit_rows.append((ts, user, 'TOOL_CHECKIN',
+                                   f'{{"tool_id": "{tool_ids[t]}", "hours_used": "{minutes / 60:.2f}", '
+                                   f'"final_status": "{final_status}"}}'))
+                if issue:
+                    audit_rows.append((ts, user, 'ISSUE_REPORTED', f'{{"report_id": "{issue}"}}'))
+            elif kind == RESOLVED:
+                audit_rows.append((ts, 'SUPERVISOR', 'ISSUE_RESOLVED',
+                                   f'{{"issue_id": "{payload}", "tool_id": "{tool_ids[t]}"}}'))
+            else:
+                audit_rows.append((ts, 'USR-001', 'TOOL_UPDATED', f'{{"tool_id": "{tool_ids[t]}"}}'))
+        flush()
+
+    def pop_until(end):
+        events = []
+        while pending and pending[0][0] < end and pending[0][0] <= now_m:
+            m, kind, t, payload = heapq.heappop(pending)
+            if kind == CALIBRATED:
+                last_calibrated[t] = m
+            elif kind == RESOLVED:
+                open_issue[t] = None
+                last_calibrated[t] = m  # a repaired tool is re-checked before going back
+            events.append((m, kind, t, payload))
+        return events
+
+    shift_starts = SHIFT_STARTS[:args.shifts]
+    p = args.utilization
+    for day in range(args.days + 1):
+        for s, hour in enumerate(shift_starts):
+            t0 = day * 1440 + hour * 60
+            if t0 >= now_m:
+                break
+            window_end = t0 + (shift_starts[s + 1] - hour if s + 1 < len(shift_starts)
+                               else 24 - hour + shift_starts[0]) * 60
+            events = []
+
+            # The shift's random draws in bulk; the loop below only applies them
+            techs = techs_by_shift[s]
+            picked = draws.choice(n, draws.binomial(n, p), replace=False)
+            k = len(picked)
+            starts = (t0 + draws.integers(0, CHECKOUT_WINDOW_MIN, k)).tolist()
+            uses = (15 + draws.exponential(MEAN_USE_MIN, k)).astype(int).tolist()
+            who = draws.integers(0, len(techs), k).tolist()
+            faulty = (draws.random(k) < args.issue_rate).tolist()
+            for t, out_m, minutes, u, fault in zip(picked.tolist(), starts, uses, who, faulty):
+                if out_m >= now_m or out_m < blocked_until[t]:
+                    continue
+                overdue, i = windows[t], window_at[t]
+                while i < len(overdue) and overdue[i][1] <= out_m:
+                    i += 1
+                window_at[t] = i
+                if i < len(overdue) and overdue[i][0] <= out_m:
+                    continue  # calibration overdue: not handed out
+                user = techs[u]
+                minutes = min(minutes, t0 + SHIFT_MIN - out_m)
+                checkouts[t] += 1
+                if first_m[t] is None:
+                    first_m[t] = out_m
+                bit = t * len(users) + user_at[user]
+                if not seen_pairs[bit >> 3] & (1 << (bit & 7)):
+                    seen_pairs[bit >> 3] |= 1 << (bit & 7)
+                    unique_users[t] += 1
+                    pair_rows.append((tool_ids[t], user))
+                events.append((out_m, CHECKOUT, t, user))
+                in_m = out_m + minutes
+                if in_m > now_m:
+                    holder[t] = user  # still out right now
+                    continue
+                usage_min[t] += minutes
+                checkins[t] += 1
+                issue = None
+                if fault:
+                    failures[t] += 1
+                    issue = f"REP-{len(issues) + 1:08X}"
+                    defect, description = rng.choice(DEFECTS)
+                    fixed_m = in_m + rng.randrange(720, 5 * 1440)
+                    closed = fixed_m <= now_m
+                    issues.append((issue, tool_ids[t], user, defect, description,
+                                   'Closed' if closed else rng.choice(OPEN_ISSUE_STATUSES),
+                                   stamp(in_m), stamp(fixed_m) if closed else None))
+                    blocked_until[t] = fixed_m
+                    open_issue[t] = issue
+                    heapq.heappush(pending, (fixed_m, RESOLVED, t, issue))
+                events.append((in_m, CHECKIN, t, (user, minutes, issue)))
+            # Calibrations and repairs falling in this window (incl. ones this shift just scheduled)
+            apply(events + pop_until(window_end))
+    apply(pop_until(now_m + 1))
+    flush(final=True)
+
+    # Final tool rows: whatever state the history left them in
+    today = now.strftime('%Y-%m-%d')
+
+    def date_of(m):
+        return day_str[m // 1440] if m is not None else None
+
+    tool_rows, feature_rows = [], []
+    for t, (tool_id, model, name, tag) in enumerate(tools):
+        due = (start + timedelta(minutes=next_due[t])).strftime('%Y-%m-%d')
+        if holder[t]:
+            status = 'In Use'
+        elif open_issue[t]:
+            status = 'Under Maintenance'
+        elif due < today:
+            status = 'Overdue'
+        else:
+            status = 'Available'
+        tool_rows.append((tool_id, model, name, status, holder[t], due, checkouts[t],
+                          round(usage_min[t] / 60, 2), tag))
+        # Feature store row as the app's O(1) hooks would have left it (no backfill over history)
+        criticality, stress = feature_store.profile_for_model(model)
+        feature_rows.append((tool_id, date_of(first_m[t]) or today, checkouts[t], checkins[t],
+                             round(usage_min[t] / 60, 2), unique_users[t], failures[t],
+                             date_of(last_calibrated[t]), criticality, stress))
+
+    conn.executemany('INSERT INTO users (id, name, role, contact_id, nfc_id) VALUES (?, ?, ?, ?, ?)', users)
+    conn.executemany('''
+        INSERT INTO tools (id, model, name, status, current_holder, calibration_due, total_checkouts, total_usage_hours, nfc_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', tool_rows)
+    conn.executemany('''
+        INSERT INTO issue_reports (id, tool_id, reporter_id, defect_type, description, status, created_at, closed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', issues)
+    conn.executemany('''
+        INSERT INTO tool_features
+            (tool_id, created_at, total_checkouts, completed_checkouts, total_usage_hours,
+             unique_users, past_failures, last_calibration_date, criticality_score, env_stress_index)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', feature_rows)
+    conn.execute('INSERT INTO audit_log (user_id, action, details) VALUES (?, ?, ?)',
+                 ('USR-001', 'SYSTEM_RESET', f'Synthetic history generated: {n} tools, {args.days} days'))
+    counts.update(users=len(users), tools=n, issue_reports=len(issues), tool_features=n)
+    counts['audit_log'] += 1
+    return counts
+
+def rebuild_derived(conn):
+    """Calendar, alerts and allowlist, built once from the loaded tables."""
+    calibration_calendar.ensure_schema(conn)
+    calibration_calendar.rebuild_calendar(conn)
+    alert_engine.ensure_schema(conn)
+    alert_engine.rebuild(conn)
+    cabinet_registry.ensure_schema(conn)
+    cabinet_allowlist.rebuild(conn)
+
+def seed(args):
+    rng = random.Random(args.seed)
+    tmp_path = f"{args.db}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    started = time.perf_counter()
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        conn.executescript(LOAD_PRAGMAS + SCHEMA)
+        feature_store.ensure_schema(conn)  # no triggers: filled by generate()
+        conn.execute('BEGIN')
+        counts = generate(conn, args, rng)
+        conn.execute('COMMIT')
+        loaded = time.perf_counter() - started
+        # ensure_schema() uses executescript, which commits on its own: a second transaction
+        rebuild_derived(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, args.db)
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    print(f"✅ {args.db}: {rows:,} rows in {elapsed:.1f} s "
+          f"(history {loaded:.1f} s, {rows / loaded:,.0f} rows/s; derived tables {elapsed - loaded:.1f} s)")
+    for table, count in counts.items():
+        print(f"   {table:<14} {count:>12,}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic fleet with consistent checkout history.")
+    parser.add_argument('--tools', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365, help="Days of history before today")
+    parser.add_argument('--shifts', type=int, default=2, choices=[1, 2, 3], help="Shifts per day")
+    parser.add_argument('--utilization', type=float, default=0.35, help="Share of the fleet checked out per shift")
+    parser.add_argument('--issue-rate', type=float, default=0.002, help="Chance a return comes with an issue report")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--until', help="End of the history, UTC 'YYYY-MM-DD HH:MM' (default now); "
+                                         "fixed with --seed, the dataset is identical on every run")
+    parser.add_argument('--db', default='bench.db', help="Output database (replaced); database.db to run app.py on it")
+    seed(parser.parse_args())
@@ -1,9 +1,11 @@
 # telegram_manager.py
+import os
 import requests
+from requests.adapters import HTTPAdapter
 import sqlite3
 import json
 import uuid
-from datetime import datetime
+import feature_store
 
 def main():
     print("🤖 Technician Assistant Bot is Running...")
@@ -26,7 +28,15 @@ def main():
 # --- CONFIGURATION ---
 # Your Token
 BOT_TOKEN = "7881248009:AAFL7ireDLLl63VXc3XwdEwp1kj49UDDg9Y"
-BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+# Point at a local fake (fake_telegram_server.py) for testing
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+BASE_URL = f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}"
+HTTP_TIMEOUT_S = 10
+
+# One keep-alive session for every Telegram call (bot workers, FOD timer, routes).
+# The connection pool is thread-safe; size it for the bot's worker pool.
+session = requests.Session()
+session.mount(TELEGRAM_API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=16))
 
 # Supervisor ID (Replace if you have a specific ID)
 SUPERVISOR_CHAT_ID = "954223496" 
@@ -36,74 +46,75 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
-def send_telegram_message(chat_id, text):
-    """Sends a message to a specific Telegram user."""
+def send_telegram_message(chat_id, text, reply_to=None):
+    """Sends a message to a specific Telegram user (optionally as a reply to one of theirs)."""
     if not chat_id:
         return
     try:
         url = f"{BASE_URL}/sendMessage"
         payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
-        requests.post(url, json=payload)
+        if reply_to:
+            payload["reply_to_message_id"] = reply_to
+        session.post(url, json=payload, timeout=HTTP_TIMEOUT_S)
     except Exception as e:
         print(f"⚠️ Telegram Send Error: {e}")
 
-# --- FEATURE 3A: Anti-Spam Notification Logic ---
-# telegram_manager.py (Updated Function)
-
-def check_and_notify_users():
-    """Checks for tools held too long and warns users (State-Aware)."""
-    conn = get_db_connection()
-    try:
-        # 1. USER WARNINGS (7-8 Hours)
-        warnings = conn.execute('''
-            SELECT t.name as tool_name, u.contact_id, u.name as user_name, tr.id as tx_id
-            FROM tools t
-            JOIN users u ON t.current_holder = u.id
-            JOIN transactions tr ON t.id = tr.tool_id
-            WHERE t.status = 'In Use' 
-            AND tr.type = 'checkout'
-            -- BUG FIX: Only look at the LATEST checkout transaction
-            AND tr.id = (SELECT MAX(id) FROM transactions WHERE tool_id = t.id AND type = 'checkout')
-            AND tr.timestamp < datetime('now', '-7 hours')
-            AND tr.timestamp > datetime('now', '-8 hours')
-            AND (tr.last_alert_sent IS NULL OR tr.last_alert_sent < datetime('now', '-24 hours'))
-        ''').fetchall()
-
-        for w in warnings:
-            if w['contact_id']:
-                msg = f"⚠️ **7-Hour Warning**\nHi {w['user_name']}, you have held the *{w['tool_name']}* for over 7 hours.\nPlease return it soon to avoid a Critical FOD Violation."
-                send_telegram_message(w['contact_id'], msg)
-                
-                conn.execute("UPDATE transactions SET last_alert_sent = datetime('now') WHERE id = ?", (w['tx_id'],))
-                conn.commit()
-                print(f"Sent warning to {w['user_name']}")
-
-        # 2. CRITICAL ALERTS (> 8 Hours)
-        criticals = conn.execute('''
-            SELECT t.name as tool_name, u.name as user_name, tr.id as tx_id
-            FROM tools t
-            JOIN users u ON t.current_holder = u.id
-            JOIN transactions tr ON t.id = tr.tool_id
-            WHERE t.status = 'In Use' 
-            AND tr.type = 'checkout'
-            -- BUG FIX: Only look at the LATEST checkout transaction
-            AND tr.id = (SELECT MAX(id) FROM transactions WHERE tool_id = t.id AND type = 'checkout')
-            AND tr.timestamp < datetime('now', '-8 hours')
-            AND (tr.last_alert_sent IS NULL OR tr.last_alert_sent < datetime('now', '-4 hours'))
-        ''').fetchall()
-
-        for c in criticals:
-            msg = f"🚨 **CRITICAL FOD ALERT**\nTool: *{c['tool_name']}*\nUser: {c['user_name']}\nStatus: **> 8 Hours (Violation)**"
-            send_telegram_message(SUPERVISOR_CHAT_ID, msg)
-            
-            conn.execute("UPDATE transactions SET last_alert_sent = datetime('now') WHERE id = ?", (c['tx_id'],))
-            conn.commit()
-            print(f"Sent critical alert for {c['tool_name']}")
-
-    except Exception as e:
-        print(f"Telegram Loop Error: {e}")
-    finally:
-        conn.close()
+# --- FEATURE 3A: FOD Checkout Notifications ---
+# Timing lives in deadline_scheduler.py (7h warning, 8h critical, re-alert every 4h).
+# Everything that falls due in one timer cycle goes out as one digest per chat.
+TELEGRAM_MAX_CHARS = 4096
+
+def _chunk_message(header, lines, limit=TELEGRAM_MAX_CHARS):
+    """Header + bullet lines packed into as few messages as fit Telegram's size limit."""
+    messages, current = [], header
+    for line in lines:
+        if current != header and len(current) + 1 + len(line) > limit:
+            messages.append(current)
+            current = f"{header} _(cont.)_"
+        current += "\n" + line
+    messages.append(current)
+    return messages
+
+def build_fod_digests(warnings, criticals):
+    """{chat_id: [message, ...]}.
+
+    warnings:  [(contact_id, user_name, tool_name)] -> one message per holder
+    criticals: [(tool_name, user_name)]             -> one message for the supervisor
+    A single item keeps the original one-tool wording.
+    """
+    held = {}
+    for contact_id, user_name, tool_name in warnings:
+        held.setdefault(contact_id, (user_name, []))[1].append(tool_name)
+
+    digests = {}
+    for contact_id, (user_name, tools) in held.items():
+        if len(tools) == 1:
+            digests[contact_id] = [f"⚠️ **7-Hour Warning**\nHi {user_name}, you have held the *{tools[0]}* for over 7 hours.\nPlease return it soon to avoid a Critical FOD Violation."]
+        else:
+            header = f"⚠️ **7-Hour Warning**\nHi {user_name}, you have held these {len(tools)} tools for over 7 hours.\nPlease return them soon to avoid a Critical FOD Violation.\n"
+            digests[contact_id] = _chunk_message(header, [f"• *{tool}*" for tool in sorted(tools)])
+
+    if len(criticals) == 1:
+        tool_name, user_name = criticals[0]
+        messages = [f"🚨 **CRITICAL FOD ALERT**\nTool: *{tool_name}*\nUser: {user_name}\nStatus: **> 8 Hours (Violation)**"]
+    elif criticals:
+        header = f"🚨 **CRITICAL FOD ALERT**\n{len(criticals)} tools out for **> 8 Hours (Violation)**\n"
+        messages = _chunk_message(header, [f"• *{tool_name}* — {user_name}"
+                                           for tool_name, user_name in sorted(criticals, key=lambda c: (c[1] or '', c[0]))])
+    else:
+        messages = []
+    if messages:
+        digests.setdefault(SUPERVISOR_CHAT_ID, []).extend(messages)
+    return digests
+
+def send_fod_digest(warnings, criticals):
+    """Sends the digests; returns how many Telegram messages that took."""
+    sent = 0
+    for chat_id, messages in build_fod_digests(warnings, criticals).items():
+        for msg in messages:
+            send_telegram_message(chat_id, msg)
+            sent += 1
+    return sent
 
 # --- FEATURE 3B: /mytools Logic ---
 def handle_my_tools(chat_id):
@@ -155,6 +166,7 @@ def handle_report(chat_id, tool_id, issue):
             INSERT INTO issue_reports (id, tool_id, reporter_id, defect_type, description, status) 
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (report_id, tool_id, user['id'], 'Remote Report', issue, 'New'))
+        feature_store.record_failure(conn, tool_id)
 
         # 4. LOG AUDIT
         details = json.dumps({"reported_by": user['name'], "issue": issue, "source": "TELEGRAM"})
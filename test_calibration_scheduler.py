@@ -0,0 +1,44 @@
+# test_calibration_scheduler.py
+# Run: python -m pytest test_calibration_scheduler.py
+import sqlite3
+from datetime import date
+
+import feature_store
+from calibration_scheduler import build_schedule
+
+FRIDAY = '2026-10-16'
+SATURDAY = '2026-10-17'
+MONDAY = '2026-10-19'
+
+def make_db(tools):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE tools (id TEXT PRIMARY KEY, model TEXT, status TEXT, calibration_due TEXT)')
+    feature_store.ensure_schema(conn)
+    conn.executemany('INSERT INTO tools VALUES (?, ?, ?, ?)', tools)
+    return conn
+
+def lab_day(value):
+    return date.fromisoformat(value).weekday() < 5
+
+def test_window_without_lab_day_books_next_lab_day_late():
+    # Checked out on Friday (not bookable before Saturday) and due Saturday: no lab day fits
+    conn = make_db([('TW-001', 'M-TW-DIG', 'In Use', '2027-01-01')])
+    result = build_schedule(conn, [{'tool_id': 'TW-001', 'new_date': SATURDAY}], today=FRIDAY)
+    booking = result['schedule'][0]
+    assert booking['scheduled_date'] == MONDAY
+    assert booking['late'] and booking['overbooked']
+    assert result['late'] == 1
+
+def test_available_tool_keeps_latest_lab_day_before_deadline():
+    conn = make_db([('DR-001', 'M-DRILL', 'Available', '2027-01-01')])
+    result = build_schedule(conn, [{'tool_id': 'DR-001', 'new_date': SATURDAY}], today=FRIDAY)
+    assert result['schedule'][0]['scheduled_date'] == FRIDAY
+    assert result['late'] == 0
+
+def test_overflow_and_overdue_never_land_on_closed_days():
+    tools = [(f"T-{i:03d}", 'M-DRILL', 'In Use' if i % 2 else 'Available', '2027-01-01') for i in range(40)]
+    conn = make_db(tools)
+    recs = [{'tool_id': t[0], 'new_date': SATURDAY if i % 3 else '2026-10-01'} for i, t in enumerate(tools)]
+    result = build_schedule(conn, recs, capacity=2, today=FRIDAY)
+    assert all(lab_day(s['scheduled_date']) for s in result['schedule'])
+    assert all(lab_day(day) for day in result['daily_load'])
@@ -0,0 +1,273 @@
+# training_store.py
+# Typed, columnar copy of the calibration training data that the trainer can memory-map.
+#
+# Layout (TRAINING_STORE_DIR):
+#   meta.json      row count, dtype + categories per column, source CSV hash, data hash
+#   <column>.bin   raw little-endian values, one file per column (categoricals as uint8 codes)
+#
+# meta.json is rewritten last (atomically), so it is the commit point: bytes past
+# rows * itemsize in a .bin file belong to an interrupted append and are ignored/truncated.
+#
+# Usage:
+#   python training_store.py convert [--csv historical_training_data.csv]
+#   python training_store.py append outcomes.csv
+#   python training_store.py info
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+
+TRAINING_STORE_DIR = 'training_store'
+CSV_CHUNK_ROWS = 100_000
+UNKNOWN_CATEGORY = 'Unknown'
+
+# Column -> storage dtype. Sized to the generator's ranges with headroom for real data.
+# Floats are float32: sklearn's trees cast X to float32 anyway, so nothing is lost for training.
+COLUMN_DTYPES = {
+    'Tool_Type': 'category',
+    'Brand': 'category',
+    'Tool_Age_Days': '<i2',
+    'Days_Since_Last_Cal': '<i2',
+    'Total_Checkouts': '<i4',
+    'Total_Usage_Hours': '<f4',
+    'Avg_Duration_Hours': '<f4',
+    'Unique_Users': '<i4',
+    'Past_Failures': '<i2',
+    'Env_Stress_Index': '<f4',
+    'Criticality_Score': '<i1',
+    'Maintenance_Cost': '<f4',
+    'Label_Recommended_Days_Until_Cal': '<i2',
+}
+CATEGORY_CODE_DTYPE = '<u1'
+
+_lock = threading.Lock()
+_hash_cache = {}  # path -> ((mtime_ns, size), sha256)
+
+def hash_file(path):
+    """SHA-256 of a file. Re-hashed only when mtime/size change."""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _hash_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    _hash_cache[path] = (stamp, digest.hexdigest())
+    return digest.hexdigest()
+
+def _storage_dtype(column):
+    dtype = COLUMN_DTYPES[column]
+    return np.dtype(CATEGORY_CODE_DTYPE if dtype == 'category' else dtype)
+
+def _column_path(store_dir, column):
+    return os.path.join(store_dir, f"{column}.bin")
+
+# ==========================================
+#               METADATA
+# ==========================================
+
+def _empty_meta(source_hash=None):
+    return {
+        'format': 1,
+        'rows': 0,
+        'source_rows': 0,       # rows that came from the CSV; the rest were appended
+        'source_hash': source_hash,
+        'data_hash': source_hash,
+        'columns': {col: {'dtype': _storage_dtype(col).str,
+                          **({'categories': []} if COLUMN_DTYPES[col] == 'category' else {})}
+                    for col in COLUMN_DTYPES},
+    }
+
+def load_meta(store_dir=TRAINING_STORE_DIR):
+    path = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _write_meta(store_dir, meta):
+    path = os.path.join(store_dir, 'meta.json')
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+# ==========================================
+#               WRITE PATH
+# ==========================================
+
+def _encode(frame, meta):
+    """DataFrame -> {column: contiguous array in storage dtype}. Missing columns get 0 / 'Unknown'."""
+    n = len(frame)
+    encoded = {}
+    for col, dtype in COLUMN_DTYPES.items():
+        target = _storage_dtype(col)
+        if dtype == 'category':
+            categories = meta['columns'][col]['categories']
+            values = frame[col].astype(str) if col in frame else pd.Series([UNKNOWN_CATEGORY] * n)
+            for value in pd.unique(values):
+                if value not in categories:
+                    categories.append(value)
+            if len(categories) > np.iinfo(target).max + 1:
+                raise ValueError(f"Too many categories in {col} for {target}")
+            lookup = {name: code for code, name in enumerate(categories)}
+            encoded[col] = values.map(lookup).to_numpy(dtype=target)
+            continue
+
+        values = frame[col].to_numpy() if col in frame else np.zeros(n)
+        if target.kind == 'i':
+            values = np.round(values)
+            info = np.iinfo(target)
+            if n and (values.min() < info.min or values.max() > info.max):
+                raise ValueError(f"{col} out of range for {target}: [{values.min()}, {values.max()}]")
+        encoded[col] = np.ascontiguousarray(values, dtype=target)
+    return encoded
+
+def _append_encoded(store_dir, meta, encoded, chain=True):
+    """Appends encoded columns to the .bin files, then commits the new meta."""
+    rows = meta['rows']
+    digest = hashlib.sha256()
+    for col in COLUMN_DTYPES:
+        path = _column_path(store_dir, col)
+        with open(path, 'ab') as f:
+            f.truncate(rows * _storage_dtype(col).itemsize)  # drop any torn tail
+            data = encoded[col].tobytes()
+            f.write(data)
+            digest.update(data)
+    n = len(next(iter(encoded.values())))
+    meta['rows'] = rows + n
+    if chain:
+        meta['data_hash'] = hashlib.sha256(f"{meta['data_hash']}:{digest.hexdigest()}".encode()).hexdigest()
+    _write_meta(store_dir, meta)
+    return n
+
+def _create_store(store_dir, source_hash=None):
+    os.makedirs(store_dir, exist_ok=True)
+    for col in COLUMN_DTYPES:
+        open(_column_path(store_dir, col), 'wb').close()
+    meta = _empty_meta(source_hash)
+    _write_meta(store_dir, meta)
+    return meta
+
+def convert_csv(csv_path, store_dir=TRAINING_STORE_DIR):
+    """Rebuilds the store from the CSV (chunked), keeping rows appended since the last conversion."""
+    with _lock:
+        source_hash = hash_file(csv_path)
+        tmp_dir = f"{store_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        meta = _create_store(tmp_dir, source_hash)
+
+        for chunk in pd.read_csv(csv_path, chunksize=CSV_CHUNK_ROWS):
+            _append_encoded(tmp_dir, meta, _encode(chunk, meta), chain=False)
+        meta['source_rows'] = meta['rows']
+        _write_meta(tmp_dir, meta)
+
+        # Real outcomes recorded through append_rows() survive a regenerated CSV
+        old_meta = load_meta(store_dir)
+        if old_meta and old_meta['rows'] > old_meta['source_rows']:
+            tail = read_frame(store_dir=store_dir, start=old_meta['source_rows'])
+            for start in range(0, len(tail), CSV_CHUNK_ROWS):
+                _append_encoded(tmp_dir, meta, _encode(tail.iloc[start:start + CSV_CHUNK_ROWS], meta))
+
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(tmp_dir, store_dir)
+        return meta
+
+def sync_from_csv(csv_path, store_dir=TRAINING_STORE_DIR):
+    """Returns the store's meta, (re)converting first if the CSV is newer than the store."""
+    meta = load_meta(store_dir)
+    if os.path.exists(csv_path) and (meta is None or meta['source_hash'] != hash_file(csv_path)):
+        print(f"🗜️ Converting {csv_path} to columnar store '{store_dir}'...")
+        meta = convert_csv(csv_path, store_dir)
+        print(f"✅ Training store ready: {meta['rows']} rows.")
+    return meta
+
+def append_rows(rows, store_dir=TRAINING_STORE_DIR):
+    """Appends labelled rows (DataFrame or list of dicts) and returns the new data hash.
+
+    Columns not given (e.g. Brand for real outcomes) are stored as 0 / 'Unknown'.
+    """
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    if frame.empty:
+        return None
+    with _lock:
+        meta = load_meta(store_dir) or _create_store(store_dir)
+        _append_encoded(store_dir, meta, _encode(frame, meta))
+        return meta['data_hash']
+
+# ==========================================
+#               READ PATH
+# ==========================================
+
+def load_columns(columns, store_dir=TRAINING_STORE_DIR, meta=None):
+    """Memory-maps the requested columns (read-only). No parsing, nothing copied until touched."""
+    meta = meta or load_meta(store_dir)
+    if meta is None:
+        return None
+    arrays = {}
+    for col in columns:
+        dtype = np.dtype(meta['columns'][col]['dtype'])
+        if meta['rows'] == 0:
+            arrays[col] = np.empty(0, dtype=dtype)
+        else:
+            arrays[col] = np.memmap(_column_path(store_dir, col), dtype=dtype, mode='r', shape=(meta['rows'],))
+    return arrays
+
+def load_training_arrays(features, label, store_dir=TRAINING_STORE_DIR, start=0):
+    """(X float32 in `features` order, y float64, meta) straight from the column files.
+    start skips the first rows without reading them (incremental training)."""
+    meta = load_meta(store_dir)
+    if meta is None or meta['rows'] <= start:
+        return None, None, meta
+    arrays = load_columns(list(features) + [label], store_dir, meta)
+    X = np.empty((meta['rows'] - start, len(features)), dtype=np.float32)
+    for i, col in enumerate(features):
+        X[:, i] = arrays[col][start:]
+    y = np.asarray(arrays[label][start:], dtype=np.float64)
+    return X, y, meta
+
+def read_frame(columns=None, store_dir=TRAINING_STORE_DIR, start=0):
+    """Decoded DataFrame view of the store (categoricals back to strings). For tools and exports."""
+    meta = load_meta(store_dir)
+    columns = list(columns or COLUMN_DTYPES)
+    arrays = load_columns(columns, store_dir, meta)
+    data = {}
+    for col in columns:
+        values = np.array(arrays[col][start:])
+        categories = meta['columns'][col].get('categories')
+        data[col] = np.array(categories, dtype=object)[values] if categories is not None else values
+    return pd.DataFrame(data, columns=columns)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the columnar calibration training store.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    convert = sub.add_parser('convert', help="(Re)build the store from the CSV")
+    convert.add_argument('--csv', default='historical_training_data.csv')
+    append = sub.add_parser('append', help="Append labelled rows from a CSV of outcomes")
+    append.add_argument('csv')
+    sub.add_parser('info', help="Show row count, dtypes and on-disk size")
+    parser.add_argument('--store', default=TRAINING_STORE_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        meta = convert_csv(args.csv, args.store)
+        print(f"✅ Converted {meta['rows']} rows into '{args.store}'.")
+    elif args.command == 'append':
+        before = (load_meta(args.store) or {'rows': 0})['rows']
+        append_rows(pd.read_csv(args.csv), args.store)
+        print(f"✅ Appended {load_meta(args.store)['rows'] - before} rows.")
+    else:
+        meta = load_meta(args.store)
+        if meta is None:
+            raise SystemExit(f"❌ No training store at '{args.store}'. Run 'python training_store.py convert'.")
+        size = sum(os.path.getsize(_column_path(args.store, col)) for col in COLUMN_DTYPES)
+        print(f"📊 {meta['rows']} rows ({meta['source_rows']} from CSV), {size / 1e6:.1f} MB on disk")
+        for col, spec in meta['columns'].items():
+            extra = f"  {spec['categories']}" if 'categories' in spec else ''
+            print(f"   {col:<34} {spec['dtype']}{extra}")
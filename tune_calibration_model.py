@@ -0,0 +1,175 @@
+# tune_calibration_model.py
+# Hyperparameter search for the calibration forest.
+# Every config gets K-fold cross-validated R²/MAE, plus the size and per-1k-tool predict
+# latency of a forest fitted on all rows. Cross-validation runs in parallel (one process
+# per core, each fitting single-threaded) and reads the memory-mapped training store, so
+# workers start without re-parsing anything. The full-data forests are then fitted and
+# timed here one config at a time, built exactly as serving builds them (n_jobs=-1), so
+# the latency that picks the config is the one the forecast sees.
+#
+# The Pareto front over (MAE, latency, size) is printed; the pick is the fastest front
+# config within --mae-tolerance days of the best MAE. It is written to
+# calibration_params.json, which the model registry picks up (and retrains) on next use.
+#
+# Usage: python tune_calibration_model.py [--folds 5] [--workers N] [--quick] [--dry-run]
+import argparse
+import itertools
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score, mean_absolute_error
+from sklearn.model_selection import KFold
+
+import predictive_calibration
+import training_store
+
+SEARCH_SPACE = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [None, 12, 20],
+    'max_features': [1.0, 0.5, 'sqrt'],
+    'min_samples_leaf': [1, 5, 20],
+}
+QUICK_SPACE = {
+    'n_estimators': [25, 100],
+    'max_depth': [None, 12],
+    'max_features': [1.0, 'sqrt'],
+    'min_samples_leaf': [1, 5],
+}
+LATENCY_ROWS = 1000
+
+_X = _y = None  # per-worker training arrays (memory-mapped store)
+
+def _init_worker(store_dir):
+    global _X, _y
+    _X, _y, _ = training_store.load_training_arrays(predictive_calibration.MODEL_FEATURES,
+                                                    predictive_calibration.LABEL_COLUMN, store_dir)
+
+def evaluate_config(config, folds, seed=42):
+    """Cross-validates one config. Runs inside a worker."""
+    params = dict(config, random_state=seed)
+    maes, r2s = [], []
+    for train_idx, test_idx in KFold(n_splits=folds, shuffle=True, random_state=seed).split(_X):
+        model = RandomForestRegressor(**params).fit(_X[train_idx], _y[train_idx])
+        y_pred = model.predict(_X[test_idx])
+        maes.append(mean_absolute_error(_y[test_idx], y_pred))
+        r2s.append(r2_score(_y[test_idx], y_pred))
+
+    return {
+        'params': params,
+        'r2': float(np.mean(r2s)),
+        'r2_std': float(np.std(r2s)),
+        'mae_days': float(np.mean(maes)),
+        'mae_std': float(np.std(maes)),
+    }
+
+def measure_serving(result):
+    """Fits the config on all rows with the serving forest (n_jobs=-1) and adds its fit
+    time, size and predict latency. Runs in this process, one config at a time."""
+    start = time.perf_counter()
+    model = predictive_calibration._new_forest(result['params']).fit(_X, _y)
+    fit_s = time.perf_counter() - start
+
+    batch = _X[:LATENCY_ROWS]
+    latencies = []
+    for _ in range(3):
+        start = time.perf_counter()
+        model.predict(batch)
+        latencies.append(time.perf_counter() - start)
+
+    result.update(fit_s=fit_s,
+                  size_mb=len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6,
+                  latency_ms_per_1k=min(latencies) * 1000 * LATENCY_ROWS / len(batch))
+    return result
+
+def pareto_front(results):
+    """Configs not dominated on (MAE, latency, size): nothing else is at least as good on all three and better on one."""
+    keys = ('mae_days', 'latency_ms_per_1k', 'size_mb')
+    front = []
+    for r in results:
+        dominated = any(all(o[k] <= r[k] for k in keys) and any(o[k] < r[k] for k in keys)
+                        for o in results if o is not r)
+        if not dominated:
+            front.append(r)
+    return front
+
+def pick_config(front, mae_tolerance):
+    best_mae = min(r['mae_days'] for r in front)
+    acceptable = [r for r in front if r['mae_days'] <= best_mae + mae_tolerance]
+    return min(acceptable, key=lambda r: (r['latency_ms_per_1k'], r['size_mb']))
+
+def save_params(choice, folds, rows, path=predictive_calibration.MODEL_PARAMS_PATH):
+    payload = {
+        'params': choice['params'],
+        'cv': {k: round(choice[k], 4) for k in ('r2', 'mae_days', 'latency_ms_per_1k', 'size_mb')} | {'folds': folds, 'rows': rows},
+        'tuned_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def _describe(params):
+    return (f"trees={params['n_estimators']:<3} depth={str(params['max_depth']):<4} "
+            f"feat={str(params['max_features']):<4} leaf={params['min_samples_leaf']:<2}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the calibration forest (accuracy vs latency vs size).")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--quick', action='store_true', help="Small 16-config grid")
+    parser.add_argument('--mae-tolerance', type=float, default=0.25,
+                        help="Days of MAE we'll give up for a faster/smaller model")
+    parser.add_argument('--dry-run', action='store_true', help="Report only, don't write the params file")
+    args = parser.parse_args()
+
+    # Make sure the columnar store reflects the current CSV before workers map it
+    meta = training_store.sync_from_csv(predictive_calibration.TRAINING_DATA_PATH)
+    if meta is None or meta['rows'] == 0:
+        print("❌ No training data. Run 'generate_training_data.py' first.")
+        return
+
+    space = QUICK_SPACE if args.quick else SEARCH_SPACE
+    configs = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    print(f"🔬 Evaluating {len(configs)} configs x {args.folds} folds on {meta['rows']} rows "
+          f"with {args.workers} workers...")
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(training_store.TRAINING_STORE_DIR,)) as pool:
+        futures = [pool.submit(evaluate_config, config, args.folds) for config in configs]
+        for i, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            print(f"   ... {i}/{len(configs)} cross-validated", end='\r')
+    _init_worker(training_store.TRAINING_STORE_DIR)
+    for i, result in enumerate(results, 1):
+        measure_serving(result)
+        print(f"   ... {i}/{len(configs)} timed as served (n_jobs=-1)", end='\r')
+    print(f"⏱️ Search took {time.perf_counter() - start:.1f}s" + " " * 20)
+
+    front = pareto_front(results)
+    choice = pick_config(front, args.mae_tolerance)
+    current = predictive_calibration.get_model_params()
+
+    print(f"\n   {'CONFIG':<42} | {'R²':>6} | {'MAE (days)':>11} | {'ms / 1k':>8} | {'SIZE (MB)':>9} | {'FIT (s)':>7}")
+    print("-" * 100)
+    for r in sorted(results, key=lambda r: r['mae_days']):
+        mark = '→' if r is choice else ('*' if r in front else ' ')
+        print(f" {mark} {_describe(r['params']):<42} | {r['r2']:>6.3f} | {r['mae_days']:>6.2f} ±{r['mae_std']:<3.1f} | "
+              f"{r['latency_ms_per_1k']:>8.1f} | {r['size_mb']:>9.2f} | {r['fit_s']:>7.1f}")
+    print("\n   * Pareto front (MAE / latency / size)   → chosen")
+    print(f"   Current params: {current}")
+
+    if args.dry_run:
+        print("ℹ️ Dry run: params file not written.")
+        return
+    save_params(choice, args.folds, meta['rows'])
+    print(f"✅ Saved {choice['params']} to {predictive_calibration.MODEL_PARAMS_PATH}. "
+          f"The model registry will retrain with it on next use.")
+
+if __name__ == "__main__":
+    main()